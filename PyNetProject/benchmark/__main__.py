@@ -0,0 +1,79 @@
+# Benchmarks of the codecs and of the loopback Sender -> Receiver transport.
+#
+# Run from the PyNetProject directory:
+#   python -m benchmark --output results.json                  full run, payloads up to 256 MB
+#   python -m benchmark --quick --output results.json          payloads up to 1 MB, a few seconds
+#   python -m benchmark --quick --baseline baseline.json       compare, exit code 1 on regressions
+#   python -m benchmark --quick --save-baseline baseline.json  store the results as the new baseline
+#
+# Baselines are machine specific; keep one per machine where the numbers are compared. benchmark/baseline.json
+# is a --quick run on the reference machine (see its "environment"), taken when the suite was added.
+
+from benchmark import codec_bench, loopback_bench, results
+import argparse
+import sys
+
+QUICK_SIZES = (16, 1024, 64 * 1024, 1024 * 1024)
+QUICK_PAYLOAD_SIZES = (1024, 64 * 1024)
+QUICK_CONCURRENCY = (1, 4)
+QUICK_BYTES_PER_RUN = 8 * 1024 * 1024
+
+
+def _parse_arguments(argv):
+    parser = argparse.ArgumentParser(prog="python -m benchmark", description="PyNet benchmarks")
+    parser.add_argument("--quick", action="store_true", help="smaller payloads and fewer runs")
+    parser.add_argument("--suite", choices=("all", "codec", "loopback"), default="all")
+    parser.add_argument("--output", help="JSON file for the results")
+    parser.add_argument("--baseline", help="JSON results to compare with")
+    parser.add_argument("--save-baseline", help="JSON file to store the results as a baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed relative slowdown against the baseline, default 0.25")
+    parser.add_argument("--max-concurrency", type=int, default=None, help="maximal number of senders")
+    ret = parser.parse_args(argv)
+    return ret
+
+
+def main(argv=None) -> int:
+    args = _parse_arguments(argv)
+    log = lambda q: print(q, file=sys.stderr)
+
+    data = []
+    if args.suite in ("all", "codec"):
+        sizes = QUICK_SIZES if args.quick else codec_bench.SIZES
+        data.extend(codec_bench.run(sizes, min_time=0.05 if args.quick else 0.2, log=log))
+    if args.suite in ("all", "loopback"):
+        payload_sizes = QUICK_PAYLOAD_SIZES if args.quick else loopback_bench.PAYLOAD_SIZES
+        concurrency = QUICK_CONCURRENCY if args.quick else loopback_bench.CONCURRENCY
+        if args.max_concurrency is not None:
+            concurrency = tuple(q for q in concurrency if q <= args.max_concurrency) or (args.max_concurrency,)
+        bytes_per_run = QUICK_BYTES_PER_RUN if args.quick else loopback_bench.BYTES_PER_RUN
+        data.extend(loopback_bench.run(payload_sizes, concurrency, bytes_per_run, log=log))
+
+    current = results.create(data)
+    if args.output is not None:
+        results.save(current, args.output)
+    if args.save_baseline is not None:
+        results.save(current, args.save_baseline)
+
+    if args.baseline is None:
+        for row in data:
+            print(f"{row['name']:48s} {row['seconds'] * 1e6:14.1f} us {row.get('mb_per_s') or 0:12.1f} MB/s"
+                  + (f" p50 {row['p50_ms']:.3f} ms p99 {row['p99_ms']:.3f} ms" if "p50_ms" in row else ""))
+        return 0
+
+    baseline = results.load(args.baseline)
+    mismatch = results.get_environment_mismatch(current, baseline)
+    if mismatch is not None:
+        print("Warning: " + mismatch, file=sys.stderr)
+    rows = results.compare(current, baseline, args.tolerance)
+    print(results.format_comparison(rows))
+    regressions = results.find_regressions(rows)
+    if len(regressions) > 0:
+        print(f"{len(regressions)} regression(s) above {args.tolerance * 100:.0f} %:")
+        print(results.format_comparison(regressions))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+from lib.pynet.delta import ArrayDelta, ArrayKeyframe
+from lib.pynet.encoding import Compression, PyNetEncoderManager
+from lib.pynet.shared_memory import SharedMemoryPayload, SharedMemorySegments
+from lib.pynet.streaming import FilePayload, LazyPayload
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+import statistics
+import tempfile
+import time
+
+# payload sizes in bytes, from a few bytes up to hundreds of MB
+SIZES = (16, 1024, 64 * 1024, 1024 * 1024, 16 * 1024 * 1024, 256 * 1024 * 1024)
+# Python lists and per-element legacy codecs get too slow and memory hungry above this
+LIST_SIZE_LIMIT = 16 * 1024 * 1024
+
+
+def _scalar(value) -> Callable[[int], any]:
+    return lambda size: value
+
+
+def _random(seed: int = 42) -> np.random.Generator:
+    return np.random.default_rng(seed)
+
+
+def _file_payload(size: int) -> FilePayload:
+    # an anonymous temporary file, removed when the payload is released
+    file = tempfile.TemporaryFile()
+    file.write(_random().bytes(size))
+    file.flush()
+    ret = FilePayload(file)
+    return ret
+
+
+def _array_delta(size: int) -> ArrayDelta:
+    # every 64th block of 64 bytes changed
+    value = _random().random(size // 8)
+    block_count = -(-value.nbytes // 64)
+    ret = ArrayDelta.from_changed_blocks(value, np.arange(0, block_count, 64, dtype=np.int32), 64)
+    return ret
+
+
+# name -> (value factory for a payload size, whether the payload size is fixed, maximal size)
+CASES: Dict[str, Tuple[Callable[[int], any], bool, Optional[int]]] = {
+    "n": (_scalar(None), True, None),
+    "b": (_scalar(True), True, None),
+    "i": (_scalar(123456), True, None),
+    "d": (_scalar(3.14159), True, None),
+    "s": (lambda size: "x" * size, False, None),
+    "bytes": (lambda size: _random().bytes(size), False, None),
+    "d-list": (lambda size: _random().random(size // 8).tolist(), False, LIST_SIZE_LIMIT),
+    "i-list": (lambda size: _random().integers(-2 ** 31, 2 ** 31 - 1, size // 4).tolist(), False, LIST_SIZE_LIMIT),
+    "md": (lambda size: _random().random(size // 8).reshape(-1, 1), False, LIST_SIZE_LIMIT),
+    "mi": (lambda size: _random().integers(-1000, 1000, size // 4).reshape(-1, 1), False, LIST_SIZE_LIMIT),
+    "mmd": (lambda size: _random().random(size // 8).reshape(-1, 1, 1), False, LIST_SIZE_LIMIT),
+    "mmi": (lambda size: _random().integers(-1000, 1000, size // 4).reshape(-1, 1, 1), False, LIST_SIZE_LIMIT),
+    "nd-f8": (lambda size: _random().random(size // 8).reshape(-1, 8 if size >= 64 else 1), False, None),
+    "nd-f4": (lambda size: _random().random(size // 4, dtype=np.float32), False, None),
+    "nd-u1": (lambda size: _random().integers(0, 255, size, dtype=np.uint8), False, None),
+    # sent by socket.sendfile; without a socket, encoding reads the file
+    "fd": (_file_payload, False, None),
+    "dk": (lambda size: ArrayKeyframe(_random().random(size // 8)), False, None),
+    "dd": (_array_delta, False, None),
+}
+
+# compressible data, so the codec does actual work; (value factory, compression, maximal size)
+COMPRESSED_CASES: Dict[str, Tuple[Callable[[int], any], Compression, Optional[int]]] = {
+    "zz-nd-f8": (lambda size: np.arange(size // 8, dtype=np.float64) % 100, Compression(Compression.ZLIB, 0), None),
+    # lzma and bz2 compress at a few MB/s
+    "zx-nd-f8": (lambda size: np.arange(size // 8, dtype=np.float64) % 100, Compression(Compression.LZMA, 0),
+                 LIST_SIZE_LIMIT),
+    "zb-nd-f8": (lambda size: np.arange(size // 8, dtype=np.float64) % 100, Compression(Compression.BZ2, 0),
+                 LIST_SIZE_LIMIT),
+}
+
+# Fields in shared memory: encoding copies the value into a new segment and decoding maps it. A segment is
+# unlinked by its decoding, so every run gets its own one.
+SHARED_MEMORY_CASES: Dict[str, Callable[[int], any]] = {
+    "sm": lambda size: _random().random(size // 8),
+    "sb": lambda size: _random().bytes(size),
+}
+
+
+def _measure(action: Callable, min_time: float, max_repeats: int, setup: Optional[Callable[[], any]] = None,
+             cleanup: Optional[Callable[[any], None]] = None) -> float:
+    # median of repeated runs after one warm-up run, repeated for at least min_time seconds; if set, setup()
+    # gives the argument of the action and cleanup() gets its result, both outside of the measured time
+    def run_once() -> float:
+        argument = None if setup is None else setup()
+        start = time.perf_counter()
+        result = action() if setup is None else action(argument)
+        seconds = time.perf_counter() - start
+        if cleanup is not None:
+            cleanup(result)
+        return seconds
+
+    run_once()
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < max_repeats and (len(timings) < 3 or time.perf_counter() - started < min_time):
+        timings.append(run_once())
+    ret = statistics.median(timings)
+    return ret
+
+
+def _encode(value, compression: Optional[Compression]) -> Tuple[str, bytes]:
+    type_id, data = PyNetEncoderManager.encode(value, compression)
+    ret = (type_id, data.to_bytes() if isinstance(data, LazyPayload) else data)
+    return ret
+
+
+def _result_rows(name: str, type_id: str, size: Optional[int], encoded_bytes: int, encode_seconds: float,
+                 decode_seconds: float) -> List[Dict]:
+    payload_size = encoded_bytes if size is None else size
+    ret = []
+    for operation, seconds in (("encode", encode_seconds), ("decode", decode_seconds)):
+        ret.append({
+            "name": f"codec/{operation}/{name}" + ("" if size is None else f"/{size}"),
+            "type_id": type_id[:24],
+            "bytes": payload_size,
+            "encoded_bytes": encoded_bytes,
+            "seconds": seconds,
+            "mb_per_s": payload_size / seconds / 1e6 if seconds > 0 else None
+        })
+    return ret
+
+
+def _bench_value(name: str, value, size: Optional[int], compression: Optional[Compression], min_time: float,
+                 max_repeats: int) -> List[Dict]:
+    # results are named by the payload size, which stays the same when the encoding changes
+    type_id, data = _encode(value, compression)
+    data_bytes = memoryview(bytearray(data))
+    encode_seconds = _measure(lambda: _encode(value, compression), min_time, max_repeats)
+    decode_seconds = _measure(lambda: PyNetEncoderManager.decode(type_id, data_bytes), min_time, max_repeats)
+    ret = _result_rows(name, type_id, size, len(data_bytes), encode_seconds, decode_seconds)
+    return ret
+
+
+def _bench_shared_memory(name: str, value, size: int, min_time: float, max_repeats: int) -> List[Dict]:
+    def encode() -> Tuple[SharedMemoryPayload, Tuple[str, bytes]]:
+        payload = SharedMemoryPayload(value)
+        return payload, PyNetEncoderManager.encode(payload)
+
+    def decode_setup() -> Tuple[str, memoryview]:
+        _, (type_id, data) = encode()
+        return type_id, memoryview(bytearray(data))
+
+    _, (type_id, data) = encode()
+    PyNetEncoderManager.decode(type_id, memoryview(bytearray(data)))
+    encode_seconds = _measure(encode, min_time, max_repeats, cleanup=lambda q: q[0].unlink())
+    decode_seconds = _measure(lambda q: PyNetEncoderManager.decode(*q), min_time, max_repeats, setup=decode_setup)
+    ret = _result_rows(name, type_id, size, len(data), encode_seconds, decode_seconds)
+    return ret
+
+
+def run(sizes: Tuple[int, ...] = SIZES, min_time: float = 0.2, max_repeats: int = 1000,
+        log: Callable[[str], None] = print) -> List[Dict]:
+    ret = []
+    for name, (factory, is_fixed, max_size) in CASES.items():
+        case_sizes = sizes[:1] if is_fixed else [q for q in sizes if max_size is None or q <= max_size]
+        for size in case_sizes:
+            log(f"codec {name} {size}")
+            ret.extend(_bench_value(name, factory(size), None if is_fixed else size, None, min_time, max_repeats))
+    for name, (factory, compression, max_size) in COMPRESSED_CASES.items():
+        for size in [q for q in sizes if max_size is None or q <= max_size]:
+            log(f"codec {name} {size}")
+            ret.extend(_bench_value(name, factory(size), size, compression, min_time, max_repeats))
+    if SharedMemorySegments.is_supported():
+        for name, factory in SHARED_MEMORY_CASES.items():
+            for size in sizes:
+                log(f"codec {name} {size}")
+                ret.extend(_bench_shared_memory(name, factory(size), size, min_time, max_repeats))
+    return ret
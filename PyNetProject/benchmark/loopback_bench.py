@@ -0,0 +1,128 @@
+from lib.pynet.receiving import Receiver
+from lib.pynet.sending import Sender
+from typing import Callable, Dict, List, Tuple
+import numpy as np
+import socket
+import threading
+import time
+
+PAYLOAD_SIZES = (1024, 64 * 1024, 1024 * 1024)
+CONCURRENCY = (1, 2, 4, 8)
+# total bytes sent per run; the message count is derived from it and bounded below
+BYTES_PER_RUN = 64 * 1024 * 1024
+MIN_MESSAGES = 200
+MAX_MESSAGES = 20000
+# messages per sender in the latency phase
+LATENCY_MESSAGES = 200
+
+
+def _find_free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    ret = float(np.percentile(np.asarray(values), percent))
+    return ret
+
+
+def _run_once(payload_size: int, senders: int, messages: int, latency_messages: int) -> Dict:
+    # The throughput phase sends as fast as possible, so its latency would be mostly queueing; the latency
+    # phase then sends one message per sender at a time and waits until the handler sees it. The Receiver
+    # runs in the same process, so the send time carried by the messages uses the same clock.
+    port = _find_free_port()
+    lock = threading.Lock()
+    received = [0]
+    done = threading.Event()
+    total = senders * messages
+    latencies = []
+    delivered = [threading.Event() for _ in range(senders)]
+
+    def on_message(source, client_id, message):
+        if "t" in message:
+            latencies.append(time.perf_counter() - message["t"])
+            delivered[message["s"]].set()
+            return
+        with lock:
+            received[0] += 1
+            if received[0] == total:
+                done.set()
+
+    listening = threading.Event()
+    receiver = Receiver("127.0.0.1", port, keep_alive=True)
+    receiver.on_message_received.add_listener(on_message)
+    receiver.on_listening_started.add_listener(lambda source: listening.set())
+    receiver.start_async()
+    listening.wait(timeout=10)
+
+    payload = np.random.default_rng(42).integers(0, 255, payload_size, dtype=np.uint8)
+    errors = []
+
+    def send(index: int, barrier: threading.Barrier):
+        sender = Sender("127.0.0.1", port, keep_alive=True)
+        try:
+            for _ in range(messages):
+                sender.send_dict({"payload": payload})
+            barrier.wait()
+            for _ in range(latency_messages):
+                delivered[index].clear()
+                sender.send_dict({"s": index, "t": time.perf_counter(), "payload": payload})
+                if not delivered[index].wait(timeout=10):
+                    raise TimeoutError("Latency message not delivered.")
+        except Exception as e:
+            errors.append(e)
+            barrier.abort()
+        finally:
+            sender.close()
+
+    # the main thread joins the barrier when the throughput phase is fully received
+    barrier = threading.Barrier(senders + 1)
+    threads = [threading.Thread(target=send, args=(q, barrier)) for q in range(senders)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    deadline = started + 120
+    while not done.wait(timeout=0.05) and not errors and time.perf_counter() < deadline:
+        pass
+    completed = done.is_set()
+    elapsed = time.perf_counter() - started
+    try:
+        if completed:
+            barrier.wait(timeout=10)
+        else:
+            barrier.abort()
+    except threading.BrokenBarrierError:
+        pass
+    for thread in threads:
+        thread.join()
+    receiver.stop_async()
+
+    if errors:
+        raise errors[0]
+    if not completed:
+        raise TimeoutError(f"Only {received[0]} of {total} messages received.")
+
+    ret = {
+        "name": f"loopback/{payload_size}/x{senders}",
+        "bytes": payload_size,
+        "senders": senders,
+        "messages": total,
+        "seconds": elapsed,
+        "messages_per_s": total / elapsed,
+        "mb_per_s": total * payload_size / elapsed / 1e6,
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000
+    }
+    return ret
+
+
+def run(payload_sizes: Tuple[int, ...] = PAYLOAD_SIZES, concurrency: Tuple[int, ...] = CONCURRENCY,
+        bytes_per_run: int = BYTES_PER_RUN, log: Callable[[str], None] = print) -> List[Dict]:
+    ret = []
+    for payload_size in payload_sizes:
+        for senders in concurrency:
+            messages = min(MAX_MESSAGES, max(MIN_MESSAGES, bytes_per_run // payload_size)) // senders
+            log(f"loopback {payload_size} x{senders}")
+            ret.append(_run_once(payload_size, senders, max(1, messages), LATENCY_MESSAGES))
+    return ret
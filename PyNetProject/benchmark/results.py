@@ -0,0 +1,87 @@
+from typing import Dict, List, Optional
+import json
+import numpy as np
+import platform
+import sys
+
+# metrics compared against the baseline by suite (result name prefix) and whether a higher value is better
+COMPARED_METRICS = {
+    "codec": {"seconds": False},
+    "loopback": {"mb_per_s": True, "p50_ms": False, "p99_ms": False}
+}
+
+
+def create(results: List[Dict]) -> Dict:
+    ret = {
+        "environment": {
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "processor": platform.processor()
+        },
+        "results": results
+    }
+    return ret
+
+
+def save(data: Dict, path: str) -> None:
+    with open(path, "w") as file:
+        json.dump(data, file, indent=2)
+
+
+def load(path: str) -> Dict:
+    with open(path) as file:
+        ret = json.load(file)
+    return ret
+
+
+def compare(current: Dict, baseline: Dict, tolerance: float) -> List[Dict]:
+    # Returns a row for every metric present in both results; a row is a regression if the value
+    # is worse than the baseline by more than the tolerance (0.25 = 25 %).
+    baseline_by_name = {q["name"]: q for q in baseline["results"]}
+    ret = []
+    for result in current["results"]:
+        base = baseline_by_name.get(result["name"])
+        if base is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS[result["name"].split("/")[0]].items():
+            value = result.get(metric)
+            base_value = base.get(metric)
+            if value is None or not base_value:
+                continue
+            change = (value - base_value) / base_value
+            worse_by = -change if higher_is_better else change
+            ret.append({
+                "name": result["name"],
+                "metric": metric,
+                "baseline": base_value,
+                "current": value,
+                "change": change,
+                "is_regression": worse_by > tolerance
+            })
+    return ret
+
+
+def format_comparison(rows: List[Dict], only_regressions: bool = False) -> str:
+    lines = []
+    for row in rows:
+        if only_regressions and not row["is_regression"]:
+            continue
+        flag = "REGRESSION" if row["is_regression"] else ""
+        lines.append(f"{row['name']:48s} {row['metric']:9s} {row['baseline']:14.6g} {row['current']:14.6g} "
+                     f"{row['change'] * 100:+8.1f} % {flag}")
+    ret = "\n".join(lines)
+    return ret
+
+
+def find_regressions(rows: List[Dict]) -> List[Dict]:
+    ret = [q for q in rows if q["is_regression"]]
+    return ret
+
+
+def get_environment_mismatch(current: Dict, baseline: Dict) -> Optional[str]:
+    # numbers from a different machine or interpreter are not comparable
+    differing = [k for k, v in current["environment"].items() if baseline.get("environment", {}).get(k) != v]
+    ret = None if len(differing) == 0 else "Environment differs from the baseline in: " + ", ".join(differing)
+    return ret
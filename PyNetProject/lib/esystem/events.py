@@ -1,20 +1,36 @@
 import inspect
+import threading
+import time
 
 
 class Event(object):
+    # Listeners are validated against the signature when added, so invoke() only calls them. The handlers
+    # are kept in a tuple replaced on every change (copy-on-write): invoke() needs no copy and listeners
+    # added or removed during an invocation take effect from the next one. Changes are serialized by
+    # a lock, so concurrent ones are not lost.
 
     def __init__(self, **signature):
         self._signature = signature
         self._argnames = set(signature.keys())
-        self._handlers = []
+        self._handlers = ()
+        self._lock = threading.Lock()
+        self._error_handler = None
+        self._timing_hook = None
 
     def _kwargs_str(self):
         return ", ".join(k + "=" +
                          (v.__name__ if hasattr(v, "__name__") else v.name if hasattr(v, "name") else str(v))
                          for k, v in self._signature.items())
 
+    @property
+    def handlers(self) -> tuple:
+        return self._handlers
+
     def remove_listener(self, handler):
-        self._handlers.remove(handler)
+        with self._lock:
+            handlers = list(self._handlers)
+            handlers.remove(handler)
+            self._handlers = tuple(handlers)
         return self
 
     def add_listener(self, handler):
@@ -34,15 +50,59 @@ class Event(object):
         if not valid:
             raise ValueError("Listener must have these arguments: (%s)"
                              % self._kwargs_str())
-        self._handlers.append(handler)
+        with self._lock:
+            self._handlers = self._handlers + (handler,)
+        return self
+
+    def set_error_handler(self, error_handler):
+        # If set, an exception of a listener is passed to error_handler(handler, exception) instead of
+        # being raised, and the remaining listeners are still invoked. None restores raising.
+        self._error_handler = error_handler
+        return self
+
+    def set_timing_hook(self, timing_hook):
+        # If set, timing_hook(handler, seconds) is called after every listener call, also a failed one.
+        self._timing_hook = timing_hook
         return self
 
     def invoke(self, *args, **kwargs):
-        if args or set(kwargs.keys()) != self._argnames:
+        if args:
+            raise ValueError("This Event must be called with these " +
+                             "keyword arguments: (%s)" % self._kwargs_str())
+        if self._error_handler is None and self._timing_hook is None:
+            for handler in self._handlers:
+                handler(**kwargs)
+            return
+
+        for handler in self._handlers:
+            start = time.perf_counter()
+            try:
+                handler(**kwargs)
+            except Exception as e:
+                if self._error_handler is None:
+                    raise
+                self._error_handler(handler, e)
+            finally:
+                if self._timing_hook is not None:
+                    self._timing_hook(handler, time.perf_counter() - start)
+
+    async def invoke_async(self, *args, **kwargs):
+        if args:
             raise ValueError("This Event must be called with these " +
                              "keyword arguments: (%s)" % self._kwargs_str())
-        for handler in self._handlers[:]:
-            handler(**kwargs)
+        for handler in self._handlers:
+            start = time.perf_counter()
+            try:
+                ret = handler(**kwargs)
+                if inspect.isawaitable(ret):
+                    await ret
+            except Exception as e:
+                if self._error_handler is None:
+                    raise
+                self._error_handler(handler, e)
+            finally:
+                if self._timing_hook is not None:
+                    self._timing_hook(handler, time.perf_counter() - start)
 
     def __repr__(self):
         return "EventHook(%s)" % self._kwargs_str()
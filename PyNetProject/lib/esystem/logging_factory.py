@@ -7,24 +7,45 @@ import re
 
 
 class _Filter(logging.Filter):
+    # Records are matched by logger name only, so the level of the first matching rule is memoized
+    # per name; None means no rule matches and the logger is off.
+
     def __init__(self, log_rules: typing.List['_LogRule']):
         super().__init__()
         EAssert.Argument.is_not_none(log_rules)
         EAssert.Argument.is_true(len(log_rules) > 0, "There are no rules specified for the filter.")
         self.__rules = log_rules
+        self.__levels: typing.Dict[str, typing.Optional[int]] = {}
+
+    def get_level(self, name: str) -> typing.Optional[int]:
+        try:
+            return self.__levels[name]
+        except KeyError:
+            pass
+        rule = EList.of(self.__rules).first_or_none(lambda q: q.regex.search(name) is not None)
+        ret = None if rule is None else rule.level
+        self.__levels[name] = ret
+        return ret
 
     def filter(self, record: logging.LogRecord) -> bool:
-        rule = EList.of(self.__rules).first_or_none(lambda q: bool(re.search(q.pattern, record.name)))
-        if rule is None:
-            ret = False
-        else:
-            ret = rule.level <= record.levelno
+        level = self.get_level(record.name)
+        ret = level is not None and level <= record.levelno
+        return ret
+
+
+class _Logger(logging.Logger):
+    # Without the isEnabledFor() cache of logging.Logger, which setLevel() clears only for loggers registered
+    # in the logging manager. These loggers are not registered and init_by_config() changes their levels.
+
+    def isEnabledFor(self, level: int) -> bool:
+        ret = not self.disabled and level > self.manager.disable and level >= self.getEffectiveLevel()
         return ret
 
 
 class _LogRule:
     def __init__(self, pattern: str, level: typing.Union[int, str]):
         self.pattern = pattern
+        self.regex = re.compile(pattern)
         if isinstance(level, int):
             self.level = level
         else:
@@ -54,6 +75,10 @@ _LOG_RULE_LEVEL_KEY = "level"
 _formatter = logging.Formatter("%(message)s")
 _filter: '_Filter' = _Filter([_LogRule(".+", logging.INFO)])
 _handlers = []
+# loggers by name; create_logger returns the same instance for the same name
+_loggers: typing.Dict[str, logging.Logger] = {}
+# level of loggers without any matching rule, above all standard levels
+_LEVEL_OFF = logging.CRITICAL + 1
 
 
 def _convert_log_string_to_int(level) -> int:
@@ -94,15 +119,31 @@ def init_by_config(config: typing.Dict) -> None:
         global _handlers
         _handlers = handlers
 
+    # loggers created before are switched to the new configuration
+    EList.of(list(_loggers.values())).for_each(lambda q: _configure(q))
+
 
 def create_logger(name: str) -> logging.Logger:
     EAssert.is_not_none(name)
 
-    ret = logging.Logger(name)
+    ret = _loggers.get(name)
+    if ret is None:
+        ret = _Logger(name)
+        _configure(ret)
+        _loggers[name] = ret
+    return ret
+
+
+def _configure(logger: logging.Logger) -> None:
+    EList.of(list(logger.filters)).for_each(lambda q: logger.removeFilter(q))
+    EList.of(list(logger.handlers)).for_each(lambda q: logger.removeHandler(q))
+
     global _filter
-    ret.addFilter(_filter)
+    logger.addFilter(_filter)
+    # the level makes isEnabledFor() and the logging calls return early for disabled levels,
+    # before any record is created and filtered
+    level = _filter.get_level(logger.name)
+    logger.setLevel(_LEVEL_OFF if level is None else level)
 
     global _handlers
-    EList.of(_handlers).for_each(lambda q: ret.addHandler(q))
-
-    return ret
+    EList.of(_handlers).for_each(lambda q: logger.addHandler(q))
@@ -0,0 +1,154 @@
+from lib.esystem.easserting import EAssert
+from lib.esystem.logging_factory import create_logger
+from lib.esystem.events import Event
+from lib.pynet.delta import DeltaEncoding
+from lib.pynet.framing import MessageFraming
+from lib.pynet.exceptions import PyNetException
+from typing import Optional
+import asyncio
+import logging
+
+
+class AsyncReceiver:
+    # Handlers may be plain callables or coroutine functions; each connection is read until EOF,
+    # so both single-message and keep-alive senders are served.
+
+    def __init__(self, host: str, port: int, name: Optional[str] = None):
+        EAssert.Argument.is_nonempty_string(host)
+        EAssert.Argument.is_true(port > 0)
+
+        self.__str_name = name if name is not None else f"ARecv_{host}:{port}"
+        self.__host = host
+        self.__port = port
+        self.__server: Optional[asyncio.AbstractServer] = None
+        self.__next_client_id = 1
+
+        self.__on_listening_started = Event(source=AsyncReceiver)
+        self.__on_listening_stopped = Event(source=AsyncReceiver)
+        self.__on_client_connected = Event(source=AsyncReceiver, client_id=int)
+        self.__on_client_disconnected = Event(source=AsyncReceiver, client_id=int)
+        self.__on_message_received = Event(source=AsyncReceiver, client_id=int, message=dict)
+
+        self.__logger = create_logger(self.__str_name)
+
+    @property
+    def host(self) -> str:
+        return self.__host
+
+    @property
+    def port(self) -> int:
+        return self.__port
+
+    @property
+    def on_listening_started(self) -> Event:
+        return self.__on_listening_started
+
+    @property
+    def on_listening_stopped(self) -> Event:
+        return self.__on_listening_stopped
+
+    @property
+    def on_client_connected(self) -> Event:
+        return self.__on_client_connected
+
+    @property
+    def on_client_disconnected(self) -> Event:
+        return self.__on_client_disconnected
+
+    @property
+    def on_message_received(self) -> Event:
+        return self.__on_message_received
+
+    @property
+    def is_running(self) -> bool:
+        return self.__server is not None
+
+    async def start(self) -> None:
+        EAssert.Argument.is_false(self.is_running)
+        self.__logger.debug("Starting")
+        try:
+            self.__server = await asyncio.start_server(self.__handle_connection, self.__host, self.__port)
+        except Exception as ex:
+            raise PyNetException(f"Failed to open receiver at {self.__host}:{self.__port}.", ex)
+        await self.__on_listening_started.invoke_async(source=self)
+        self.__logger.info("Started")
+
+    async def serve_forever(self) -> None:
+        if not self.is_running:
+            await self.start()
+        await self.__server.serve_forever()
+
+    async def stop(self) -> None:
+        EAssert.Argument.is_true(self.is_running)
+        self.__logger.debug("Stopping")
+        self.__server.close()
+        await self.__server.wait_closed()
+        self.__server = None
+        await self.__on_listening_stopped.invoke_async(source=self)
+        self.__logger.info("Stopped")
+
+    async def __handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        client_id = self.__next_client_id
+        self.__next_client_id += 1
+        if self.__logger.isEnabledFor(logging.DEBUG):
+            self.__logger.debug(f"Got a client {client_id}")
+        await self.__on_client_connected.invoke_async(source=self, client_id=client_id)
+
+        # arrays last received by key, which deltas of a Sender with delta encoding apply to
+        delta_bases = {}
+        try:
+            while True:
+                message = await self.__read_message(reader)
+                if message is None:
+                    break
+                DeltaEncoding.resolve(delta_bases, message)
+                await self.__on_message_received.invoke_async(source=self, client_id=client_id, message=message)
+        finally:
+            writer.close()
+            if self.__logger.isEnabledFor(logging.DEBUG):
+                self.__logger.debug(f"Client {client_id} disconnected")
+            await self.__on_client_disconnected.invoke_async(source=self, client_id=client_id)
+
+    @staticmethod
+    async def __read_message(reader: asyncio.StreamReader) -> Optional[dict]:
+        try:
+            intro = await reader.readexactly(MessageFraming.INTRO_LENGTH)
+        except asyncio.IncompleteReadError as e:
+            if len(e.partial) == 0:
+                return None
+            raise PyNetException("Connection closed while reading message lengths.", e)
+
+        header_length, data_length = MessageFraming.decode_intro(intro)
+        if header_length == MessageFraming.CHUNKED_MARKER:
+            return await AsyncReceiver.__read_chunked_message(reader, data_length)
+
+        try:
+            message_bytes = memoryview(await reader.readexactly(header_length + data_length))
+        except asyncio.IncompleteReadError as e:
+            raise PyNetException("Connection contains no data. Mismatch?", e)
+
+        ret = MessageFraming.decode_message(message_bytes[:header_length], message_bytes[header_length:])
+        return ret
+
+    @staticmethod
+    async def __read_chunked_message(reader: asyncio.StreamReader, header_length: int) -> dict:
+        try:
+            data_length = MessageFraming.decode_chunked_intro_tail(
+                await reader.readexactly(MessageFraming.CHUNKED_INTRO_TAIL_LENGTH))
+            header_bytes = memoryview(await reader.readexactly(header_length))
+
+            data_bytes = memoryview(bytearray(data_length))
+            position = 0
+            while position < data_length:
+                chunk_length = MessageFraming.decode_chunk_intro(
+                    await reader.readexactly(MessageFraming.CHUNK_INTRO_LENGTH), data_length - position)
+                data_bytes[position:position + chunk_length] = await reader.readexactly(chunk_length)
+                position += chunk_length
+        except asyncio.IncompleteReadError as e:
+            raise PyNetException("Connection closed while reading a message chunk.", e)
+
+        ret = MessageFraming.decode_message(header_bytes, data_bytes)
+        return ret
+
+    def __str__(self):
+        return self.__str_name
@@ -0,0 +1,107 @@
+from lib.esystem.logging_factory import create_logger
+from lib.esystem.easserting import EAssert
+from lib.pynet.exceptions import PyNetException
+from lib.pynet.bitutilities import BitUtilities
+from lib.pynet.encoding import Compression
+from lib.pynet.framing import MessageFraming
+from typing import Dict, Optional, Tuple
+import asyncio
+import select
+import socket
+
+
+class AsyncSender:
+
+    def __init__(self, host: str, port: int, keep_alive: bool = False, compression: Optional[Compression] = None):
+        EAssert.Argument.is_nonempty_string(host)
+        EAssert.Argument.is_true(port > 0)
+
+        self.__host = host
+        self.__port = port
+        self.__keep_alive = keep_alive
+        self.__compression = compression
+        self.__reader: Optional[asyncio.StreamReader] = None
+        self.__writer: Optional[asyncio.StreamWriter] = None
+        self.__lock = asyncio.Lock()
+        self.__logger = create_logger(f"ASndr {host}:{port}")
+
+    @property
+    def keep_alive(self) -> bool:
+        return self.__keep_alive
+
+    @property
+    def compression(self) -> Optional[Compression]:
+        return self.__compression
+
+    async def send_object(self, obj: any) -> None:
+        EAssert.Argument.is_true(hasattr(obj, "__dict__"), "Object with __dict_ expected")
+        dictionary = vars(obj)
+        await self.send_dict(dictionary)
+
+    async def send_dict(self, dictionary: Dict) -> None:
+        EAssert.Argument.is_not_none(dictionary)
+        EAssert.Argument.is_false(MessageFraming.has_reserved_keys(dictionary), "dictionary")
+
+        try:
+            (header, data) = MessageFraming.encode_message(dictionary, self.__compression)
+        except Exception as e:
+            raise PyNetException("Failed to serialize message.", e)
+
+        header_bytes = BitUtilities.Str.value_to_bytes(header)
+        intro = MessageFraming.encode_intro(header_bytes, len(data))
+
+        if not self.__keep_alive:
+            _, writer = await self.__open()
+            try:
+                writer.writelines((intro, header_bytes, data))
+                await writer.drain()
+                writer.close()
+                await writer.wait_closed()
+            except Exception as e:
+                writer.close()
+                raise PyNetException(f"Failed to send message to {self.__host}:{self.__port}.", e)
+            return
+
+        async with self.__lock:
+            if self.__writer is not None and not self.__is_alive():
+                # closed by the receiver meanwhile, e.g. by its restart
+                self.__writer.close()
+                self.__writer = None
+            if self.__writer is None:
+                (self.__reader, self.__writer) = await self.__open()
+            try:
+                self.__writer.writelines((intro, header_bytes, data))
+                await self.__writer.drain()
+            except Exception as e:
+                self.__writer.close()
+                self.__writer = None
+                raise PyNetException(f"Failed to send message to {self.__host}:{self.__port}.", e)
+
+    async def close(self) -> None:
+        async with self.__lock:
+            if self.__writer is not None:
+                self.__writer.close()
+                await self.__writer.wait_closed()
+                self.__reader = None
+                self.__writer = None
+
+    def __is_alive(self) -> bool:
+        # as _ESocket.is_alive of Sender: the receiver never writes back, so readability means EOF or an error
+        if self.__writer.is_closing() or self.__reader.at_eof():
+            return False
+        transport_socket = self.__writer.get_extra_info("socket")
+        try:
+            readable, _, _ = select.select([transport_socket], [], [], 0)
+            if not readable:
+                return True
+            with socket.fromfd(transport_socket.fileno(), transport_socket.family, transport_socket.type) as peeked:
+                return len(peeked.recv(1, socket.MSG_PEEK)) > 0
+        except OSError:
+            return False
+
+    async def __open(self) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        try:
+            ret = await asyncio.open_connection(self.__host, self.__port)
+        except Exception as e:
+            raise PyNetException(f"Unable to open connection to {self.__host}:{self.__port}.", e)
+        return ret
@@ -1,71 +1,91 @@
 from lib.esystem.easserting import EAssert
 import numpy as np
 import struct
-from typing import List
+from typing import List, Tuple
 
 
 class BitUtilities:
-    class Int3D:
+    class NDArray:
+        # wire layout: 4-byte little-endian dimensions, then row-major data in the given dtype
+
         @staticmethod
-        def bytes_to_value(value: bytes) -> np.ndarray:
-            INT_LEN = BitUtilities.Int.length()
-
-            tmp = value[0:INT_LEN]  # TODO extract to separate function (repeated below)
-            dim_a = BitUtilities.Int.bytes_to_value(tmp)
-            tmp = value[INT_LEN: INT_LEN * 2]
-            dim_b = BitUtilities.Int.bytes_to_value(tmp)
-            tmp = value[INT_LEN * 2: INT_LEN * 3]
-            dim_c = BitUtilities.Int.bytes_to_value(tmp)
-
-            ret = np.zeros((dim_a, dim_b, dim_c), dtype=int)
-            for i in range(dim_a):
-                for j in range(dim_b):
-                    si = INT_LEN * 3 + ((i * dim_b) + j) * dim_c * INT_LEN
-                    tmp = value[si: si + dim_c * INT_LEN]
-                    vals = BitUtilities.Int1D.bytes_to_value(tmp)
-                    ret[i, j, :] = vals
+        def byte_length(shape, dtype: str) -> int:
+            ret = len(shape) * BitUtilities.Int.length() + int(np.prod(shape)) * np.dtype(dtype).itemsize
+            return ret
 
+        @staticmethod
+        def fits(value: np.ndarray, dtype: str) -> bool:
+            # whether the integer values are representable in the integer dtype
+            if value.size == 0:
+                return True
+            info = np.iinfo(dtype)
+            ret = bool(info.min <= value.min() and value.max() <= info.max)
             return ret
 
         @staticmethod
-        def value_to_bytes(value: np.ndarray) -> bytes:
+        def value_to_bytes(value: np.ndarray, dtype: str) -> bytes:
             EAssert.Argument.is_not_none(value)
-            EAssert.Argument.is_true(len(value.shape) == 3)
-            EAssert.Argument.is_true(value.dtype == int)
+            if np.dtype(dtype).kind == 'i':
+                EAssert.is_true(BitUtilities.NDArray.fits(value, dtype), f"Array values do not fit into '{dtype}'.")
 
-            dim_a_bytes: bytes = BitUtilities.Int.value_to_bytes(value.shape[0])
-            dim_b_bytes: bytes = BitUtilities.Int.value_to_bytes(value.shape[1])
-            dim_c_bytes: bytes = BitUtilities.Int.value_to_bytes(value.shape[2])
+            ndim = len(value.shape)
+            dims_len = ndim * BitUtilities.Int.length()
+            ret = bytearray(BitUtilities.NDArray.byte_length(value.shape, dtype))
+            np.frombuffer(ret, dtype='<i4', count=ndim)[:] = value.shape
+            np.frombuffer(ret, dtype=dtype, offset=dims_len).reshape(value.shape)[...] = value
+            return ret
 
-            pts = []
-            for i in range(value.shape[0]):
-                for j in range(value.shape[1]):
-                    tmp = list(value[i, j, :])
-                    pts.append(BitUtilities.Int1D.value_to_bytes(tmp))
+        @staticmethod
+        def bytes_to_value(value: bytes, ndim: int, dtype: str, result_dtype) -> np.ndarray:
+            dims_len = ndim * BitUtilities.Int.length()
+            shape = tuple(int(q) for q in np.frombuffer(value, dtype='<i4', count=ndim))
+            count = int(np.prod(shape))
+            ret = np.frombuffer(value, dtype=dtype, count=count, offset=dims_len).reshape(shape)
+            if ret.dtype != np.dtype(result_dtype):
+                ret = ret.astype(result_dtype)
+            elif not ret.flags.writeable:
+                ret = ret.copy()
+            return ret
 
-            ret: bytearray = bytearray(dim_a_bytes) + bytearray(dim_b_bytes) + bytearray(dim_c_bytes)
-            for it in pts:
-                ret += it
+    class RawArray:
+        # data of any contiguous array in its own memory layout; dtype and shape travel separately
+        KINDS = "biufc"
 
+        @staticmethod
+        def value_to_bytes(value: np.ndarray) -> memoryview:
+            EAssert.Argument.is_not_none(value)
+            EAssert.Argument.is_true(value.dtype.kind in BitUtilities.RawArray.KINDS)
+            ret = memoryview(np.ascontiguousarray(value).reshape(-1)).cast('B')
             return ret
 
-    class Int2D:
+        @staticmethod
+        def bytes_to_value(value: bytes, dtype: str, shape: Tuple[int, ...]) -> np.ndarray:
+            np_dtype = np.dtype(dtype)
+            EAssert.is_true(np_dtype.kind in BitUtilities.RawArray.KINDS, f"Unsupported array dtype '{dtype}'.")
+            ret = np.frombuffer(value, dtype=np_dtype, count=int(np.prod(shape))).reshape(shape)
+            if not ret.flags.writeable:
+                ret = ret.copy()
+            return ret
+
+    class Int3D:
         @staticmethod
         def bytes_to_value(value: bytes) -> np.ndarray:
-            INT_LEN = BitUtilities.Int.length()
+            ret = BitUtilities.NDArray.bytes_to_value(value, 3, '<i4', int)
+            return ret
 
-            tmp = value[0:INT_LEN]
-            dim_a = BitUtilities.Int.bytes_to_value(tmp)
-            tmp = value[INT_LEN: INT_LEN * 2]
-            dim_b = BitUtilities.Int.bytes_to_value(tmp)
+        @staticmethod
+        def value_to_bytes(value: np.ndarray) -> bytes:
+            EAssert.Argument.is_not_none(value)
+            EAssert.Argument.is_true(len(value.shape) == 3)
+            EAssert.Argument.is_true(value.dtype == int)
 
-            ret = np.zeros((dim_a, dim_b), dtype=int)
-            for i in range(dim_a):
-                si = INT_LEN * 2 + i * dim_b * INT_LEN
-                tmp = value[si: si + dim_b * INT_LEN]
-                vals = BitUtilities.Int1D.bytes_to_value(tmp)
-                ret[i, :] = vals
+            ret = BitUtilities.NDArray.value_to_bytes(value, '<i4')
+            return ret
 
+    class Int2D:
+        @staticmethod
+        def bytes_to_value(value: bytes) -> np.ndarray:
+            ret = BitUtilities.NDArray.bytes_to_value(value, 2, '<i4', int)
             return ret
 
         @staticmethod
@@ -74,42 +94,14 @@ class BitUtilities:
             EAssert.Argument.is_true(len(value.shape) == 2)
             EAssert.Argument.is_true(value.dtype == int)
 
-            dim_a_bytes: bytes = BitUtilities.Int.value_to_bytes(value.shape[0])
-            dim_b_bytes: bytes = BitUtilities.Int.value_to_bytes(value.shape[1])
-
-            pts = []
-            for i in range(value.shape[0]):
-                tmp = list(value[i, :])
-                pts.append(BitUtilities.Int1D.value_to_bytes(tmp))
-
-            ret: bytearray = bytearray(dim_a_bytes) + bytearray(dim_b_bytes)
-            for it in pts:
-                ret += it
-
+            ret = BitUtilities.NDArray.value_to_bytes(value, '<i4')
             return ret
 
     class Float3D:
 
         @staticmethod
         def bytes_to_value(value: bytes) -> np.ndarray:
-            INT_LEN = BitUtilities.Int.length()
-            DBL_LEN = BitUtilities.Float.length()
-
-            tmp = value[0:INT_LEN]
-            dim_a = BitUtilities.Int.bytes_to_value(tmp)
-            tmp = value[INT_LEN: INT_LEN * 2]
-            dim_b = BitUtilities.Int.bytes_to_value(tmp)
-            tmp = value[INT_LEN * 2: INT_LEN * 3]
-            dim_c = BitUtilities.Int.bytes_to_value(tmp)
-
-            ret = np.zeros((dim_a, dim_b, dim_c))
-            for i in range(dim_a):
-                for j in range(dim_b):
-                    si = INT_LEN * 3 + ((i * dim_b) + j) * dim_c * DBL_LEN
-                    tmp = value[si: si + dim_c * DBL_LEN]
-                    vals = BitUtilities.Float1D.bytes_to_value(tmp)
-                    ret[i, j, :] = vals
-
+            ret = BitUtilities.NDArray.bytes_to_value(value, 3, '<f8', float)
             return ret
 
         @staticmethod
@@ -117,40 +109,13 @@ class BitUtilities:
             EAssert.Argument.is_not_none(value)
             EAssert.Argument.is_true(len(value.shape) == 3)
 
-            dim_a_bytes: bytes = BitUtilities.Int.value_to_bytes(value.shape[0])
-            dim_b_bytes: bytes = BitUtilities.Int.value_to_bytes(value.shape[1])
-            dim_c_bytes: bytes = BitUtilities.Int.value_to_bytes(value.shape[2])
-
-            pts = []
-            for i in range(value.shape[0]):
-                for j in range(value.shape[1]):
-                    tmp = list(value[i, j, :])
-                    pts.append(BitUtilities.Float1D.value_to_bytes(tmp))
-
-            ret: bytearray = bytearray(dim_a_bytes) + bytearray(dim_b_bytes) + bytearray(dim_c_bytes)
-            for it in pts:
-                ret += it
-
+            ret = BitUtilities.NDArray.value_to_bytes(value, '<f8')
             return ret
 
     class Float2D:
         @staticmethod
         def bytes_to_value(value: bytes) -> np.ndarray:
-            INT_LEN = BitUtilities.Int.length()
-            DBL_LEN = BitUtilities.Float.length()
-
-            tmp = value[0:INT_LEN]
-            dim_a = BitUtilities.Int.bytes_to_value(tmp)
-            tmp = value[INT_LEN: INT_LEN * 2]
-            dim_b = BitUtilities.Int.bytes_to_value(tmp)
-
-            ret = np.zeros((dim_a, dim_b))
-            for i in range(dim_a):
-                si = INT_LEN * 2 + i * dim_b * DBL_LEN
-                tmp = value[si: si + dim_b * DBL_LEN]
-                vals = BitUtilities.Float1D.bytes_to_value(tmp)
-                ret[i, :] = vals
-
+            ret = BitUtilities.NDArray.bytes_to_value(value, 2, '<f8', float)
             return ret
 
         @staticmethod
@@ -158,56 +123,31 @@ class BitUtilities:
             EAssert.Argument.is_not_none(value)
             EAssert.Argument.is_true(len(value.shape) == 2)
 
-            dim_a_bytes: bytes = BitUtilities.Int.value_to_bytes(value.shape[0])
-            dim_b_bytes: bytes = BitUtilities.Int.value_to_bytes(value.shape[1])
-
-            pts = []
-            for i in range(value.shape[0]):
-                tmp = list(value[i, :])
-                pts.append(BitUtilities.Float1D.value_to_bytes(tmp))
-
-            ret: bytearray = bytearray(dim_a_bytes) + bytearray(dim_b_bytes)
-            for it in pts:
-                ret += it
-
+            ret = BitUtilities.NDArray.value_to_bytes(value, '<f8')
             return ret
 
     class Float1D:
 
         @staticmethod
         def bytes_to_value(value: bytes) -> List[float]:
-            ret = []
-            index = 0
-            while index < len(value):
-                part = value[index:index + BitUtilities.Float.length()]
-                tmp = BitUtilities.Float.bytes_to_value(part)
-                ret.append(tmp)
-                index += BitUtilities.Float.length()
+            ret = np.frombuffer(value, dtype='<f8').tolist()
             return ret
 
         @staticmethod
         def value_to_bytes(value: List[float]) -> bytes:
-            import struct
-            ret = struct.pack("%sd" % len(value), *value)
+            ret = np.asarray(value, dtype='<f8').tobytes()
             return ret
 
     class Int1D:
 
         @staticmethod
         def value_to_bytes(value: List[int]) -> bytes:
-            import struct
-            ret = struct.pack("%si" % len(value), *value)
+            ret = np.asarray(value, dtype='<i4').tobytes()
             return ret
 
         @staticmethod
         def bytes_to_value(value: bytes) -> List[int]:
-            ret = []
-            index = 0
-            while index < len(value):
-                part = value[index:index + BitUtilities.Int.length()]
-                tmp = BitUtilities.Int.bytes_to_value(part)
-                ret.append(tmp)
-                index += BitUtilities.Int.length()
+            ret = np.frombuffer(value, dtype='<i4').tolist()
             return ret
 
     class Str:
@@ -219,7 +159,7 @@ class BitUtilities:
 
         @staticmethod
         def bytes_to_value(value: bytes) -> str:
-            ret = value.decode("UTF-8")
+            ret = str(value, "UTF-8")
             return ret
 
     class Float:
@@ -255,6 +195,22 @@ class BitUtilities:
         def length():
             return 4
 
+    class Long:
+
+        @staticmethod
+        def value_to_bytes(value: int, byteorder='little') -> bytes:
+            ret = value.to_bytes(8, byteorder, signed=True)
+            return ret
+
+        @staticmethod
+        def bytes_to_value(value: bytes, byteorder='little', signed=True):
+            ret = int.from_bytes(value, byteorder=byteorder, signed=signed)
+            return ret
+
+        @staticmethod
+        def length():
+            return 8
+
     class Bool:
 
         @staticmethod
@@ -0,0 +1,161 @@
+from lib.esystem.easserting import EAssert
+from lib.pynet.bitutilities import BitUtilities
+from lib.pynet.exceptions import PyNetException
+from typing import Dict, Tuple, Union
+import numpy as np
+
+
+class DeltaEncoding:
+    # Opt-in for a keep-alive Sender that sends the same-shape arrays under the same keys repeatedly. The
+    # Sender keeps the array last sent under each key; the next one is compared in blocks of block_size
+    # bytes and only the changed blocks are sent ("dd" type-id). The first array of a key, a changed dtype
+    # or shape, and an array with more than max_changed_ratio of its bytes changed go in full as a keyframe
+    # ("dk"). The Receiver applies the deltas to its copy of the last array of the key on the connection,
+    # so a new connection starts with keyframes again. Arrays smaller than min_size are sent as usual.
+
+    def __init__(self, block_size: int = 4096, max_changed_ratio: float = 0.5, min_size: int = 64 * 1024):
+        EAssert.Argument.is_true(block_size > 0 and block_size % 8 == 0, "block_size")
+        EAssert.Argument.is_true(0 <= max_changed_ratio <= 1, "max_changed_ratio")
+        EAssert.Argument.is_true(min_size >= 0, "min_size")
+
+        self.__block_size = block_size
+        self.__max_changed_ratio = max_changed_ratio
+        self.__min_size = min_size
+
+    @property
+    def block_size(self) -> int:
+        return self.__block_size
+
+    @property
+    def max_changed_ratio(self) -> float:
+        return self.__max_changed_ratio
+
+    @property
+    def min_size(self) -> int:
+        return self.__min_size
+
+    def accepts(self, value) -> bool:
+        ret = type(value) is np.ndarray and value.dtype.kind in BitUtilities.RawArray.KINDS \
+              and value.nbytes >= self.__min_size
+        return ret
+
+    def encode(self, bases: Dict[str, np.ndarray], key: str,
+               value: np.ndarray) -> Union['ArrayKeyframe', 'ArrayDelta']:
+        # returns the field to send instead of the array and updates the array last sent under the key
+        current = np.ascontiguousarray(value)
+        base = bases.get(key)
+        if base is None or base.dtype != current.dtype or base.shape != current.shape:
+            bases[key] = current.copy()
+            return ArrayKeyframe(current)
+
+        indices = DeltaEncoding.__find_changed_blocks(
+            ArrayDelta.to_byte_array(base), ArrayDelta.to_byte_array(current), self.__block_size)
+        np.copyto(base, current)
+        if len(indices) * self.__block_size > self.__max_changed_ratio * current.nbytes:
+            return ArrayKeyframe(current)
+        ret = ArrayDelta.from_changed_blocks(current, indices, self.__block_size)
+        return ret
+
+    @staticmethod
+    def __find_changed_blocks(previous: np.ndarray, current: np.ndarray, block_size: int) -> np.ndarray:
+        # both are uint8 arrays of the same length; a trailing partial block has the last index
+        full_blocks = len(current) // block_size
+        full_length = full_blocks * block_size
+        # compared in 64-bit words, block_size is a multiple of 8; an array shorter than a block has no rows
+        is_changed = (current[:full_length].view(np.uint64).reshape(full_blocks, block_size // 8)
+                      != previous[:full_length].view(np.uint64).reshape(full_blocks, block_size // 8)).any(axis=1)
+        ret = np.flatnonzero(is_changed).astype(np.int32)
+        if full_length < len(current) and not np.array_equal(current[full_length:], previous[full_length:]):
+            ret = np.append(ret, np.int32(full_blocks))
+        return ret
+
+    @staticmethod
+    def resolve(bases: Dict[str, np.ndarray], message: dict) -> None:
+        # replaces the keyframes and deltas of a received message by arrays, updating the arrays kept
+        # per key; the message gets its own copies, so handlers may keep or modify them
+        for key, value in message.items():
+            if isinstance(value, ArrayKeyframe):
+                bases[key] = value.array.copy()
+                message[key] = value.array
+            elif isinstance(value, ArrayDelta):
+                base = bases.get(key)
+                if base is None or base.dtype != value.dtype or base.shape != value.shape:
+                    raise PyNetException(f"Delta of field '{key}' does not match the last array received.")
+                value.apply(base)
+                message[key] = base.copy()
+
+
+class ArrayKeyframe:
+    # an array sent in full, which the receiver keeps as the base of the following deltas of its key
+
+    def __init__(self, array: np.ndarray):
+        self.array = array
+
+
+class ArrayDelta:
+    # data layout: [block count: int][block indices: int * count][changed blocks, the last one may be partial]
+
+    def __init__(self, dtype: np.dtype, shape: Tuple[int, ...], block_size: int, indices: np.ndarray, blocks):
+        self.dtype = dtype
+        self.shape = shape
+        self.block_size = block_size
+        self.indices = indices
+        self.blocks = blocks
+
+    @staticmethod
+    def to_byte_array(value: np.ndarray) -> np.ndarray:
+        ret = np.frombuffer(BitUtilities.RawArray.value_to_bytes(value), dtype=np.uint8)
+        return ret
+
+    @staticmethod
+    def from_changed_blocks(value: np.ndarray, indices: np.ndarray, block_size: int) -> 'ArrayDelta':
+        data = ArrayDelta.to_byte_array(value)
+        full_blocks = len(data) // block_size
+        full_indices = indices[indices < full_blocks]
+        blocks = data[:full_blocks * block_size].reshape(full_blocks, block_size)[full_indices].reshape(-1)
+        if len(full_indices) < len(indices):
+            blocks = np.concatenate((blocks, data[full_blocks * block_size:]))
+        ret = ArrayDelta(value.dtype, value.shape, block_size, indices, blocks)
+        return ret
+
+    @staticmethod
+    def from_bytes(data: memoryview, dtype: np.dtype, shape: Tuple[int, ...], block_size: int) -> 'ArrayDelta':
+        count = BitUtilities.Int.bytes_to_value(data[:4])
+        indices_end = 4 + 4 * count
+        if count < 0 or indices_end > len(data):
+            raise PyNetException(f"Invalid array delta of {count} blocks.")
+        indices = np.frombuffer(data[4:indices_end], dtype="<i4")
+        ret = ArrayDelta(dtype, shape, block_size, indices, np.frombuffer(data[indices_end:], dtype=np.uint8))
+        return ret
+
+    @property
+    def nbytes(self) -> int:
+        return 4 + 4 * len(self.indices) + len(self.blocks)
+
+    def to_type_id(self) -> str:
+        ret = "dd%d.%s.%d.%s.%d" % (self.nbytes, self.dtype.str, len(self.shape),
+                                    "x".join(str(d) for d in self.shape), self.block_size)
+        return ret
+
+    def to_bytes(self) -> bytes:
+        ret = b''.join((BitUtilities.Int.value_to_bytes(len(self.indices)),
+                        memoryview(self.indices.astype("<i4", copy=False)).cast('B'), memoryview(self.blocks)))
+        return ret
+
+    def apply(self, base: np.ndarray) -> None:
+        target = ArrayDelta.to_byte_array(base)
+        full_blocks = len(target) // self.block_size
+        full_length = full_blocks * self.block_size
+        tail_length = len(target) - full_length
+        # the partial block at the end, if changed, is the last one
+        has_tail = tail_length > 0 and len(self.indices) > 0 and self.indices[-1] == full_blocks
+        full_count = len(self.indices) - 1 if has_tail else len(self.indices)
+        full_indices = self.indices[:full_count]
+        if (full_count > 0 and (full_indices.min() < 0 or full_indices.max() >= full_blocks)) \
+                or len(self.blocks) != full_count * self.block_size + (tail_length if has_tail else 0):
+            raise PyNetException("Array delta does not fit the array.")
+
+        target[:full_length].reshape(full_blocks, self.block_size)[full_indices] = \
+            self.blocks[:full_count * self.block_size].reshape(full_count, self.block_size)
+        if has_tail:
+            target[full_length:] = self.blocks[full_count * self.block_size:]
@@ -1,35 +1,117 @@
+import bz2
+import lzma
 import re
-from typing import Tuple
+import zlib
+from typing import Dict, List, Optional, Tuple
 from lib.pynet.bitutilities import BitUtilities
 from lib.esystem.elist import EList
 from lib.pynet.exceptions import PyNetException
 import numpy as np
 from lib.esystem.easserting import EAssert
+from lib.pynet.delta import ArrayDelta, ArrayKeyframe
+from lib.pynet.shared_memory import SharedMemoryPayload, SharedMemorySegments
+from lib.pynet.streaming import FilePayload, LazyPayload, StreamedArray
 
 
 class _PyNetEncoder:
-    def __init__(self, accepts_value, accepts_type_id,
+    def __init__(self, value_type: type, type_id_prefix: str, type_id_sized: bool,
+                 accepts_value, accepts_type_id,
                  to_type_id, to_data,
-                 to_byte_len, to_value):
+                 to_byte_len, to_value,
+                 struct_format: Optional[str] = None, bind_type_id=None):
+        self.value_type = value_type
+        self.type_id_prefix = type_id_prefix
+        self.type_id_sized = type_id_sized
         self.accepts_value = accepts_value
         self.accepts_type_id = accepts_type_id
         self.to_type_id = to_type_id
         self.to_data = to_data
         self.to_byte_len = to_byte_len
         self.to_value = to_value
+        # struct format of fixed-size values, which makes them packable together with neighbouring fields
+        self.struct_format = struct_format
+        # for type-ids carrying parameters; returns an encoder specialized for the given type-id
+        self.bind_type_id = bind_type_id
+
+
+class Compression:
+    ZLIB = "zlib"
+    LZMA = "lzma"
+    BZ2 = "bz2"
+
+    # type-id prefixes of compressed fields, "<prefix><compressed length><inner type-id>"
+    TYPE_ID_PREFIXES = {ZLIB: "zz", LZMA: "zx", BZ2: "zb"}
+
+    def __init__(self, codec: str = ZLIB, threshold: int = 64 * 1024, level: Optional[int] = None):
+        EAssert.Argument.is_true(codec in Compression.TYPE_ID_PREFIXES, "codec")
+        EAssert.Argument.is_true(threshold >= 0, "threshold")
+
+        self.__codec = codec
+        self.__threshold = threshold
+        self.__level = level
+        self.__type_id_prefix = Compression.TYPE_ID_PREFIXES[codec]
+
+    @property
+    def codec(self) -> str:
+        return self.__codec
+
+    @property
+    def threshold(self) -> int:
+        return self.__threshold
+
+    @property
+    def level(self) -> Optional[int]:
+        return self.__level
+
+    def apply(self, type_id: str, data: bytes) -> Tuple[str, bytes]:
+        if len(data) < self.__threshold:
+            return type_id, data
+        compressed = self.__compress(data)
+        if len(compressed) >= len(data):
+            return type_id, data
+        return f"{self.__type_id_prefix}{len(compressed)}{type_id}", compressed
+
+    def __compress(self, data: bytes) -> bytes:
+        if self.__codec == Compression.ZLIB:
+            ret = zlib.compress(data, -1 if self.__level is None else self.__level)
+        elif self.__codec == Compression.LZMA:
+            ret = lzma.compress(data, preset=self.__level)
+        else:
+            ret = bz2.compress(data, 9 if self.__level is None else self.__level)
+        return ret
+
+    @staticmethod
+    def decompress(type_id_prefix: str, data: bytes, max_length: int) -> bytes:
+        # the output is bounded by the length the inner type-id declares, so a small field cannot
+        # expand into gigabytes; one byte more than allowed is requested to detect longer output
+        if type_id_prefix == Compression.TYPE_ID_PREFIXES[Compression.ZLIB]:
+            decompressor = zlib.decompressobj()
+        elif type_id_prefix == Compression.TYPE_ID_PREFIXES[Compression.LZMA]:
+            decompressor = lzma.LZMADecompressor()
+        else:
+            decompressor = bz2.BZ2Decompressor()
+        ret = decompressor.decompress(data, max_length + 1)
+        if len(ret) > max_length:
+            raise PyNetException(f"Compressed field expands beyond {max_length} bytes.")
+        if not decompressor.eof:
+            raise PyNetException("Compressed field is truncated.")
+        return ret
 
 
 class PyNetEncoderManager:
     ENCODERS = EList.of([
         _PyNetEncoder(
+            type(None), "n", False,
             lambda q: q is None,
             lambda q: q == "n",
             lambda q: "n",
             lambda q: bytes(),
             lambda q: 0,
-            lambda q: None
+            lambda q: None,
+            struct_format=""
         ),
         _PyNetEncoder(
+            str, "s", True,
             lambda q: isinstance(q, str),
             lambda q: re.search("^s\\d+", q),
             lambda q: "s" + str(len(q)),
@@ -38,38 +120,46 @@ class PyNetEncoderManager:
             lambda q: BitUtilities.Str.bytes_to_value(q)
         ),
         _PyNetEncoder(
+            bool, "b", False,
             lambda q: isinstance(q, bool),
             lambda q: q == "b",
             lambda q: "b",
             lambda q: BitUtilities.Bool.value_to_bytes(q),
             lambda q: BitUtilities.Bool.length(),
-            lambda q: BitUtilities.Bool.bytes_to_value(q)
+            lambda q: BitUtilities.Bool.bytes_to_value(q),
+            struct_format="?"
         ),
         _PyNetEncoder(
+            int, "i", False,
             lambda q: isinstance(q, int),
             lambda q: q == "i",
             lambda q: "i",
             lambda q: BitUtilities.Int.value_to_bytes(q),
             lambda q: BitUtilities.Int.length(),
-            lambda q: BitUtilities.Int.bytes_to_value(q)
+            lambda q: BitUtilities.Int.bytes_to_value(q),
+            struct_format="i"
         ),
         _PyNetEncoder(
+            float, "d", False,
             lambda q: isinstance(q, float),
             lambda q: q == "d",
             lambda q: "d",
             lambda q: BitUtilities.Float.value_to_bytes(q),
             lambda q: BitUtilities.Float.length(),
-            lambda q: BitUtilities.Float.bytes_to_value(q)
+            lambda q: BitUtilities.Float.bytes_to_value(q),
+            struct_format="d"
         ),
         _PyNetEncoder(
+            bytes, "b", True,
             lambda q: isinstance(q, bytes),
             lambda q: re.search(r"^b\d+", q),
             lambda q: "b" + str(len(q)),
             lambda q: q,
             lambda q: int(q[1:]),
-            lambda q: q
+            lambda q: bytes(q)
         ),
         _PyNetEncoder(
+            list, "d", True,
             lambda q: isinstance(q, list) and all(isinstance(d, float) for d in q),
             lambda q: re.search(r"^d\d+", q),
             lambda q: "d" + str(len(q) * BitUtilities.Float.length()),
@@ -78,6 +168,7 @@ class PyNetEncoderManager:
             lambda q: BitUtilities.Float1D.bytes_to_value(q)
         ),
         _PyNetEncoder(
+            np.ndarray, "md", True,
             lambda q: isinstance(q, np.ndarray) and len(q.shape) == 2 and q.dtype == float,
             lambda q: re.search(r"^md\d+", q),
             lambda q: "md" + str(
@@ -88,6 +179,7 @@ class PyNetEncoderManager:
             lambda q: BitUtilities.Float2D.bytes_to_value(q)
         ),
         _PyNetEncoder(
+            np.ndarray, "mmd", True,
             lambda q: isinstance(q, np.ndarray) and len(q.shape) == 3 and q.dtype == float,
             lambda q: re.search(r"^mmd\d+", q),
             lambda q: "mmd" + str(
@@ -98,6 +190,7 @@ class PyNetEncoderManager:
             lambda q: BitUtilities.Float3D.bytes_to_value(q)
         ),
         _PyNetEncoder(
+            list, "i", True,
             lambda q: isinstance(q, list) and all(isinstance(d, int) for d in q),
             lambda q: re.search(r"^i\d+", q),
             lambda q: "i" + str(len(q) * BitUtilities.Int.length()),
@@ -106,7 +199,9 @@ class PyNetEncoderManager:
             lambda q: BitUtilities.Int1D.bytes_to_value(q)
         ),
         _PyNetEncoder(
-            lambda q: isinstance(q, np.ndarray) and len(q.shape) == 2 and q.dtype == int,
+            np.ndarray, "mi", True,
+            lambda q: isinstance(q, np.ndarray) and len(q.shape) == 2 and q.dtype == int
+                      and BitUtilities.NDArray.fits(q, '<i4'),
             lambda q: re.search(r"^mi\d+", q),
             lambda q: "mi" + str(
                 np.array(q.shape).prod() * BitUtilities.Int.length()
@@ -116,7 +211,9 @@ class PyNetEncoderManager:
             lambda q: BitUtilities.Int2D.bytes_to_value(q)
         ),
         _PyNetEncoder(
-            lambda q: isinstance(q, np.ndarray) and len(q.shape) == 3 and q.dtype == int,
+            np.ndarray, "mmi", True,
+            lambda q: isinstance(q, np.ndarray) and len(q.shape) == 3 and q.dtype == int
+                      and BitUtilities.NDArray.fits(q, '<i4'),
             lambda q: re.search(r"^mmi\d+", q),
             lambda q: "mmi" + str(
                 np.array(q.shape).prod() * BitUtilities.Int.length()
@@ -124,22 +221,137 @@ class PyNetEncoderManager:
             lambda q: BitUtilities.Int3D.value_to_bytes(q),
             lambda q: int(q[3:]),
             lambda q: BitUtilities.Int3D.bytes_to_value(q)
+        ),
+        _PyNetEncoder(
+            np.ndarray, "nd", True,
+            lambda q: isinstance(q, np.ndarray) and q.dtype.kind in BitUtilities.RawArray.KINDS,
+            lambda q: re.search(r"^nd\d+\.", q),
+            lambda q: "nd%d.%s.%d.%s" % (q.nbytes, q.dtype.str, q.ndim, "x".join(str(d) for d in q.shape)),
+            lambda q: BitUtilities.RawArray.value_to_bytes(q),
+            lambda q: int(q[2:q.index(".")]),
+            None,
+            bind_type_id=lambda q: PyNetEncoderManager.bind_nd_array_type_id(q)
+        ),
+        _PyNetEncoder(
+            StreamedArray, "nd", True,
+            lambda q: isinstance(q, StreamedArray),
+            lambda q: False,
+            lambda q: "nd%d.%s.%d.%s" % (q.nbytes, q.dtype.str, q.ndim, "x".join(str(d) for d in q.shape)),
+            lambda q: q,
+            None,
+            None
+        ),
+        _PyNetEncoder(
+            FilePayload, "fd", True,
+            lambda q: isinstance(q, FilePayload),
+            lambda q: re.search(r"^fd\d+\.", q),
+            lambda q: "fd%d.%s.%d.%s" % (q.nbytes, q.dtype.str, q.ndim, "x".join(str(d) for d in q.shape)),
+            lambda q: q,
+            lambda q: int(q[2:q.index(".")]),
+            None,
+            bind_type_id=lambda q: PyNetEncoderManager.bind_nd_array_type_id(q)
+        ),
+        _PyNetEncoder(
+            np.memmap, "fd", True,
+            lambda q: isinstance(q, np.memmap) and FilePayload.is_file_backed(q),
+            lambda q: False,
+            lambda q: "fd%d.%s.%d.%s" % (q.nbytes, q.dtype.str, q.ndim, "x".join(str(d) for d in q.shape)),
+            lambda q: FilePayload(q),
+            None,
+            None
+        ),
+        _PyNetEncoder(
+            SharedMemoryPayload, "sm", True,
+            lambda q: isinstance(q, SharedMemoryPayload) and q.is_array,
+            lambda q: re.search(r"^sm\d+\.", q),
+            lambda q: q.to_type_id(),
+            lambda q: BitUtilities.Str.value_to_bytes(q.name),
+            lambda q: int(q[2:q.index(".")]),
+            None,
+            bind_type_id=lambda q: PyNetEncoderManager.bind_shared_memory_type_id(q)
+        ),
+        _PyNetEncoder(
+            SharedMemoryPayload, "sb", True,
+            lambda q: isinstance(q, SharedMemoryPayload) and not q.is_array,
+            lambda q: re.search(r"^sb\d+\.", q),
+            lambda q: q.to_type_id(),
+            lambda q: BitUtilities.Str.value_to_bytes(q.name),
+            lambda q: int(q[2:q.index(".")]),
+            None,
+            bind_type_id=lambda q: PyNetEncoderManager.bind_shared_memory_type_id(q)
+        ),
+        _PyNetEncoder(
+            ArrayKeyframe, "dk", True,
+            lambda q: isinstance(q, ArrayKeyframe),
+            lambda q: re.search(r"^dk\d+\.", q),
+            lambda q: "dk%d.%s.%d.%s" % (q.array.nbytes, q.array.dtype.str, q.array.ndim,
+                                         "x".join(str(d) for d in q.array.shape)),
+            lambda q: BitUtilities.RawArray.value_to_bytes(q.array),
+            lambda q: int(q[2:q.index(".")]),
+            None,
+            bind_type_id=lambda q: PyNetEncoderManager.bind_delta_type_id(q)
+        ),
+        _PyNetEncoder(
+            ArrayDelta, "dd", True,
+            lambda q: isinstance(q, ArrayDelta),
+            lambda q: re.search(r"^dd\d+\.", q),
+            lambda q: q.to_type_id(),
+            lambda q: q.to_bytes(),
+            lambda q: int(q[2:q.index(".")]),
+            None,
+            bind_type_id=lambda q: PyNetEncoderManager.bind_delta_type_id(q)
         )
     ])
 
+    # encoders by exact value type, in ENCODERS order; lists and ndarrays have several candidates
+    __BY_VALUE_TYPE: Dict[type, List[_PyNetEncoder]] = {}
+    # encoders by (type-id prefix, whether the type-id carries a byte length)
+    __BY_TYPE_ID: Dict[Tuple[str, bool], _PyNetEncoder] = {}
+    __TYPE_ID_PATTERN = re.compile(r"^([a-z]+)(\d*)(\..*)?$")
+    __COMPRESSED_TYPE_ID_PATTERN = re.compile(
+        "^(" + "|".join(Compression.TYPE_ID_PREFIXES.values()) + r")(\d+)([a-z].*)$")
+
+    @staticmethod
+    def rebuild_index() -> None:
+        by_value_type = {}
+        by_type_id = {}
+        PyNetEncoderManager.ENCODERS.for_each(
+            lambda q: by_value_type.setdefault(q.value_type, []).append(q))
+        PyNetEncoderManager.ENCODERS.for_each(
+            lambda q: by_type_id.setdefault((q.type_id_prefix, q.type_id_sized), q))
+        PyNetEncoderManager.__BY_VALUE_TYPE = by_value_type
+        PyNetEncoderManager.__BY_TYPE_ID = by_type_id
+
     @staticmethod
-    def encode(value) -> Tuple[str, bytes]:
+    def encode(value, compression: Optional[Compression] = None) -> Tuple[str, bytes]:
         encoder = PyNetEncoderManager.__get_encoder_by_value(value)
         (type_id, data) = PyNetEncoderManager.__encode_with_encoder(encoder, value)
+        if compression is not None and not isinstance(data, LazyPayload) \
+                and encoder.type_id_prefix not in SharedMemorySegments.TYPE_ID_PREFIXES:
+            (type_id, data) = compression.apply(type_id, data)
         return type_id, data
 
     @staticmethod
     def __get_encoder_by_value(value: any) -> _PyNetEncoder:
+        candidates = PyNetEncoderManager.__BY_VALUE_TYPE.get(type(value))
+        if candidates is not None:
+            for it in candidates:
+                if it.accepts_value(value):
+                    return it
+
+        # subclasses of the supported types (e.g. numpy.float64) keep the original first-match semantics
         ret = PyNetEncoderManager.ENCODERS.first_or_none(lambda q: q.accepts_value(value))
         if ret is None:
             raise PyNetException("Failed to find encoder for " + str(value))
         return ret
 
+    @staticmethod
+    def get_fixed_encoder(value_type: type) -> Optional[_PyNetEncoder]:
+        candidates = PyNetEncoderManager.__BY_VALUE_TYPE.get(value_type)
+        if candidates is None or len(candidates) != 1 or candidates[0].struct_format is None:
+            return None
+        return candidates[0]
+
     @staticmethod
     def __encode_with_encoder(encoder: _PyNetEncoder, value: any) -> Tuple[str, bytes]:
         type_id = encoder.to_type_id(value)
@@ -148,21 +360,158 @@ class PyNetEncoderManager:
 
     @staticmethod
     def decode(type_id: str, data_bytes: bytes) -> Tuple[any, int]:
-        encoder = PyNetEncoderManager.__get_encoder_by_type_id(type_id)
+        encoder = PyNetEncoderManager.get_encoder_by_type_id(type_id)
         value, used_bytes = PyNetEncoderManager.__decode_with_encoder(encoder, type_id, data_bytes)
         return value, used_bytes
 
     @staticmethod
-    def __get_encoder_by_type_id(type_id: str) -> _PyNetEncoder:
+    def get_encoder_by_type_id(type_id: str) -> _PyNetEncoder:
+        match = PyNetEncoderManager.__TYPE_ID_PATTERN.match(type_id)
+        if match is not None:
+            ret = PyNetEncoderManager.__BY_TYPE_ID.get((match.group(1), len(match.group(2)) > 0))
+            if ret is not None:
+                return ret if ret.bind_type_id is None else ret.bind_type_id(type_id)
+        else:
+            match = PyNetEncoderManager.__COMPRESSED_TYPE_ID_PATTERN.match(type_id)
+            if match is not None:
+                return PyNetEncoderManager.__create_compressed_encoder(
+                    match.group(1), int(match.group(2)), match.group(3))
+
         ret = PyNetEncoderManager.ENCODERS.first_or_none(lambda q: q.accepts_type_id(type_id))
         if ret is None:
             raise PyNetException("Failed to find encoder for type-id " + str(type_id))
+        return ret if ret.bind_type_id is None else ret.bind_type_id(type_id)
+
+    @staticmethod
+    def parse_nd_array_type_id(type_id: str) -> Tuple[int, np.dtype, Tuple[int, ...]]:
+        # "nd<byte length>.<dtype>.<ndim>.<dim>x<dim>x...", or "fd..." for file-backed arrays
+        # and "dk..." for keyframes of delta encoding
+        pts = type_id.split(".")
+        if len(pts) != 4 or pts[0][:2] not in ("nd", "fd", "dk"):
+            raise PyNetException(f"Invalid n-dimensional array type-id {type_id}.")
+        try:
+            dtype = np.dtype(pts[1])
+            ndim = int(pts[2])
+            shape = tuple(int(q) for q in pts[3].split("x")) if ndim > 0 else ()
+            data_len = int(pts[0][2:])
+        except Exception as e:
+            raise PyNetException(f"Invalid n-dimensional array type-id {type_id}.", e)
+        if dtype.kind not in BitUtilities.RawArray.KINDS or len(shape) != ndim \
+                or int(np.prod(shape)) * dtype.itemsize != data_len:
+            raise PyNetException(f"Inconsistent n-dimensional array type-id {type_id}.")
+        return data_len, dtype, shape
+
+    @staticmethod
+    def bind_nd_array_type_id(type_id: str) -> _PyNetEncoder:
+        data_len, dtype, shape = PyNetEncoderManager.parse_nd_array_type_id(type_id)
+
+        ret = _PyNetEncoder(
+            np.ndarray, "nd", True,
+            lambda q: False,
+            lambda q: q == type_id,
+            lambda q: type_id,
+            None,
+            lambda q: data_len,
+            lambda q: BitUtilities.RawArray.bytes_to_value(q, dtype.str, shape)
+        )
+        return ret
+
+    @staticmethod
+    def bind_delta_type_id(type_id: str) -> _PyNetEncoder:
+        # "dk..." keyframes are laid out as "nd" arrays, "dd<byte length>.<dtype>.<ndim>.<shape>.<block size>"
+        # deltas carry changed blocks of the last array of the key (see DeltaEncoding)
+        if type_id.startswith("dk"):
+            data_len, dtype, shape = PyNetEncoderManager.parse_nd_array_type_id(type_id)
+            to_value = lambda q: ArrayKeyframe(BitUtilities.RawArray.bytes_to_value(q, dtype.str, shape))
+        else:
+            pts = type_id.split(".")
+            try:
+                EAssert.is_true(len(pts) == 5)
+                data_len = int(pts[0][2:])
+                dtype = np.dtype(pts[1])
+                shape = tuple(int(q) for q in pts[3].split("x")) if int(pts[2]) > 0 else ()
+                block_size = int(pts[4])
+                EAssert.is_true(len(shape) == int(pts[2]) and block_size > 0)
+            except Exception as e:
+                raise PyNetException(f"Invalid array delta type-id {type_id}.", e)
+            to_value = lambda q: ArrayDelta.from_bytes(q, dtype, shape, block_size)
+
+        ret = _PyNetEncoder(
+            ArrayKeyframe if type_id.startswith("dk") else ArrayDelta, type_id[:2], True,
+            lambda q: False,
+            lambda q: q == type_id,
+            lambda q: type_id,
+            None,
+            lambda q: data_len,
+            to_value
+        )
+        return ret
+
+    @staticmethod
+    def bind_shared_memory_type_id(type_id: str) -> _PyNetEncoder:
+        # "sm<name length>.<dtype>.<ndim>.<dim>x<dim>x..." for arrays, "sb<name length>.<byte length>" for
+        # bytes; the data is the name of the shared memory segment holding the field data
+        pts = type_id.split(".")
+        try:
+            name_len = int(pts[0][2:])
+            if pts[0][:2] == "sm" and len(pts) == 4:
+                dtype = np.dtype(pts[1])
+                shape = tuple(int(q) for q in pts[3].split("x")) if int(pts[2]) > 0 else ()
+                EAssert.is_true(len(shape) == int(pts[2]))
+                byte_len = int(np.prod(shape)) * dtype.itemsize
+                to_value = lambda q: BitUtilities.RawArray.bytes_to_value(
+                    SharedMemorySegments.attach(BitUtilities.Str.bytes_to_value(q), byte_len), dtype.str, shape)
+            else:
+                EAssert.is_true(pts[0][:2] == "sb" and len(pts) == 2)
+                byte_len = int(pts[1])
+                to_value = lambda q: SharedMemorySegments.attach(BitUtilities.Str.bytes_to_value(q), byte_len)
+        except Exception as e:
+            raise PyNetException(f"Invalid shared memory type-id {type_id}.", e)
+
+        ret = _PyNetEncoder(
+            SharedMemoryPayload, pts[0][:2], True,
+            lambda q: False,
+            lambda q: q == type_id,
+            lambda q: type_id,
+            None,
+            lambda q: name_len,
+            to_value
+        )
+        return ret
+
+    @staticmethod
+    def __create_compressed_encoder(type_id_prefix: str, compressed_len: int, inner_type_id: str) -> _PyNetEncoder:
+        inner = PyNetEncoderManager.get_encoder_by_type_id(inner_type_id)
+        # the shared memory gate of receivers looks at the outer type-id, and a segment name is never compressed
+        if inner.type_id_prefix in SharedMemorySegments.TYPE_ID_PREFIXES:
+            raise PyNetException(f"Compressed shared memory field {inner_type_id} is not supported.")
+        inner_len = inner.to_byte_len(inner_type_id)
+
+        def to_value(data: bytes):
+            decompressed = Compression.decompress(type_id_prefix, data, inner_len)
+            if len(decompressed) != inner_len:
+                raise PyNetException(
+                    f"Decompressed field has {len(decompressed)} bytes, {inner_len} expected by {inner_type_id}.")
+            return inner.to_value(decompressed)
+
+        type_id = f"{type_id_prefix}{compressed_len}{inner_type_id}"
+        ret = _PyNetEncoder(
+            type(None), type_id_prefix, True,
+            lambda q: False,
+            lambda q: q == type_id,
+            lambda q: type_id,
+            None,
+            lambda q: compressed_len,
+            to_value
+        )
         return ret
 
     @staticmethod
     def __decode_with_encoder(encoder: _PyNetEncoder, type_id: str, data_bytes: bytes) -> Tuple[any, int]:
-        EAssert.is_true(encoder.accepts_type_id(type_id))
         data_len = encoder.to_byte_len(type_id)
         data = data_bytes[:data_len]
         value = encoder.to_value(data)
         return value, data_len
+
+
+PyNetEncoderManager.rebuild_index()
@@ -0,0 +1,90 @@
+from lib.esystem.easserting import EAssert
+from lib.pynet.exceptions import PyNetException
+from typing import Optional, Tuple, Union
+import ipaddress
+import os
+import socket
+import stat
+
+
+class Endpoint:
+    # A TCP endpoint is a host and a port; with port None, the host is the path of a Unix domain socket,
+    # which co-located processes use to skip the TCP/IP stack. The framing is the same for both.
+    # Public constructors take the path as a separate unix_path argument, see resolve().
+
+    @staticmethod
+    def resolve(host: Optional[str], port: Optional[int], unix_path: Optional[str]) -> Tuple[str, Optional[int]]:
+        # either host and port of a TCP endpoint or unix_path alone; returns the (host, port) pair used here
+        if unix_path is None:
+            EAssert.Argument.is_true(port is not None, "port is required for a TCP endpoint, or give unix_path")
+            Endpoint.check(host, port)
+            return host, port
+        EAssert.Argument.is_true(host is None and port is None, "unix_path excludes host and port")
+        Endpoint.check(unix_path, None)
+        return unix_path, None
+
+    @staticmethod
+    def check(host: str, port: Optional[int]) -> None:
+        EAssert.Argument.is_nonempty_string(host)
+        if port is None:
+            EAssert.Argument.is_true(hasattr(socket, "AF_UNIX"), "Unix domain sockets are not supported.")
+        else:
+            EAssert.Argument.is_true(port > 0)
+
+    @staticmethod
+    def is_unix(port: Optional[int]) -> bool:
+        return port is None
+
+    @staticmethod
+    def to_str(host: str, port: Optional[int]) -> str:
+        ret = host if port is None else f"{host}:{port}"
+        return ret
+
+    @staticmethod
+    def to_address(host: str, port: Optional[int]) -> Union[str, tuple]:
+        ret = host if port is None else (host, port)
+        return ret
+
+    @staticmethod
+    def create_socket(port: Optional[int]) -> socket.socket:
+        ret = socket.socket(socket.AF_UNIX if port is None else socket.AF_INET, socket.SOCK_STREAM)
+        return ret
+
+    @staticmethod
+    def is_local_peer(connection: socket.socket) -> bool:
+        # whether the other end of the connection runs on this host
+        if hasattr(socket, "AF_UNIX") and connection.family == socket.AF_UNIX:
+            return True
+        try:
+            address = ipaddress.ip_address(connection.getpeername()[0])
+        except (OSError, ValueError):
+            # e.g. the peer has disconnected already
+            return False
+        address = getattr(address, "ipv4_mapped", None) or address
+        return address.is_loopback
+
+    @staticmethod
+    def remove_stale_unix_socket(path: str) -> None:
+        # a socket file left by a receiver that did not stop cleanly makes bind() fail; a socket file
+        # still accepting connections belongs to a running receiver and is kept
+        try:
+            if not stat.S_ISSOCK(os.stat(path).st_mode):
+                return
+        except FileNotFoundError:
+            return
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(path)
+            except ConnectionRefusedError:
+                os.unlink(path)
+                return
+            except OSError as e:
+                raise PyNetException(f"Failed to check Unix socket {path}.", e)
+        raise PyNetException(f"Unix socket {path} is already in use.")
+
+    @staticmethod
+    def remove_unix_socket(path: str) -> None:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
@@ -2,5 +2,4 @@ from lib.esystem.exceptions import  EException
 
 class PyNetException(EException):
     def __init__(self, message: str, cause: Exception = None):
-        self.__message = message
-        self.__cause = cause
\ No newline at end of file
+        super().__init__(message, cause)
\ No newline at end of file
@@ -0,0 +1,208 @@
+from lib.esystem.easserting import EAssert
+from lib.pynet.bitutilities import BitUtilities
+from lib.pynet.encoding import Compression, PyNetEncoderManager
+from lib.pynet.exceptions import PyNetException
+from lib.pynet.shared_memory import SharedMemorySegments
+from lib.pynet.streaming import LazyPayload
+from typing import Callable, Dict, List, Optional, Tuple
+import struct
+
+
+class MessageFraming:
+    # frame layout: [header_len: int][data_len: int][header: "key:type-id;..."][data]
+    # chunked frame layout: [CHUNKED_MARKER: int][header_len: int][data_len: long][header]
+    #   followed by chunks [chunk_len: int][chunk data] until data_len bytes are sent
+    INTRO_LENGTH = 2 * BitUtilities.Int.length()
+    CHUNKED_MARKER = -1
+    CHUNKED_INTRO_TAIL_LENGTH = BitUtilities.Long.length()
+    CHUNK_INTRO_LENGTH = BitUtilities.Int.length()
+    MAX_FRAME_LENGTH = 2 ** 31 - 1
+    # reserved fields of requests and replies (see Requester): the id pairing a reply with its request
+    # and the failure of the request handler, sent instead of the reply fields
+    CORRELATION_ID_KEY = "#cid"
+    ERROR_KEY = "#error"
+    RESERVED_KEYS = (CORRELATION_ID_KEY, ERROR_KEY)
+
+    SCHEMA_CACHE_SIZE = 1024
+    __schemas: Dict[Tuple[tuple, tuple], '_MessageSchema'] = {}
+    __headers: Dict[bytes, '_ParsedHeader'] = {}
+
+    @staticmethod
+    def has_reserved_keys(dictionary: Dict) -> bool:
+        # messages of Senders must not carry them, or Receivers would take them for requests
+        ret = any(q in dictionary for q in MessageFraming.RESERVED_KEYS)
+        return ret
+
+    @staticmethod
+    def encode_message(dictionary: Dict, compression: Optional[Compression] = None) -> Tuple[str, bytes]:
+        header, parts = MessageFraming.encode_message_parts(dictionary, compression)
+        data = b''.join(q.to_bytes() if isinstance(q, LazyPayload) else q for q in parts)
+        return header, data
+
+    @staticmethod
+    def encode_message_parts(dictionary: Dict, compression: Optional[Compression] = None) -> Tuple[str, list]:
+        keys = tuple(dictionary.keys())
+        values = list(dictionary.values())
+        schema_key = (keys, tuple(map(type, values)))
+
+        schema = MessageFraming.__schemas.get(schema_key)
+        if schema is None:
+            schema = _MessageSchema(keys, schema_key[1])
+            MessageFraming.__store(MessageFraming.__schemas, schema_key, schema)
+
+        ret = schema.encode(values, compression)
+        return ret
+
+    @staticmethod
+    def encode_frame(dictionary: Dict, compression: Optional[Compression] = None) -> bytes:
+        header, data = MessageFraming.encode_message(dictionary, compression)
+        header_bytes = BitUtilities.Str.value_to_bytes(header)
+        ret = MessageFraming.encode_intro(header_bytes, len(data)) + header_bytes + data
+        return ret
+
+    @staticmethod
+    def encode_intro(header_bytes: bytes, data_len: int) -> bytes:
+        if data_len > MessageFraming.MAX_FRAME_LENGTH:
+            raise PyNetException(f"Message data of {data_len} bytes exceed the frame limit, send it chunked.")
+        ret = BitUtilities.Int.value_to_bytes(len(header_bytes)) + BitUtilities.Int.value_to_bytes(data_len)
+        return ret
+
+    @staticmethod
+    def encode_chunked_intro(header_bytes: bytes, data_len: int) -> bytes:
+        ret = BitUtilities.Int.value_to_bytes(MessageFraming.CHUNKED_MARKER) \
+              + BitUtilities.Int.value_to_bytes(len(header_bytes)) \
+              + BitUtilities.Long.value_to_bytes(data_len)
+        return ret
+
+    @staticmethod
+    def decode_chunked_intro_tail(tail: bytes) -> int:
+        EAssert.is_true(len(tail) == MessageFraming.CHUNKED_INTRO_TAIL_LENGTH)
+        ret = BitUtilities.Long.bytes_to_value(tail)
+        return ret
+
+    @staticmethod
+    def decode_chunk_intro(chunk_intro: bytes, remaining_len: int) -> int:
+        ret = BitUtilities.Int.bytes_to_value(chunk_intro)
+        if ret <= 0 or ret > remaining_len:
+            raise PyNetException(f"Invalid chunk length {ret}, {remaining_len} bytes remaining.")
+        return ret
+
+    @staticmethod
+    def decode_intro(intro: bytes) -> Tuple[int, int]:
+        EAssert.is_true(len(intro) == MessageFraming.INTRO_LENGTH)
+        header_len = BitUtilities.Int.bytes_to_value(intro[:4])
+        data_len = BitUtilities.Int.bytes_to_value(intro[4:])
+        return header_len, data_len
+
+    @staticmethod
+    def decode_message(header_bytes: memoryview, data_bytes: memoryview, shared_memory: bool = False) -> dict:
+        header = MessageFraming.parse_header(header_bytes)
+        MessageFraming.check_shared_memory(header, shared_memory)
+        ret = header.decode(data_bytes)
+        return ret
+
+    @staticmethod
+    def check_shared_memory(header: '_ParsedHeader', shared_memory: bool) -> None:
+        # shared memory fields name segments on the receiving host, only receivers opted in map them
+        if header.has_shared_memory and not shared_memory:
+            raise PyNetException("Shared memory fields are not accepted on this connection.")
+
+    @staticmethod
+    def parse_header(header_bytes: memoryview) -> '_ParsedHeader':
+        header_key = bytes(header_bytes)
+        ret = MessageFraming.__headers.get(header_key)
+        if ret is None:
+            ret = _ParsedHeader(header_key)
+            MessageFraming.__store(MessageFraming.__headers, header_key, ret)
+        return ret
+
+    @staticmethod
+    def __store(cache: dict, key, value) -> None:
+        if len(cache) >= MessageFraming.SCHEMA_CACHE_SIZE:
+            cache.clear()
+        cache[key] = value
+
+
+class _MessageSchema:
+    # Fixed-size fields (None, bool, int, float) have a constant header part; each run of them
+    # is packed with one precompiled struct, other fields are encoded value by value.
+
+    def __init__(self, keys: tuple, value_types: tuple):
+        self.__keys = keys
+        self.__header_parts: List[Optional[str]] = []
+        self.__segments: List[Tuple[Optional[struct.Struct], List[int]]] = []
+
+        run_format = None
+        run_indices = []
+        for index, (key, value_type) in enumerate(zip(keys, value_types)):
+            encoder = PyNetEncoderManager.get_fixed_encoder(value_type)
+            if encoder is None:
+                self.__close_run(run_format, run_indices)
+                run_format, run_indices = None, []
+                self.__header_parts.append(None)
+                self.__segments.append((None, [index]))
+            else:
+                self.__header_parts.append(f"{key}:{encoder.type_id_prefix}")
+                run_format = (run_format or "") + encoder.struct_format
+                if len(encoder.struct_format) > 0:
+                    run_indices.append(index)
+        self.__close_run(run_format, run_indices)
+
+        self.__is_fixed = all(q is not None for q in self.__header_parts)
+        self.__fixed_header = ";".join(self.__header_parts) if self.__is_fixed else None
+
+    def __close_run(self, run_format: Optional[str], run_indices: List[int]) -> None:
+        if run_format is not None and len(run_indices) > 0:
+            self.__segments.append((struct.Struct("<" + run_format), run_indices))
+
+    def encode(self, values: list, compression: Optional[Compression]) -> Tuple[str, list]:
+        if self.__is_fixed and len(self.__segments) == 1:
+            packer, indices = self.__segments[0]
+            if len(indices) == len(values):
+                return self.__fixed_header, [packer.pack(*values)]
+
+        header_parts = self.__header_parts.copy()
+        data_parts = []
+        for packer, indices in self.__segments:
+            if packer is not None:
+                data_parts.append(packer.pack(*[values[q] for q in indices]))
+            else:
+                index = indices[0]
+                (val_type, val_data) = PyNetEncoderManager.encode(values[index], compression)
+                header_parts[index] = f"{self.__keys[index]}:{val_type}"
+                data_parts.append(val_data)
+
+        header = self.__fixed_header if self.__is_fixed else ";".join(header_parts)
+        return header, data_parts
+
+
+class _ParsedHeader:
+    def __init__(self, header_bytes: bytes):
+        self.__fields = []
+
+        tmp = str(header_bytes, 'UTF-8')
+        pts = tmp.split(';') if len(tmp) > 0 else []
+        data_start_index = 0
+        for pt in pts:
+            kv = pt.split(':')
+            key = kv[0]
+            encoder = PyNetEncoderManager.get_encoder_by_type_id(kv[1])
+            data_len = encoder.to_byte_len(kv[1])
+            self.__fields.append((key, kv[1], encoder.to_value, data_start_index, data_start_index + data_len))
+            data_start_index += data_len
+        self.__has_shared_memory = any(q[1][:2] in SharedMemorySegments.TYPE_ID_PREFIXES for q in self.__fields)
+
+    @property
+    def has_shared_memory(self) -> bool:
+        return self.__has_shared_memory
+
+    @property
+    def fields(self) -> List[Tuple[str, str, Callable, int, int]]:
+        # (key, type-id, to_value, start, end) of each field, in data order
+        return self.__fields
+
+    def decode(self, data_bytes: memoryview) -> dict:
+        ret = {}
+        for key, _, to_value, start, end in self.__fields:
+            ret[key] = to_value(data_bytes[start:end])
+        return ret
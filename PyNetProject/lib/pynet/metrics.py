@@ -0,0 +1,208 @@
+from lib.esystem.easserting import EAssert
+from lib.esystem.logging_factory import create_logger
+from lib.pynet.exceptions import PyNetException
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, List, Optional, Tuple
+import bisect
+import threading
+
+
+class Histogram:
+    # bucket upper bounds in seconds, roughly x2.5 apart from 50 us to 10 s
+    DEFAULT_BOUNDS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                      0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, bounds: Tuple[float, ...] = DEFAULT_BOUNDS):
+        EAssert.Argument.is_true(len(bounds) > 0 and list(bounds) == sorted(bounds), "bounds")
+        self.__bounds = tuple(bounds)
+        # the last bucket counts values above all bounds
+        self.__counts = [0] * (len(bounds) + 1)
+        self.__sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.__counts[bisect.bisect_left(self.__bounds, value)] += 1
+        self.__sum += value
+
+    def snapshot(self) -> Dict:
+        buckets = {}
+        total = 0
+        for bound, count in zip(self.__bounds, self.__counts):
+            total += count
+            buckets[bound] = total
+        total += self.__counts[-1]
+        buckets[float("inf")] = total
+        ret = {"count": total, "sum": self.__sum, "buckets": buckets}
+        return ret
+
+
+class Metrics:
+    # Counters, gauges, histograms and errors by kind of a single Receiver or Sender. Updates take one
+    # uncontended lock, so they are cheap enough to stay enabled under load, unlike debug logging.
+
+    def __init__(self, instance: str):
+        EAssert.Argument.is_nonempty_string(instance)
+        self.__instance = instance
+        self.__lock = threading.Lock()
+        self.__counters: Dict[str, int] = {}
+        self.__gauges: Dict[str, int] = {}
+        self.__histograms: Dict[str, Histogram] = {}
+        self.__errors: Dict[str, int] = {}
+
+    @property
+    def instance(self) -> str:
+        return self.__instance
+
+    def count(self, name: str, value: int = 1) -> None:
+        with self.__lock:
+            self.__counters[name] = self.__counters.get(name, 0) + value
+
+    def gauge(self, name: str, delta: int) -> None:
+        with self.__lock:
+            self.__gauges[name] = self.__gauges.get(name, 0) + delta
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self.__lock:
+            histogram = self.__histograms.get(name)
+            if histogram is None:
+                histogram = Histogram()
+                self.__histograms[name] = histogram
+            histogram.observe(seconds)
+
+    def error(self, kind: str) -> None:
+        with self.__lock:
+            self.__errors[kind] = self.__errors.get(kind, 0) + 1
+
+    @staticmethod
+    def error_kind(e: BaseException) -> str:
+        # wrapping PyNetExceptions are classified by their cause, e.g. "ConnectionResetError"
+        cause = e.cause if isinstance(e, PyNetException) and isinstance(e.cause, BaseException) else e
+        ret = type(cause).__name__
+        return ret
+
+    def snapshot(self) -> Dict:
+        with self.__lock:
+            ret = dict(self.__counters)
+            ret.update(self.__gauges)
+            for name, histogram in self.__histograms.items():
+                ret[name] = histogram.snapshot()
+            ret["errors"] = dict(self.__errors)
+        return ret
+
+    @staticmethod
+    def to_prometheus(metrics: Iterable['Metrics']) -> str:
+        # Prometheus text exposition format; samples of all instances are grouped by metric family
+        families: Dict[str, Tuple[str, List[str]]] = {}
+        for it in metrics:
+            for name, family_type, lines in it.__families():
+                families.setdefault(name, (family_type, []))[1].extend(lines)
+
+        ret = []
+        for name, (family_type, lines) in families.items():
+            ret.append(f"# TYPE {name} {family_type}")
+            ret.extend(lines)
+        ret = "\n".join(ret) + "\n"
+        return ret
+
+    def __families(self) -> List[Tuple[str, str, List[str]]]:
+        label = f'instance="{Metrics.__escape(self.__instance)}"'
+        ret = []
+        with self.__lock:
+            for name, value in sorted(self.__counters.items()):
+                ret.append((f"pynet_{name}_total", "counter", [f"pynet_{name}_total{{{label}}} {value}"]))
+            for name, value in sorted(self.__gauges.items()):
+                ret.append((f"pynet_{name}", "gauge", [f"pynet_{name}{{{label}}} {value}"]))
+            for name, histogram in sorted(self.__histograms.items()):
+                snapshot = histogram.snapshot()
+                lines = []
+                for bound, count in snapshot["buckets"].items():
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'pynet_{name}_bucket{{{label},le="{le}"}} {count}')
+                lines.append(f"pynet_{name}_sum{{{label}}} {snapshot['sum']}")
+                lines.append(f"pynet_{name}_count{{{label}}} {snapshot['count']}")
+                ret.append((f"pynet_{name}", "histogram", lines))
+            lines = [f'pynet_errors_total{{{label},kind="{Metrics.__escape(kind)}"}} {value}'
+                     for kind, value in sorted(self.__errors.items())]
+            if len(lines) > 0:
+                ret.append(("pynet_errors_total", "counter", lines))
+        return ret
+
+    @staticmethod
+    def __escape(value: str) -> str:
+        ret = value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        return ret
+
+
+class MetricsServer:
+    # Tiny HTTP endpoint serving the metrics of the added instances at /metrics for Prometheus scraping.
+    # It binds to localhost by default; the data are not meant to be exposed publicly.
+
+    def __init__(self, port: int, host: str = "127.0.0.1"):
+        EAssert.Argument.is_nonempty_string(host)
+        EAssert.Argument.is_true(port >= 0)
+        self.__host = host
+        self.__port = port
+        self.__metrics: List[Metrics] = []
+        self.__lock = threading.Lock()
+        self.__server: Optional[ThreadingHTTPServer] = None
+        self.__thread: Optional[threading.Thread] = None
+        self.__logger = create_logger(f"Metrics {host}:{port}")
+
+    @property
+    def port(self) -> int:
+        # the bound port, useful when started with port 0
+        if self.__server is not None:
+            return self.__server.server_address[1]
+        return self.__port
+
+    def add(self, metrics: Metrics) -> None:
+        EAssert.Argument.is_not_none(metrics)
+        with self.__lock:
+            self.__metrics.append(metrics)
+
+    def remove(self, metrics: Metrics) -> None:
+        with self.__lock:
+            self.__metrics.remove(metrics)
+
+    def render(self) -> str:
+        with self.__lock:
+            metrics = list(self.__metrics)
+        ret = Metrics.to_prometheus(metrics)
+        return ret
+
+    def start(self) -> None:
+        EAssert.is_true(self.__server is None, "Metrics server is already running.")
+        try:
+            self.__server = ThreadingHTTPServer((self.__host, self.__port), _create_request_handler(self))
+        except Exception as e:
+            raise PyNetException(f"Failed to open metrics endpoint at {self.__host}:{self.__port}.", e)
+        self.__server.daemon_threads = True
+        self.__thread = threading.Thread(target=self.__server.serve_forever, name="MetricsServer", daemon=True)
+        self.__thread.start()
+        self.__logger.info(f"Serving metrics at port {self.port}")
+
+    def stop(self) -> None:
+        EAssert.is_true(self.__server is not None, "Metrics server is not running.")
+        self.__server.shutdown()
+        self.__server.server_close()
+        self.__thread.join()
+        self.__server = None
+        self.__thread = None
+
+
+def _create_request_handler(server: MetricsServer) -> type:
+    class _MetricsRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = server.render().encode("UTF-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return _MetricsRequestHandler
@@ -0,0 +1,236 @@
+from lib.esystem.easserting import EAssert
+from lib.esystem.logging_factory import create_logger
+from lib.pynet.exceptions import PyNetException
+from lib.pynet.receiving import Receiver
+from typing import Callable, Dict, List, Optional, Union
+import importlib
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import socket
+import threading
+import time
+
+
+class MultiProcessReceiver:
+    # Runs a Receiver in each of several worker processes, all bound to the same port with SO_REUSEPORT,
+    # so decoding and handlers of different connections run in parallel, without sharing a GIL. The kernel
+    # balances new connections between the workers; a keep-alive connection stays with one worker.
+    #
+    # The handler is an importable callable with the on_message_received signature (source, client_id,
+    # message), given as "package.module:function" or as a module-level function. A supervisor thread
+    # restarts crashed workers and collects their stats, which stats() aggregates. Workers are stopped by
+    # SIGTERM and report through their own pipes, so a crashing worker cannot block shared locks.
+    SUPERVISE_INTERVAL = 0.5
+    STATS_INTERVAL = 1.0
+    STOP_TIMEOUT = 5.0
+
+    def __init__(self, host: str, port: int, handler: Union[str, Callable], workers: Optional[int] = None,
+                 name: Optional[str] = None, receiver_options: Optional[Dict] = None,
+                 restart_delay: float = 1.0, start_method: str = "spawn"):
+        EAssert.Argument.is_nonempty_string(host)
+        # SO_REUSEPORT balances TCP connections only, so Unix socket endpoints are not supported
+        EAssert.Argument.is_true(port is not None and port > 0, "port")
+        EAssert.Argument.is_true(hasattr(socket, "SO_REUSEPORT"), "SO_REUSEPORT is not supported on this platform.")
+        EAssert.Argument.is_true(workers is None or workers > 0, "workers")
+        receiver_options = {} if receiver_options is None else dict(receiver_options)
+        for key in ("executor", "reuse_port", "name"):
+            EAssert.Argument.is_true(key not in receiver_options, f"receiver_options cannot contain '{key}'")
+
+        self.__host = host
+        self.__port = port
+        self.__handler_path = MultiProcessReceiver.__to_handler_path(handler)
+        # fails early if the workers would not be able to import the handler
+        resolve_handler(self.__handler_path)
+        self.__workers = (os.cpu_count() or 1) if workers is None else workers
+        self.__str_name = name if name is not None else f"MPRecv_{host}:{port}"
+        self.__receiver_options = receiver_options
+        self.__restart_delay = restart_delay
+        self.__context = multiprocessing.get_context(start_method)
+
+        self.__lock = threading.Lock()
+        self.__processes: List[Optional[multiprocessing.Process]] = [None] * self.__workers
+        self.__stats_connections: List[Optional[multiprocessing.connection.Connection]] = [None] * self.__workers
+        self.__worker_stats: Dict[int, Dict] = {}
+        self.__restarts = 0
+        self.__supervisor: Optional[threading.Thread] = None
+        self.__is_stopping = threading.Event()
+        self.__logger = create_logger(self.__str_name)
+
+    @property
+    def host(self) -> str:
+        return self.__host
+
+    @property
+    def port(self) -> int:
+        return self.__port
+
+    @property
+    def workers(self) -> int:
+        return self.__workers
+
+    @property
+    def restarts(self) -> int:
+        return self.__restarts
+
+    @property
+    def is_running(self) -> bool:
+        return self.__supervisor is not None
+
+    def start(self) -> None:
+        EAssert.is_false(self.is_running, "Receiver is already running.")
+        self.__is_stopping.clear()
+        for index in range(self.__workers):
+            self.__start_worker(index)
+        self.__supervisor = threading.Thread(target=self.__supervise, name=f"{self.__str_name}.SV", daemon=True)
+        self.__supervisor.start()
+        self.__logger.info(f"Started {self.__workers} workers")
+
+    def stop(self) -> None:
+        EAssert.is_true(self.is_running, "Receiver is not running.")
+        self.__is_stopping.set()
+        self.__supervisor.join()
+        for process in self.__processes:
+            process.terminate()
+        deadline = time.monotonic() + MultiProcessReceiver.STOP_TIMEOUT
+        for index, process in enumerate(self.__processes):
+            while process.is_alive() and time.monotonic() < deadline:
+                # keeps reading, so a worker is never blocked by a full pipe when sending its final stats
+                self.__drain_stats()
+                process.join(0.05)
+            if process.is_alive():
+                # e.g. a worker still serving an open keep-alive connection
+                process.kill()
+                process.join()
+        self.__drain_stats()
+        for connection in self.__stats_connections:
+            connection.close()
+        self.__supervisor = None
+        self.__logger.info("Stopped")
+
+    def stats(self) -> Dict:
+        # Sums of the latest stats of the current workers, as reported every STATS_INTERVAL seconds
+        # and when stopping, plus the state of the workers themselves. Counters of a restarted worker
+        # start from zero again.
+        with self.__lock:
+            processes = list(self.__processes)
+            per_worker = dict(self.__worker_stats)
+            restarts = self.__restarts
+
+        ret = {}
+        for worker_stats in per_worker.values():
+            ret = _merge_stats(ret, worker_stats)
+        ret["workers"] = {
+            "count": self.__workers,
+            "alive": sum(1 for q in processes if q is not None and q.is_alive()),
+            "restarts": restarts,
+            "per_worker": per_worker
+        }
+        return ret
+
+    def __start_worker(self, index: int) -> None:
+        stats_connection, worker_connection = self.__context.Pipe(duplex=False)
+        process = self.__context.Process(
+            target=_run_worker, name=f"{self.__str_name}.W{index}", daemon=True,
+            args=(self.__host, self.__port, self.__handler_path, self.__receiver_options,
+                  f"{self.__str_name}.W{index}", worker_connection))
+        process.start()
+        worker_connection.close()
+        with self.__lock:
+            if self.__stats_connections[index] is not None:
+                self.__stats_connections[index].close()
+            self.__processes[index] = process
+            self.__stats_connections[index] = stats_connection
+            self.__worker_stats.pop(index, None)
+
+    def __supervise(self) -> None:
+        died_at: Dict[int, float] = {}
+        while not self.__is_stopping.wait(MultiProcessReceiver.SUPERVISE_INTERVAL):
+            self.__drain_stats()
+            for index, process in enumerate(self.__processes):
+                if process.is_alive():
+                    continue
+                now = time.monotonic()
+                if index not in died_at:
+                    self.__logger.warning(f"Worker {index} (pid {process.pid}) exited with code {process.exitcode}")
+                    died_at[index] = now
+                if now - died_at[index] >= self.__restart_delay:
+                    del died_at[index]
+                    self.__start_worker(index)
+                    with self.__lock:
+                        self.__restarts += 1
+                    self.__logger.info(f"Worker {index} restarted")
+
+    def __drain_stats(self) -> None:
+        for index, connection in enumerate(self.__stats_connections):
+            try:
+                while connection.poll():
+                    worker_stats = connection.recv()
+                    with self.__lock:
+                        self.__worker_stats[index] = worker_stats
+            except (EOFError, OSError):
+                # the worker has exited
+                pass
+
+    @staticmethod
+    def __to_handler_path(handler: Union[str, Callable]) -> str:
+        if isinstance(handler, str):
+            return handler
+        EAssert.Argument.is_true(callable(handler), "handler")
+        EAssert.Argument.is_true("<" not in handler.__qualname__ and handler.__module__ != "__main__",
+                                 "Handler must be a module-level function importable by the worker processes.")
+        ret = f"{handler.__module__}:{handler.__qualname__}"
+        return ret
+
+    def __str__(self):
+        return self.__str_name
+
+
+def resolve_handler(handler_path: str) -> Callable:
+    # "package.module:function" or "package.module.function"
+    if ":" in handler_path:
+        module_name, attribute_path = handler_path.split(":", 1)
+    else:
+        module_name, _, attribute_path = handler_path.rpartition(".")
+    try:
+        ret = importlib.import_module(module_name)
+        for attribute in attribute_path.split("."):
+            ret = getattr(ret, attribute)
+    except Exception as e:
+        raise PyNetException(f"Failed to import handler '{handler_path}'.", e)
+    EAssert.is_true(callable(ret), f"Handler '{handler_path}' is not callable.")
+    return ret
+
+
+def _merge_stats(target: Dict, source: Dict) -> Dict:
+    # numbers are summed, nested dicts (histograms, errors, executor state) merged recursively
+    ret = dict(target)
+    for key, value in source.items():
+        current = ret.get(key)
+        if isinstance(value, dict):
+            ret[key] = _merge_stats(current if isinstance(current, dict) else {}, value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            ret[key] = value if current is None else current + value
+        elif key not in ret:
+            ret[key] = value
+    return ret
+
+
+def _run_worker(host: str, port: int, handler_path: str, receiver_options: Dict, name: str,
+                stats_connection) -> None:
+    # the parent handles Ctrl+C and stops the workers by SIGTERM
+    stopping = threading.Event()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+
+    handler = resolve_handler(handler_path)
+    receiver = Receiver(host, port, name=name, reuse_port=True, **receiver_options)
+    receiver.on_message_received.add_listener(handler)
+    receiver.start_async()
+
+    while not stopping.wait(MultiProcessReceiver.STATS_INTERVAL):
+        stats_connection.send(receiver.stats())
+    receiver.stop_async()
+    stats_connection.send(receiver.stats())
+    stats_connection.close()
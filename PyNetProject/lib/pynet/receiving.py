@@ -1,41 +1,204 @@
 from lib.esystem.easserting import EAssert
 from lib.esystem.logging_factory import create_logger
+from lib.pynet.delta import DeltaEncoding
 from lib.pynet.encoding import PyNetEncoderManager
+from lib.pynet.endpoints import Endpoint
+from lib.pynet.framing import MessageFraming
+from lib.pynet.metrics import Metrics
+from lib.pynet.streaming import MessageChunk
 from lib.esystem.events import Event
-from lib.pynet.bitutilities import  BitUtilities
 from lib.pynet.exceptions import  PyNetException
-from typing import Tuple, Optional
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, Tuple, Optional
+import collections
+import logging
+import numpy as np
+import os
+import tempfile
 import threading
+import time
 import socket
 
 
-class Receiver:
+class OverflowPolicy:
+    # what a full dispatch queue does with a newly received message
+    BLOCK = "block"
+    DROP_OLDEST = "drop_oldest"
+    DROP_NEWEST = "drop_newest"
+    ALL = (BLOCK, DROP_OLDEST, DROP_NEWEST)
+
 
-    def __init__(self, host: str, port: int, name: Optional[str] = None):
-        EAssert.Argument.is_nonempty_string(host)
-        EAssert.Argument.is_true(port > 0)
+class Receiver:
 
-        self.__str_name = name if name is not None else f"Recv_{host}:{port}"
+    def __init__(self, host: Optional[str] = None, port: Optional[int] = None, name: Optional[str] = None,
+                 keep_alive: bool = False,
+                 max_workers: Optional[int] = None, max_pending_connections: Optional[int] = None,
+                 backlog: Optional[int] = None, executor: Optional[Executor] = None,
+                 progressive_threshold: Optional[int] = None, file_directory: Optional[str] = None,
+                 spill_threshold: Optional[int] = None, spill_directory: Optional[str] = None,
+                 dispatch_queue_size: Optional[int] = None, dispatch_workers: int = 1,
+                 overflow_policy: str = OverflowPolicy.BLOCK, reuse_port: bool = False,
+                 shared_memory: bool = False, unix_path: Optional[str] = None):
+        # listens on host and port, or on the Unix domain socket unix_path, created when started
+        (host, port) = Endpoint.resolve(host, port, unix_path)
+        EAssert.Argument.is_true(max_workers is None or max_workers > 0)
+        EAssert.Argument.is_true(max_pending_connections is None or max_pending_connections >= 0)
+        # with an executor, max_workers is the number of its workers available to the receiver
+        EAssert.Argument.is_true(max_pending_connections is None or max_workers is not None,
+                                 "max_pending_connections needs max_workers")
+        EAssert.Argument.is_true(file_directory is None or os.path.isdir(file_directory), "file_directory")
+        EAssert.Argument.is_true(spill_threshold is None or spill_threshold > 0, "spill_threshold")
+        EAssert.Argument.is_true(spill_directory is None or os.path.isdir(spill_directory), "spill_directory")
+        EAssert.Argument.is_true(dispatch_queue_size is None or dispatch_queue_size > 0, "dispatch_queue_size")
+        EAssert.Argument.is_true(dispatch_workers > 0, "dispatch_workers")
+        EAssert.Argument.is_true(overflow_policy in OverflowPolicy.ALL, "overflow_policy")
+        EAssert.Argument.is_true(not reuse_port or (hasattr(socket, "SO_REUSEPORT") and port is not None),
+                                 "reuse_port")
+
+        self.__str_name = name if name is not None else f"Recv_{Endpoint.to_str(host, port)}"
         self.__host = host
         self.__port = port
+        self.__keep_alive = keep_alive
+        self.__max_workers = max_workers
+        self.__max_pending_connections = max_pending_connections
+        self.__backlog = backlog
+        self.__executor = executor
+        self.__progressive_threshold = progressive_threshold
+        self.__file_directory = file_directory
+        self.__spill_threshold = spill_threshold
+        self.__spill_directory = spill_directory
+        self.__dispatch_queue_size = dispatch_queue_size
+        self.__dispatch_workers = dispatch_workers
+        self.__overflow_policy = overflow_policy
+        self.__reuse_port = reuse_port
+        self.__shared_memory = shared_memory
+        self.__connection_executor: Optional[_ConnectionExecutor] = None
+        self.__message_dispatcher: Optional[_MessageDispatcher] = None
         self.__listener_thread = None
+        self.__request_handler: Optional[Callable[..., Optional[dict]]] = None
 
         self.__on_listening_started = Event(source=Receiver)
         self.__on_listening_stopped = Event(source=Receiver)
         self.__on_client_connected = Event(source=Receiver, client_id=int)
         self.__on_client_disconnected = Event(source=Receiver, client_id=int)
         self.__on_message_received = Event(source=Receiver, client_id=int, message=dict)
+        self.__on_message_chunk = Event(source=Receiver, client_id=int, chunk=MessageChunk)
 
         self.__logger = create_logger(self.__str_name)
+        self.__metrics = Metrics(self.__str_name)
 
     @property
-    def host(self) -> str:
-        return self.__host
+    def host(self) -> Optional[str]:
+        return None if Endpoint.is_unix(self.__port) else self.__host
 
     @property
-    def port(self) -> int:
+    def port(self) -> Optional[int]:
         return self.__port
 
+    @property
+    def unix_path(self) -> Optional[str]:
+        return self.__host if Endpoint.is_unix(self.__port) else None
+
+    @property
+    def keep_alive(self) -> bool:
+        return self.__keep_alive
+
+    @property
+    def backlog(self) -> Optional[int]:
+        return self.__backlog
+
+    @property
+    def reuse_port(self) -> bool:
+        # binds with SO_REUSEPORT, so several receivers (processes) can listen on the same port
+        # and the kernel balances the incoming connections between them
+        return self.__reuse_port
+
+    @property
+    def shared_memory(self) -> bool:
+        # Maps the shared memory segments of "sm"/"sb" fields sent by a Sender with shared_memory_threshold.
+        # They are accepted only over Unix domain sockets and loopback TCP connections; a message with
+        # such fields from any other connection, or to a receiver without this option, fails to decode.
+        return self.__shared_memory
+
+    @property
+    def progressive_threshold(self) -> Optional[int]:
+        # Chunked messages with at least this many data bytes are consumed progressively: their "nd" array
+        # fields are passed to on_message_chunk piece by piece as they arrive and are left out of the
+        # message given to on_message_received, which follows the chunks of the same client. Sender sends
+        # all uncompressed ndarrays of chunked messages as "nd" fields, 2-D and 3-D float and int ones too.
+        return self.__progressive_threshold
+
+    @property
+    def file_directory(self) -> Optional[str]:
+        # If set, "fd" (file) fields are written directly into new files in this directory while being
+        # received and are given to on_message_received as np.memmap over the file. The files are owned
+        # by the application, which removes them when no longer needed (see np.memmap.filename).
+        return self.__file_directory
+
+    @property
+    def spill_threshold(self) -> Optional[int]:
+        # Messages with at least this many data bytes are received into an anonymous temporary file
+        # instead of memory; their array fields are decoded as copy-on-write memory-mapped views of it,
+        # so memory used per connection stays bounded by the page cache, not by the message size.
+        return self.__spill_threshold
+
+    @property
+    def spill_directory(self) -> Optional[str]:
+        # directory of the spill files, the system temporary directory by default
+        return self.__spill_directory
+
+    @property
+    def dispatch_queue_size(self) -> Optional[int]:
+        # If set, decoded messages are put into a queue of this capacity and on_message_received is invoked
+        # by dispatch_workers handler threads, so slow handlers do not stall reading of the sockets.
+        # A full queue behaves according to overflow_policy; BLOCK stops reading, so TCP backpressure
+        # slows the senders down. With a single worker, messages are handled in the order of reception.
+        return self.__dispatch_queue_size
+
+    @property
+    def overflow_policy(self) -> str:
+        return self.__overflow_policy
+
+    @property
+    def dispatch_stats(self) -> Dict[str, int]:
+        if self.__message_dispatcher is None:
+            return _MessageDispatcher.empty_stats(self.__dispatch_queue_size)
+        return self.__message_dispatcher.stats()
+
+    @property
+    def executor_stats(self) -> Dict[str, int]:
+        if self.__connection_executor is None:
+            return _ConnectionExecutor.empty_stats()
+        return self.__connection_executor.stats()
+
+    @property
+    def metrics(self) -> Metrics:
+        return self.__metrics
+
+    def stats(self) -> Dict:
+        # messages_received, replies_sent, bytes_received, connections_accepted, connections_active,
+        # decode_seconds and handler_seconds histograms, errors by kind, and the executor and dispatch
+        # queue state
+        ret = self.__metrics.snapshot()
+        ret["executor"] = self.executor_stats
+        ret["dispatch"] = self.dispatch_stats
+        return ret
+
+    @property
+    def request_handler(self) -> Optional[Callable[..., Optional[dict]]]:
+        return self.__request_handler
+
+    def set_request_handler(self, request_handler: Optional[Callable[..., Optional[dict]]]) -> 'Receiver':
+        # Requests of a Requester are given to request_handler(source, client_id, message), which returns
+        # the reply dict (None for an empty one) instead of to on_message_received. An exception of the
+        # handler, or a request dropped by a full dispatch queue, is sent back and fails the call.
+        # The Requester keeps its connection open, so the receiver must run in keep-alive mode; with
+        # dispatch workers, replies are sent in the order the requests finish.
+        EAssert.Argument.is_true(request_handler is None or callable(request_handler), "request_handler")
+        EAssert.Argument.is_true(request_handler is None or self.__keep_alive, "Request handling needs keep_alive.")
+        self.__request_handler = request_handler
+        return self
+
     @property
     def on_listening_started(self) -> Event:
         return self.__on_listening_started
@@ -56,9 +219,18 @@ class Receiver:
     def on_message_received(self) -> Event:
         return self.__on_message_received
 
+    @property
+    def on_message_chunk(self) -> Event:
+        return self.__on_message_chunk
+
     def start_async(self):
         EAssert.Argument.is_false(self.is_running)
-        self.__listener_thread = _ListenerThread(self)
+        self.__connection_executor = _ConnectionExecutor(
+            self.__executor, self.__max_workers, self.__max_pending_connections, self.__str_name)
+        if self.__dispatch_queue_size is not None:
+            self.__message_dispatcher = _MessageDispatcher(
+                self, self.__dispatch_queue_size, self.__dispatch_workers, self.__overflow_policy)
+        self.__listener_thread = _ListenerThread(self, self.__connection_executor, self.__message_dispatcher)
         self.__logger.debug("Starting")
         self.__listener_thread.start()
         self.__logger.info(f"Started")
@@ -84,16 +256,25 @@ class _ListenerThread(threading.Thread):
     STATE_OFF = 0
     NEXT_CLIENT_ID = 1
 
-    def __init__(self, parent: Receiver):
+    def __init__(self, parent: Receiver, connection_executor: '_ConnectionExecutor',
+                 message_dispatcher: Optional['_MessageDispatcher']):
         super().__init__()
         self.__parent = parent
-        self.__socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.__connection_executor = connection_executor
+        self.__message_dispatcher = message_dispatcher
+        self.__host = parent.host if parent.unix_path is None else parent.unix_path
+        self.__socket = Endpoint.create_socket(parent.port)
         self.__logger = create_logger(str(parent) + ".TL")
         self.__logger.info("Binding port")
+        if self.__parent.reuse_port:
+            self.__socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         try:
-            self.__socket.bind((self.__parent.host, self.__parent.port))
+            if Endpoint.is_unix(parent.port):
+                Endpoint.remove_stale_unix_socket(self.__host)
+            self.__socket.bind(Endpoint.to_address(self.__host, parent.port))
         except Exception as ex:
-            raise PyNetException(f"Failed to open receiver at {self.__parent.host}:{self.__parent.port}.", ex)
+            self.__socket.close()
+            raise PyNetException(f"Failed to open receiver at {Endpoint.to_str(self.__host, parent.port)}.", ex)
         self.__logger.info("Port bound")
         self.__state = _ListenerThread.STATE_OFF
 
@@ -101,15 +282,23 @@ class _ListenerThread(threading.Thread):
         self.__logger.info("Running")
         self.__state = _ListenerThread.STATE_RUNNING
         self.__logger.info("Starting listening")
-        self.__socket.listen()
+        if self.__parent.backlog is None:
+            self.__socket.listen()
+        else:
+            self.__socket.listen(self.__parent.backlog)
         self.__logger.info("Listening")
         self.__parent.on_listening_started.invoke(source=self.__parent)
 
         while self.__state == _ListenerThread.STATE_RUNNING:
+            if not self.__connection_executor.wait_for_capacity(lambda: self.__state == _ListenerThread.STATE_RUNNING):
+                break
             try:
                 self.__logger.debug("Waiting for a client")
                 conn, addr = self.__socket.accept()
             except OSError as e:
+                self.__connection_executor.cancel_capacity()
+                if self.__state != _ListenerThread.STATE_RUNNING:
+                    break
                 self.__logger.warning(f"Waiting for a client throws an error {e}")
                 EAssert.is_true(e.errno == 10038,
                                 f"Unexpected error {e.errno} when accepting on socket.")
@@ -117,14 +306,22 @@ class _ListenerThread(threading.Thread):
 
             client_id = _ListenerThread.NEXT_CLIENT_ID
             _ListenerThread.NEXT_CLIENT_ID += 1
-            self.__logger.debug(f"Got a client {client_id}")
+            if self.__logger.isEnabledFor(logging.DEBUG):
+                self.__logger.debug(f"Got a client {client_id}")
+            self.__parent.metrics.count("connections_accepted")
             self.__parent.on_client_connected.invoke(source=self.__parent, client_id=client_id)
 
-            thr = _ConnectionReaderThread(conn, addr, client_id, self.__parent)
-            thr.start()
-            self.__logger.debug(f"Client {client_id} processing started")
+            reader = _ConnectionReader(conn, addr, client_id, self.__parent, self.__message_dispatcher)
+            self.__connection_executor.submit(reader)
+            if self.__logger.isEnabledFor(logging.DEBUG):
+                self.__logger.debug(f"Client {client_id} processing scheduled")
 
         self.__socket = None
+        if Endpoint.is_unix(self.__parent.port):
+            Endpoint.remove_unix_socket(self.__host)
+        self.__connection_executor.shutdown()
+        if self.__message_dispatcher is not None:
+            self.__message_dispatcher.shutdown()
         self.__logger.info("Stopping")
         self.__parent.on_listening_stopped.invoke(source=self.__parent)
         self.__logger.info("Stopped")
@@ -132,85 +329,626 @@ class _ListenerThread(threading.Thread):
     def break_listening(self):
         self.__state = _ListenerThread.STATE_STOPPING
         self.__logger.info("Closing socket")
-        self.__socket.close()
+        listening_socket = self.__socket
+        try:
+            # on Linux, closing the socket alone does not wake up the thread blocked in accept()
+            listening_socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        listening_socket.close()
         self.__logger.info("Socket closed")
 
     # def __str__(self):
     #     return self.__str_id
 
 
-class _ConnectionReaderThread(threading.Thread):
+class _ConnectionExecutor:
+    CAPACITY_POLL_INTERVAL = 0.5
+
+    def __init__(self, executor: Optional[Executor], max_workers: Optional[int],
+                 max_pending_connections: Optional[int], name: str):
+        self.__owns_executor = executor is None and max_workers is not None
+        if self.__owns_executor:
+            executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self.__executor = executor
+        self.__max_workers = max_workers
+        self.__logger = create_logger(name + ".CE")
+
+        # bounds connections accepted but not finished; the listener stops accepting and the kernel backlog fills
+        self.__capacity = None
+        if max_pending_connections is not None:
+            self.__capacity = threading.BoundedSemaphore(max_workers + max_pending_connections)
+
+        self.__lock = threading.Lock()
+        self.__queued = 0
+        self.__active = 0
+        self.__completed = 0
+
+    def wait_for_capacity(self, is_running) -> bool:
+        if self.__capacity is None:
+            return True
+        while is_running():
+            if self.__capacity.acquire(timeout=_ConnectionExecutor.CAPACITY_POLL_INTERVAL):
+                return True
+        return False
+
+    def cancel_capacity(self) -> None:
+        if self.__capacity is not None:
+            self.__capacity.release()
+
+    def submit(self, reader: '_ConnectionReader') -> None:
+        with self.__lock:
+            self.__queued += 1
+        if self.__executor is None:
+            threading.Thread(target=self.__run, args=(reader,)).start()
+        else:
+            # an executor keeps the exception in the future, where nobody would see it
+            self.__executor.submit(self.__run, reader).add_done_callback(self.__log_failure)
 
-    def __init__(self, conn, addr, client_id: int, parent: Receiver):
-        super().__init__()
+    def __run(self, reader: '_ConnectionReader') -> None:
+        with self.__lock:
+            self.__queued -= 1
+            self.__active += 1
+        try:
+            reader.run()
+        finally:
+            with self.__lock:
+                self.__active -= 1
+                self.__completed += 1
+            self.cancel_capacity()
+
+    def __log_failure(self, future: Future) -> None:
+        if not future.cancelled() and future.exception() is not None:
+            self.__logger.error(f"Connection reader failed: {future.exception()!r}")
+
+    def shutdown(self) -> None:
+        if self.__owns_executor:
+            self.__executor.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, int]:
+        with self.__lock:
+            ret = {
+                "max_workers": self.__max_workers,
+                "queued": self.__queued,
+                "active": self.__active,
+                "completed": self.__completed
+            }
+        return ret
+
+    @staticmethod
+    def empty_stats() -> Dict[str, int]:
+        ret = {"max_workers": None, "queued": 0, "active": 0, "completed": 0}
+        return ret
+
+
+class _MessageDispatcher:
+    # bounded queue of decoded messages between the connection readers and the handler threads
+
+    def __init__(self, parent: Receiver, capacity: int, workers: int, overflow_policy: str):
+        self.__parent = parent
+        self.__capacity = capacity
+        self.__overflow_policy = overflow_policy
+        self.__queue = collections.deque()
+        self.__condition = threading.Condition()
+        self.__is_running = True
+        self.__dispatched = 0
+        self.__dropped = 0
+        # messages of each client queued or being handled, and clients that disconnected meanwhile;
+        # on_client_disconnected waits until the last message of the client is handled
+        self.__pending: Dict[int, int] = {}
+        self.__disconnected = set()
+        self.__logger = create_logger(str(parent) + ".DS")
+
+        self.__threads = [
+            threading.Thread(target=self.__run, name=f"{parent}.DS{i}", daemon=True) for i in range(workers)]
+        for thread in self.__threads:
+            thread.start()
+
+    def dispatch(self, client_id: int, message: dict, reply: Optional[Callable[[dict], None]] = None) -> None:
+        disconnected = None
+        dropped_replies = []
+        with self.__condition:
+            if len(self.__queue) >= self.__capacity:
+                if self.__overflow_policy == OverflowPolicy.DROP_OLDEST:
+                    oldest_client_id, _, oldest_reply = self.__queue.popleft()
+                    self.__count_dropped()
+                    dropped_replies.append(oldest_reply)
+                    disconnected = self.__finish(oldest_client_id)
+                elif self.__overflow_policy == OverflowPolicy.BLOCK:
+                    while len(self.__queue) >= self.__capacity and self.__is_running:
+                        self.__condition.wait()
+            # the handler threads finish once the queue is empty after shutdown, nothing would handle the message
+            if len(self.__queue) >= self.__capacity or not self.__is_running:
+                self.__count_dropped()
+                dropped_replies.append(reply)
+            else:
+                self.__queue.append((client_id, message, reply))
+                self.__pending[client_id] = self.__pending.get(client_id, 0) + 1
+                self.__condition.notify_all()
+        for dropped_reply in dropped_replies:
+            if dropped_reply is not None:
+                self.__reply_dropped(dropped_reply)
+        if disconnected is not None:
+            _MessageDispatcher.invoke_client_disconnected(self.__parent, disconnected)
+
+    def __reply_dropped(self, reply: Callable[[dict], None]) -> None:
+        # the Requester would otherwise wait for the reply until its call timed out
+        try:
+            reply({MessageFraming.ERROR_KEY: "Request dropped by the dispatch queue of the receiver."})
+        except OSError as e:
+            self.__logger.warning(f"Failed to reply to a dropped request: {e}")
+
+    def client_disconnected(self, client_id: int) -> None:
+        with self.__condition:
+            if client_id in self.__pending:
+                self.__disconnected.add(client_id)
+                return
+        _MessageDispatcher.invoke_client_disconnected(self.__parent, client_id)
+
+    def __count_dropped(self) -> None:
+        self.__dropped += 1
+        self.__parent.metrics.count("messages_dropped")
+
+    def __finish(self, client_id: int) -> Optional[int]:
+        # returns the client id if its disconnection is to be announced now
+        self.__pending[client_id] -= 1
+        if self.__pending[client_id] > 0:
+            return None
+        del self.__pending[client_id]
+        if client_id not in self.__disconnected:
+            return None
+        self.__disconnected.remove(client_id)
+        return client_id
+
+    def __run(self) -> None:
+        while True:
+            with self.__condition:
+                while len(self.__queue) == 0 and self.__is_running:
+                    self.__condition.wait()
+                if len(self.__queue) == 0:
+                    break
+                client_id, message, reply = self.__queue.popleft()
+                self.__condition.notify_all()
+
+            try:
+                if reply is None:
+                    _MessageDispatcher.invoke_handlers(self.__parent, client_id, message)
+                else:
+                    _MessageDispatcher.invoke_request_handler(self.__parent, client_id, message, reply)
+            except Exception as e:
+                self.__logger.error(f"Message handler of client {client_id} failed: {e}")
+            with self.__condition:
+                self.__dispatched += 1
+                disconnected = self.__finish(client_id)
+            if disconnected is not None:
+                _MessageDispatcher.invoke_client_disconnected(self.__parent, disconnected)
+
+    @staticmethod
+    def invoke_client_disconnected(parent: Receiver, client_id: int) -> None:
+        parent.on_client_disconnected.invoke(source=parent, client_id=client_id)
+
+    @staticmethod
+    def invoke_handlers(parent: Receiver, client_id: int, message: dict) -> None:
+        start = time.perf_counter()
+        try:
+            parent.on_message_received.invoke(source=parent, client_id=client_id, message=message)
+        except Exception as e:
+            parent.metrics.error("handler:" + Metrics.error_kind(e))
+            raise
+        finally:
+            parent.metrics.observe("handler_seconds", time.perf_counter() - start)
+
+    @staticmethod
+    def invoke_request_handler(parent: Receiver, client_id: int, message: dict,
+                               reply: Callable[[dict], None]) -> None:
+        start = time.perf_counter()
+        try:
+            if parent.request_handler is None:
+                raise PyNetException("Receiver has no request handler.")
+            response = parent.request_handler(source=parent, client_id=client_id, message=message)
+            response = {} if response is None else dict(response)
+        except Exception as e:
+            parent.metrics.error("handler:" + Metrics.error_kind(e))
+            response = {MessageFraming.ERROR_KEY: f"{type(e).__name__}: {e}"}
+        finally:
+            parent.metrics.observe("handler_seconds", time.perf_counter() - start)
+        reply(response)
+
+    def shutdown(self) -> None:
+        # queued messages are still handled, then the handler threads finish
+        with self.__condition:
+            self.__is_running = False
+            self.__condition.notify_all()
+
+    def stats(self) -> Dict[str, int]:
+        with self.__condition:
+            ret = {
+                "capacity": self.__capacity,
+                "depth": len(self.__queue),
+                "dispatched": self.__dispatched,
+                "dropped": self.__dropped
+            }
+        return ret
+
+    @staticmethod
+    def empty_stats(capacity: Optional[int]) -> Dict[str, int]:
+        ret = {"capacity": capacity, "depth": 0, "dispatched": 0, "dropped": 0}
+        return ret
+
+
+class _ConnectionReader:
+    READ_BLOCK_SIZE = 1024 * 1024
+
+    def __init__(self, conn, addr, client_id: int, parent: Receiver,
+                 message_dispatcher: Optional['_MessageDispatcher'] = None):
         self.__conn = conn
         self.__addr = addr
         self.__client_id = client_id
         self.__parent = parent
+        self.__message_dispatcher = message_dispatcher
+        self.__metrics = parent.metrics
+        self.__received_bytes = 0
+        # replies may be sent by several dispatch workers at once
+        self.__write_lock = threading.Lock()
+        # arrays last received by key, which deltas of a Sender with delta encoding apply to
+        self.__delta_bases: Dict[str, np.ndarray] = {}
+        self.__accepts_shared_memory = parent.shared_memory and Endpoint.is_local_peer(conn)
         self.__logger = create_logger(str(parent) + ".RD")
+        # evaluated once per connection, so per-message debug logging costs a single check when it is off
+        self.__is_debug = self.__logger.isEnabledFor(logging.DEBUG)
 
-    def __read_intro_bytes(self) -> Tuple[int, int]:
-        key_len_bytes = self.__conn.recv(4)
-        if len(key_len_bytes) == 0:
-            return 0, 0
-        else:
-            body_len_bytes = self.__conn.recv(4)
-
-        EAssert.is_true(len(key_len_bytes) == 4)
-        EAssert.is_true(len(body_len_bytes) == 4)
-        key_len = BitUtilities.Int.bytes_to_value(key_len_bytes)
-        body_len = BitUtilities.Int.bytes_to_value(body_len_bytes)
-
-        return key_len, body_len
-
-    def __read_out_byte_block(self, target_length: int) -> bytes:
-        data = bytearray(target_length)
-        remaining_bytes = target_length
-        while remaining_bytes > 0:
-            block_length = min(remaining_bytes, _ListenerThread.BUFFER_SIZE)
-            block = self.__conn.recv(block_length)
-            if len(block) < block_length:
-                raise PyNetException("Connection contains no data. Mismatch?")
-            start_index = target_length - remaining_bytes
-            data[start_index:start_index + block_length] = block
-            remaining_bytes -= block_length
-        ret = bytes(data)
+    def __read_intro_bytes(self) -> Optional[Tuple[int, int]]:
+        intro = bytearray(MessageFraming.INTRO_LENGTH)
+        received = self.__read_into(memoryview(intro))
+        if received == 0:
+            return None
+        EAssert.is_true(received == len(intro), "Connection closed while reading message lengths.")
+
+        ret = MessageFraming.decode_intro(intro)
         return ret
 
-    def run(self):
-        self.__logger.info("Client connected - run")
+    def __read_into(self, target: memoryview) -> int:
+        received = 0
+        target_length = len(target)
+        while received < target_length:
+            block_length = self.__conn.recv_into(target[received:], target_length - received)
+            if block_length == 0:
+                break
+            received += block_length
+        self.__received_bytes += received
+        return received
+
+    def __read_out_byte_block(self, target_length: int) -> memoryview:
+        data = memoryview(bytearray(target_length))
+        if self.__read_into(data) < target_length:
+            raise PyNetException("Connection contains no data. Mismatch?")
+        return data
+
+    def __read_message(self) -> Optional[dict]:
+        if self.__is_debug:
+            self.__logger.debug("Reading lengths")
+        lengths = self.__read_intro_bytes()
+        if lengths is None:
+            return None
+        header_length, data_length = lengths
+        if header_length == MessageFraming.CHUNKED_MARKER:
+            return self.__read_chunked_message(data_length)
+
+        if self.__parent.file_directory is not None or self.__is_spilled(data_length):
+            header_bytes = self.__read_out_byte_block(header_length)
+            if self.__parent.file_directory is not None:
+                header = MessageFraming.parse_header(header_bytes)
+                if any(q[1].startswith("fd") for q in header.fields):
+                    return self.__read_fields(header, iter((data_length,)), False)
+            if self.__is_spilled(data_length):
+                data_bytes = self.__spill_data(data_length, self.__iter_blocks(data_length))
+            else:
+                data_bytes = self.__read_out_byte_block(data_length)
+        else:
+            if self.__is_debug:
+                self.__logger.debug("Reading header and data")
+            message_bytes = self.__read_out_byte_block(header_length + data_length)
+            header_bytes = message_bytes[:header_length]
+            data_bytes = message_bytes[header_length:]
+
+        if self.__is_debug:
+            self.__logger.debug("Decoding message")
+        message = self.__decode_message(header_bytes, data_bytes)
+        return message
+
+    def __decode_message(self, header_bytes: memoryview, data_bytes: memoryview) -> dict:
+        start = time.perf_counter()
+        ret = MessageFraming.decode_message(header_bytes, data_bytes, self.__accepts_shared_memory)
+        self.__metrics.observe("decode_seconds", time.perf_counter() - start)
+        return ret
 
-        self.__logger.debug("Reading lengths")
-        header_length, data_length = self.__read_intro_bytes()
-        self.__logger.debug("Reading header")
+    def __read_chunked_message(self, header_length: int) -> dict:
+        if self.__is_debug:
+            self.__logger.debug("Reading chunked message")
+        data_length = MessageFraming.decode_chunked_intro_tail(
+            self.__read_out_byte_block(MessageFraming.CHUNKED_INTRO_TAIL_LENGTH))
         header_bytes = self.__read_out_byte_block(header_length)
-        self.__logger.debug("Reading data")
-        data_bytes = self.__read_out_byte_block(data_length)
+        threshold = self.__parent.progressive_threshold
+        is_progressive = threshold is not None and data_length >= threshold
+        if is_progressive or self.__parent.file_directory is not None:
+            header = MessageFraming.parse_header(header_bytes)
+            if is_progressive or any(q[1].startswith("fd") for q in header.fields):
+                return self.__read_fields(header, self.__iter_chunk_lengths(data_length), is_progressive)
+
+        if self.__is_spilled(data_length):
+            data_bytes = self.__spill_data(data_length, self.__iter_chunks(data_length))
+            if self.__is_debug:
+                self.__logger.debug("Decoding message")
+            return self.__decode_message(header_bytes, data_bytes)
+
+        data_bytes = memoryview(bytearray(data_length))
+        position = 0
+        while position < data_length:
+            chunk_length = MessageFraming.decode_chunk_intro(
+                self.__read_out_byte_block(MessageFraming.CHUNK_INTRO_LENGTH), data_length - position)
+            if self.__read_into(data_bytes[position:position + chunk_length]) < chunk_length:
+                raise PyNetException("Connection closed while reading a message chunk.")
+            position += chunk_length
+
+        if self.__is_debug:
+            self.__logger.debug("Decoding message")
+        message = self.__decode_message(header_bytes, data_bytes)
+        return message
+
+    def __is_spilled(self, data_length: int) -> bool:
+        threshold = self.__parent.spill_threshold
+        ret = threshold is not None and data_length >= threshold
+        return ret
 
-        self.__logger.debug("Decoding message")
-        message = self.__expand_header_bytes_to_dictionary(header_bytes, data_bytes)
+    def __spill_data(self, data_length: int, blocks: Iterator[memoryview]) -> memoryview:
+        if self.__is_debug:
+            self.__logger.debug(f"Spilling {data_length} bytes of message data to disk")
+        with tempfile.TemporaryFile(prefix="pynet_", dir=self.__parent.spill_directory) as file:
+            for block in blocks:
+                file.write(block)
+            file.flush()
+            # the mapping stays valid after the file is closed and removed; decoded arrays are views of it
+            ret = memoryview(np.memmap(file, dtype=np.uint8, mode="c", shape=(data_length,)))
+        return ret
 
-        self.__logger.debug("Invoking listener")
-        self.__parent.on_message_received.invoke(source=self.__parent, client_id=self.__client_id, message=message)
+    def __iter_chunk_lengths(self, data_length: int) -> Iterator[int]:
+        # reads the intro of each chunk; the chunk data is to be read by the consumer before the next one
+        position = 0
+        while position < data_length:
+            chunk_length = MessageFraming.decode_chunk_intro(
+                self.__read_out_byte_block(MessageFraming.CHUNK_INTRO_LENGTH), data_length - position)
+            position += chunk_length
+            yield chunk_length
+
+    def __iter_chunks(self, data_length: int) -> Iterator[memoryview]:
+        # chunks are read into a single reusable buffer; consumers must not keep the yielded views
+        chunk_buffer = bytearray()
+        for chunk_length in self.__iter_chunk_lengths(data_length):
+            if len(chunk_buffer) < chunk_length:
+                chunk_buffer = bytearray(chunk_length)
+            chunk = memoryview(chunk_buffer)[:chunk_length]
+            if self.__read_into(chunk) < chunk_length:
+                raise PyNetException("Connection closed while reading a message chunk.")
+            yield chunk
+
+    def __iter_blocks(self, data_length: int) -> Iterator[memoryview]:
+        block_buffer = memoryview(bytearray(min(data_length, _ConnectionReader.READ_BLOCK_SIZE)))
+        position = 0
+        while position < data_length:
+            block = block_buffer[:min(len(block_buffer), data_length - position)]
+            if self.__read_into(block) < len(block):
+                raise PyNetException("Connection closed while reading message data.")
+            position += len(block)
+            yield block
+
+    def __read_fields(self, header, spans: Iterator[int], is_progressive: bool) -> dict:
+        # spans are the lengths of the consecutive parts of the message data on the connection (the whole
+        # data, or its chunks); fields are received straight into their buffers or files, streamed ones
+        # through a block buffer
+        if self.__is_debug:
+            self.__logger.debug("Reading message data field by field")
+        MessageFraming.check_shared_memory(header, self.__accepts_shared_memory)
+        on_chunk = self.__invoke_message_chunk if is_progressive else None
+        fields = []
+        block_buffer = None
 
-        left_bytes = self.__conn.recv(_ListenerThread.BUFFER_SIZE)
-        EAssert.is_true(0 == len(left_bytes), f"Unexpectingly, there are some data left in the incoming connection")
+        try:
+            for field in header.fields:
+                fields.append(_FieldReader(*field, on_chunk, self.__parent.file_directory))
+            position = 0
+            field_index = 0
+            for span_length in spans:
+                span_end = position + span_length
+                while position < span_end:
+                    while field_index < len(fields) and fields[field_index].end <= position:
+                        field_index += 1
+                    field = fields[field_index] if field_index < len(fields) else None
+                    length = span_end - position if field is None else min(field.end, span_end) - position
+                    if field is None or field.is_streamed:
+                        # data beyond the fields is read and dropped
+                        if block_buffer is None:
+                            block_buffer = memoryview(bytearray(_ConnectionReader.READ_BLOCK_SIZE))
+                        target = block_buffer[:min(length, len(block_buffer))]
+                    else:
+                        target = field.target(length)
+                    if self.__read_into(target) < len(target):
+                        raise PyNetException("Connection closed while reading message data.")
+                    if field is not None and field.is_streamed:
+                        field.feed(target)
+                    position += len(target)
+
+            start = time.perf_counter()
+            message = {}
+            for field in fields:
+                if not field.is_streamed:
+                    message[field.key] = field.value()
+            self.__metrics.observe("decode_seconds", time.perf_counter() - start)
+        except BaseException:
+            for field in fields:
+                field.discard()
+            raise
+        return message
+
+    def __invoke_message_chunk(self, chunk: MessageChunk) -> None:
+        self.__parent.on_message_chunk.invoke(source=self.__parent, client_id=self.__client_id, chunk=chunk)
 
-        self.__logger.debug("Invoking client disconnected")
-        self.__parent.on_client_disconnected.invoke(source=self.__parent, client_id=self.__client_id)
+    def run(self):
+        self.__logger.info("Client connected - run")
+        self.__metrics.gauge("connections_active", 1)
+        try:
+            self.__run()
+        finally:
+            self.__metrics.gauge("connections_active", -1)
         self.__logger.info("Client connected - run finished")
 
-    def __expand_header_bytes_to_dictionary(self, header_bytes: bytes, data_bytes: bytes) -> dict:
-        tmp = header_bytes.decode('UTF-8')
-        pts = tmp.split(';')
-        ret = {}
+    def __run(self):
+        # the connection is closed and the disconnection reported also when reading or a handler fails
+        try:
+            self.__read_messages()
+        finally:
+            self.__conn.close()
+            if self.__is_debug:
+                self.__logger.debug("Invoking client disconnected")
+            if self.__message_dispatcher is None:
+                _MessageDispatcher.invoke_client_disconnected(self.__parent, self.__client_id)
+            else:
+                self.__message_dispatcher.client_disconnected(self.__client_id)
+
+    def __read_messages(self):
+        while True:
+            try:
+                message = self.__read_message()
+                if message is not None:
+                    DeltaEncoding.resolve(self.__delta_bases, message)
+            except Exception as e:
+                self.__metrics.error(Metrics.error_kind(e))
+                raise
+            finally:
+                self.__metrics.count("bytes_received", self.__received_bytes)
+                self.__received_bytes = 0
+            if message is None:
+                if self.__is_debug:
+                    self.__logger.debug("Connection closed by client")
+                break
+            self.__metrics.count("messages_received")
+
+            correlation_id = message.pop(MessageFraming.CORRELATION_ID_KEY, None)
+            reply = None if correlation_id is None else self.__create_reply(correlation_id)
+            if self.__message_dispatcher is None:
+                if self.__is_debug:
+                    self.__logger.debug("Invoking listener")
+                if reply is None:
+                    _MessageDispatcher.invoke_handlers(self.__parent, self.__client_id, message)
+                else:
+                    _MessageDispatcher.invoke_request_handler(self.__parent, self.__client_id, message, reply)
+            else:
+                if self.__is_debug:
+                    self.__logger.debug("Dispatching message")
+                self.__message_dispatcher.dispatch(self.__client_id, message, reply)
+
+            if not self.__parent.keep_alive:
+                left_bytes = self.__conn.recv(_ListenerThread.BUFFER_SIZE)
+                EAssert.is_true(0 == len(left_bytes),
+                                f"Unexpectingly, there are some data left in the incoming connection")
+                break
+
+    def __create_reply(self, correlation_id: int) -> Callable[[dict], None]:
+        def reply(response: dict) -> None:
+            response[MessageFraming.CORRELATION_ID_KEY] = correlation_id
+            try:
+                frame = MessageFraming.encode_frame(response)
+            except Exception as e:
+                self.__metrics.error(Metrics.error_kind(e))
+                frame = MessageFraming.encode_frame({
+                    MessageFraming.ERROR_KEY: f"Failed to serialize reply: {e}",
+                    MessageFraming.CORRELATION_ID_KEY: correlation_id})
+            with self.__write_lock:
+                self.__conn.sendall(frame)
+            self.__metrics.count("replies_sent")
+        return reply
+
+
+class _FieldReader:
+    # Consumes the data of a single field as it arrives: "nd" array fields of progressive messages are
+    # streamed in whole rows, "fd" fields are received into a mapped file if a file directory is set and
+    # the rest is received into a buffer and decoded at the end.
+
+    def __init__(self, key: str, type_id: str, to_value, start: int, end: int, on_chunk=None,
+                 file_directory: Optional[str] = None):
+        self.key = key
+        self.start = start
+        self.end = end
+        self.__type_id = type_id
+        self.__to_value = to_value
+        self.__on_chunk = on_chunk
+        self.__offset = 0
+
+        self.__dtype = None
+        self.__shape = None
+        self.__row_length = 0
+        self.__file_name = None
+        if on_chunk is not None and type_id.startswith("nd"):
+            _, self.__dtype, self.__shape = PyNetEncoderManager.parse_nd_array_type_id(type_id)
+            self.__row_length = int(np.prod(self.__shape[1:])) * self.__dtype.itemsize
+        self.is_streamed = self.__row_length > 0 and end > start
+
+        if self.is_streamed:
+            self.__carry = bytearray()
+        elif file_directory is not None and type_id.startswith("fd") and end > start:
+            _, self.__dtype, self.__shape = PyNetEncoderManager.parse_nd_array_type_id(type_id)
+            handle, file_name = tempfile.mkstemp(prefix="pynet_", suffix=".bin", dir=file_directory)
+            try:
+                os.ftruncate(handle, end - start)
+                self.__buffer = memoryview(np.memmap(file_name, dtype=np.uint8, mode="r+", shape=(end - start,)))
+            except BaseException:
+                os.remove(file_name)
+                raise
+            finally:
+                os.close(handle)
+            self.__file_name = file_name
+        else:
+            self.__buffer = memoryview(bytearray(end - start))
 
-        data_start_index = 0
-        for pt in pts:
-            kv = pt.split(':')
-            key = kv[0]
-            value, used_bytes = PyNetEncoderManager.decode(kv[1], data_bytes[data_start_index:])
-            data_start_index += used_bytes
-            ret[key] = value
+    def target(self, length: int) -> memoryview:
+        # the next length bytes of a field that is not streamed, to be received into
+        ret = self.__buffer[self.__offset:self.__offset + length]
+        self.__offset += length
+        return ret
 
+    def feed(self, piece: memoryview) -> None:
+        # the next piece of a streamed field
+        if len(self.__carry) > 0:
+            missing = self.__row_length - len(self.__carry)
+            self.__carry += piece[:missing]
+            piece = piece[missing:]
+            if len(self.__carry) < self.__row_length:
+                return
+            self.__emit(memoryview(self.__carry))
+            self.__carry = bytearray()
+
+        whole_length = len(piece) - len(piece) % self.__row_length
+        if whole_length > 0:
+            self.__emit(piece[:whole_length])
+        self.__carry += piece[whole_length:]
+
+    def __emit(self, data: memoryview) -> None:
+        chunk = MessageChunk(self.key, self.__type_id, self.__offset, self.end - self.start, data,
+                             self.__dtype, self.__shape)
+        self.__offset += len(data)
+        self.__on_chunk(chunk)
+
+    def value(self):
+        if self.__file_name is not None:
+            self.__buffer.obj.flush()
+            self.__buffer = None
+            ret = np.memmap(self.__file_name, dtype=self.__dtype, mode="r+", shape=self.__shape)
+            self.__file_name = None
+            return ret
+        ret = self.__to_value(self.__buffer)
         return ret
+
+    def discard(self) -> None:
+        if self.__file_name is not None:
+            self.__buffer = None
+            os.remove(self.__file_name)
+            self.__file_name = None
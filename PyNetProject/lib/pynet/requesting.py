@@ -0,0 +1,228 @@
+from concurrent.futures import Future, InvalidStateError
+from lib.esystem.easserting import EAssert
+from lib.esystem.logging_factory import create_logger
+from lib.pynet.encoding import Compression
+from lib.pynet.endpoints import Endpoint
+from lib.pynet.exceptions import PyNetException
+from lib.pynet.framing import MessageFraming
+from lib.pynet.metrics import Metrics
+from typing import Dict, List, Optional, Tuple
+import heapq
+import itertools
+import select
+import socket
+import threading
+import time
+
+
+class Requester:
+    # Sends requests to a Receiver with a request handler and returns futures of their replies. All calls
+    # share one persistent connection and any number of them may be in flight: each request carries
+    # a correlation id, which the reply repeats. A reader thread completes the futures as replies arrive
+    # and fails those whose timeout passed; a broken connection fails all pending calls and the next
+    # call opens a new one. The Receiver must run in keep-alive mode.
+    TIMEOUT_RESOLUTION = 0.05
+
+    def __init__(self, host: Optional[str] = None, port: Optional[int] = None, timeout: Optional[float] = None,
+                 compression: Optional[Compression] = None, unix_path: Optional[str] = None):
+        (host, port) = Endpoint.resolve(host, port, unix_path)
+        EAssert.Argument.is_true(timeout is None or timeout > 0, "timeout")
+
+        self.__host = host
+        self.__port = port
+        self.__timeout = timeout
+        self.__compression = compression
+        self.__socket: Optional[socket.socket] = None
+        # guards the connection, the pending calls and their deadlines
+        self.__lock = threading.Lock()
+        self.__write_lock = threading.Lock()
+        self.__pending: Dict[int, Tuple[Future, float]] = {}
+        self.__deadlines: List[Tuple[float, int]] = []
+        self.__next_correlation_id = itertools.count(1)
+        self.__logger = create_logger(f"Rqst {Endpoint.to_str(host, port)}")
+        self.__metrics = Metrics(f"Rqst {Endpoint.to_str(host, port)}")
+
+    @property
+    def timeout(self) -> Optional[float]:
+        # default timeout of a call in seconds, None for no timeout
+        return self.__timeout
+
+    @property
+    def compression(self) -> Optional[Compression]:
+        return self.__compression
+
+    @property
+    def pending_calls(self) -> int:
+        with self.__lock:
+            return len(self.__pending)
+
+    @property
+    def metrics(self) -> Metrics:
+        return self.__metrics
+
+    def stats(self) -> Dict:
+        # requests_sent, replies_received, late_replies, timeouts, call_seconds histogram and errors by kind
+        return self.__metrics.snapshot()
+
+    def call(self, dictionary: Dict, timeout: Optional[float] = None) -> Future:
+        # The future gives the reply dict, or raises PyNetException if the request handler failed or the
+        # connection broke, and TimeoutError if no reply came within the timeout.
+        EAssert.Argument.is_not_none(dictionary)
+        EAssert.Argument.is_false(MessageFraming.has_reserved_keys(dictionary), "dictionary")
+        timeout = self.__timeout if timeout is None else timeout
+        EAssert.Argument.is_true(timeout is None or timeout > 0, "timeout")
+
+        correlation_id = next(self.__next_correlation_id)
+        message = dict(dictionary)
+        message[MessageFraming.CORRELATION_ID_KEY] = correlation_id
+        try:
+            frame = MessageFraming.encode_frame(message, self.__compression)
+        except Exception as e:
+            self.__metrics.error(Metrics.error_kind(e))
+            raise PyNetException("Failed to serialize message.", e)
+
+        ret = Future()
+        start = time.monotonic()
+        with self.__lock:
+            connection = self.__connect()
+            self.__pending[correlation_id] = (ret, start)
+            if timeout is not None:
+                heapq.heappush(self.__deadlines, (start + timeout, correlation_id))
+        try:
+            with self.__write_lock:
+                connection.sendall(frame)
+        except OSError as e:
+            self.__fail(connection, PyNetException(f"Failed to send request to {self}.", e))
+            return ret
+        self.__metrics.count("requests_sent")
+        return ret
+
+    def close(self) -> None:
+        with self.__lock:
+            connection = self.__socket
+        if connection is not None:
+            self.__fail(connection, PyNetException(f"Requester {self} closed."))
+
+    def __connect(self) -> socket.socket:
+        if self.__socket is not None:
+            return self.__socket
+        connection = Endpoint.create_socket(self.__port)
+        try:
+            connection.connect(Endpoint.to_address(self.__host, self.__port))
+        except Exception as e:
+            connection.close()
+            self.__metrics.error(Metrics.error_kind(e))
+            raise PyNetException(f"Unable to open connection to {self}.", e)
+        self.__socket = connection
+        threading.Thread(target=self.__read_replies, args=(connection,), name=f"{self}.RD", daemon=True).start()
+        self.__metrics.count("connections_opened")
+        return connection
+
+    def __fail(self, connection: socket.socket, error: Exception) -> None:
+        # closes the connection and fails the calls pending on it
+        with self.__lock:
+            if self.__socket is not connection:
+                return
+            self.__socket = None
+            pending = self.__pending
+            self.__pending = {}
+            self.__deadlines = []
+        try:
+            # wakes up the reader thread
+            connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        connection.close()
+        if len(pending) > 0:
+            self.__logger.warning(f"Failing {len(pending)} pending calls: {error}")
+            self.__metrics.error(Metrics.error_kind(error))
+        for future, _ in pending.values():
+            Requester.__complete(future, None, error)
+
+    def __read_replies(self, connection: socket.socket) -> None:
+        error = PyNetException(f"Connection to {self} closed by the receiver.")
+        try:
+            while self.__socket is connection:
+                readable, _, _ = select.select([connection], [], [], Requester.TIMEOUT_RESOLUTION)
+                self.__expire_calls()
+                if len(readable) == 0:
+                    continue
+                reply = self.__read_reply(connection)
+                if reply is None:
+                    break
+                self.__complete_call(reply)
+        except (OSError, ValueError) as e:
+            # ValueError: select() on a socket closed meanwhile
+            error = PyNetException(f"Failed to read reply from {self}.", e)
+        except Exception as e:
+            error = e if isinstance(e, PyNetException) else PyNetException(f"Invalid reply from {self}.", e)
+        self.__fail(connection, error)
+
+    def __read_reply(self, connection: socket.socket) -> Optional[dict]:
+        intro = Requester.__read_exactly(connection, MessageFraming.INTRO_LENGTH)
+        if intro is None:
+            return None
+        header_length, data_length = MessageFraming.decode_intro(intro)
+        if header_length < 0:
+            raise PyNetException("Chunked replies are not supported.")
+        message_bytes = Requester.__read_exactly(connection, header_length + data_length)
+        if message_bytes is None:
+            raise PyNetException("Connection closed while reading a reply.")
+        ret = MessageFraming.decode_message(message_bytes[:header_length], message_bytes[header_length:])
+        return ret
+
+    @staticmethod
+    def __read_exactly(connection: socket.socket, length: int) -> Optional[memoryview]:
+        ret = memoryview(bytearray(length))
+        received = 0
+        while received < length:
+            block_length = connection.recv_into(ret[received:], length - received)
+            if block_length == 0:
+                return None
+            received += block_length
+        return ret
+
+    def __complete_call(self, reply: dict) -> None:
+        correlation_id = reply.pop(MessageFraming.CORRELATION_ID_KEY, None)
+        with self.__lock:
+            entry = self.__pending.pop(correlation_id, None)
+        if entry is None:
+            # the call has timed out already
+            self.__metrics.count("late_replies")
+            return
+        future, start = entry
+        self.__metrics.count("replies_received")
+        self.__metrics.observe("call_seconds", time.monotonic() - start)
+        error = reply.pop(MessageFraming.ERROR_KEY, None)
+        if error is None:
+            Requester.__complete(future, reply, None)
+        else:
+            self.__metrics.error("remote")
+            Requester.__complete(future, None, PyNetException(f"Request failed on the receiver: {error}"))
+
+    def __expire_calls(self) -> None:
+        now = time.monotonic()
+        expired = []
+        with self.__lock:
+            while len(self.__deadlines) > 0 and self.__deadlines[0][0] <= now:
+                _, correlation_id = heapq.heappop(self.__deadlines)
+                entry = self.__pending.pop(correlation_id, None)
+                if entry is not None:
+                    expired.append(entry[0])
+        for future in expired:
+            self.__metrics.count("timeouts")
+            Requester.__complete(future, None, TimeoutError("No reply within the call timeout."))
+
+    @staticmethod
+    def __complete(future: Future, result: Optional[dict], error: Optional[BaseException]) -> None:
+        # the caller may have cancelled the future meanwhile
+        try:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+        except InvalidStateError:
+            pass
+
+    def __str__(self):
+        return Endpoint.to_str(self.__host, self.__port)
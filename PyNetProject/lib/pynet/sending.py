@@ -1,93 +1,526 @@
 from lib.esystem.logging_factory import create_logger
 from lib.esystem.easserting import EAssert
+import logging
+import select
 import socket
-from lib.esystem.elist import EList
+import threading
+import time
 from lib.pynet.exceptions import PyNetException
 from lib.pynet.bitutilities import BitUtilities
-from typing import Dict, List
-from lib.pynet.encoding import PyNetEncoderManager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from lib.pynet.delta import ArrayDelta, DeltaEncoding
+from lib.pynet.encoding import Compression
+from lib.pynet.endpoints import Endpoint
+from lib.pynet.framing import MessageFraming
+from lib.pynet.metrics import Metrics
+from lib.pynet.shared_memory import SharedMemoryPayload, SharedMemorySegments
+import numpy as np
+from lib.pynet.streaming import FilePayload, StreamedArray
 
 
 class Sender:
     RESPONSE_SIZE = 4
-
-    def __init__(self, host: str, port: int):
-        EAssert.Argument.is_nonempty_string(host)
-        EAssert.Argument.is_true(port > 0)
+    CHUNK_SIZE = 4 * 1024 * 1024
+
+    def __init__(self, host: Optional[str] = None, port: Optional[int] = None, keep_alive: bool = False,
+                 pool: Optional['ConnectionPool'] = None, compression: Optional[Compression] = None,
+                 shared_memory_threshold: Optional[int] = None, delta: Optional[DeltaEncoding] = None,
+                 unix_path: Optional[str] = None):
+        # sends to host and port, or to the Unix domain socket unix_path of the Receiver
+        (host, port) = Endpoint.resolve(host, port, unix_path)
+        EAssert.Argument.is_false(keep_alive and pool is not None, "keep_alive/pool")
+        EAssert.Argument.is_true(shared_memory_threshold is None or shared_memory_threshold >= 0,
+                                 "shared_memory_threshold")
+        EAssert.Argument.is_true(shared_memory_threshold is None or SharedMemorySegments.is_supported(),
+                                 "Shared memory is not supported on this platform.")
+        EAssert.Argument.is_true(delta is None or keep_alive, "Delta encoding needs a keep-alive connection.")
 
         self.__host = host
         self.__port = port
-        self.__logger = create_logger(f"Sndr {host}:{port}")
+        self.__keep_alive = keep_alive
+        self.__compression = compression
+        # If set, the Receiver must run on the same host with shared_memory=True: ndarray and bytes fields
+        # with at least this many bytes are copied into shared memory segments and only their names are sent.
+        self.__shared_memory_threshold = shared_memory_threshold
+        self.__delta = delta
+        # arrays last sent by key and the connection they were sent over
+        self.__delta_bases: Dict[str, np.ndarray] = {}
+        self.__delta_socket: Optional[_ESocket] = None
+        self.__pool = pool
+        self.__socket: Optional[_ESocket] = None
+        self.__socket_lock = threading.Lock()
+        self.__logger = create_logger(f"Sndr {Endpoint.to_str(host, port)}")
+        self.__metrics = Metrics(f"Sndr {Endpoint.to_str(host, port)}")
+
+    @property
+    def keep_alive(self) -> bool:
+        return self.__keep_alive
+
+    @property
+    def compression(self) -> Optional[Compression]:
+        return self.__compression
+
+    @property
+    def shared_memory_threshold(self) -> Optional[int]:
+        return self.__shared_memory_threshold
+
+    @property
+    def delta(self) -> Optional[DeltaEncoding]:
+        return self.__delta
+
+    @property
+    def metrics(self) -> Metrics:
+        return self.__metrics
+
+    def stats(self) -> Dict:
+        # messages_sent, bytes_sent, connections_opened, shared_memory_bytes, delta_fields, keyframe_fields,
+        # encode_seconds histogram and errors by kind
+        return self.__metrics.snapshot()
+
+    def close(self) -> None:
+        with self.__socket_lock:
+            if self.__socket is not None:
+                self.__socket.close()
+                self.__socket = None
 
     def send_object(self, obj: any) -> None:
-        # TODO kontrola na typ, že je třída
-        EAssert.Argument.is_true(hasattr(obj, "__dict__"), "Object with __dict_ expected")
-        dictionary = vars(obj)
+        dictionary = Sender.__object_to_dict(obj)
         return self.send_dict(dictionary)
 
     def send_dict(self, dictionary: Dict) -> None:
+        segments = []
+        try:
+            if self.__delta is not None:
+                self.__send(lambda q: self.__write_delta_frames(q, [dictionary], segments), False)
+            else:
+                frame = self.__encode_frame(dictionary, segments)
+                can_retry = not any(isinstance(q, StreamedArray) for q in frame[1])
+                self.__send(lambda q: _FrameWriter.write_all(q, [frame]), can_retry)
+        except Exception as e:
+            Sender.__unlink_segments(segments)
+            self.__metrics.error(Metrics.error_kind(e))
+            raise
+
+    def send_many(self, dictionaries: Iterable[Dict]) -> int:
+        # all messages go over one connection, so the remote Receiver must run in keep-alive mode
+        EAssert.Argument.is_not_none(dictionaries)
+        segments = []
+        try:
+            if self.__delta is not None:
+                ret = self.__send(lambda q: self.__write_delta_frames(q, dictionaries, segments), False)
+            else:
+                frames = (self.__encode_frame(q, segments) for q in dictionaries)
+                ret = self.__send(lambda q: _FrameWriter.write_all(q, frames), False)
+        except Exception as e:
+            # which messages arrived is not known, so the whole batch is to be sent again
+            Sender.__unlink_segments(segments)
+            self.__metrics.error(Metrics.error_kind(e))
+            raise
+        return ret
+
+    def send_chunked(self, dictionary: Dict, chunk_size: Optional[int] = None) -> None:
+        # Sends one message as a chunked frame with a 64-bit data length, so its size is not limited
+        # to 2 GB. Data of ndarray, StreamedArray and FilePayload fields is sliced into chunks, not copied;
+        # ndarrays go as "nd" fields even where plain messages use the legacy "md"/"mmd"/"mi"/"mmi" ones,
+        # which are encoded into a copy. Compressed fields are copied when compressed.
         EAssert.Argument.is_not_none(dictionary)
+        chunk_size = Sender.CHUNK_SIZE if chunk_size is None else chunk_size
+        EAssert.Argument.is_true(0 < chunk_size <= MessageFraming.MAX_FRAME_LENGTH, "chunk_size")
 
+        segments = []
         try:
-            (header, data) = self.__encode_message(dictionary)
+            (header_bytes, parts) = self.__encode_frame(dictionary, segments, True)
+            self.__send(lambda q: _FrameWriter.write_chunked(q, header_bytes, parts, chunk_size), False)
         except Exception as e:
-            raise PyNetException("Failed to serialize message.", e)
+            Sender.__unlink_segments(segments)
+            self.__metrics.error(Metrics.error_kind(e))
+            raise
 
-        self.__send_via_port(header, data)
+    def send_objects(self, objects: Iterable[any]) -> int:
+        EAssert.Argument.is_not_none(objects)
+        ret = self.send_many(Sender.__object_to_dict(q) for q in objects)
+        return ret
 
+    @staticmethod
+    def __object_to_dict(obj: any) -> Dict:
+        # TODO kontrola na typ, že je třída
+        EAssert.Argument.is_true(hasattr(obj, "__dict__"), "Object with __dict_ expected")
+        ret = vars(obj)
+        return ret
 
-    def __encode_message(self, dictionary: Dict) -> (str, bytes):
-
-        def join_byte_arrays(array: List[bytes]) -> bytes:
-            return b''.join(array)
-
-        h = EList()
-        d = EList()
+    def __encode_frame(self, dictionary: Dict, segments: List[SharedMemoryPayload],
+                       raw_arrays: bool = False) -> Tuple[bytes, list]:
+        EAssert.Argument.is_not_none(dictionary)
 
-        for key in dictionary.keys():
-            val = dictionary[key]
-            (val_type, val_data) = PyNetEncoderManager.encode(val)
-            h.append(_KeyValue(key, val_type))
-            d.append(val_data)
+        start = time.perf_counter()
+        try:
+            # raised as a serialization error, also from the middle of a batch of send_many()
+            EAssert.Argument.is_false(MessageFraming.has_reserved_keys(dictionary), "dictionary")
+            if self.__shared_memory_threshold is not None:
+                dictionary = self.__to_shared_memory(dictionary, segments)
+            if raw_arrays:
+                dictionary = self.__to_raw_arrays(dictionary)
+            (header, parts) = MessageFraming.encode_message_parts(dictionary, self.__compression)
+        except Exception as e:
+            raise PyNetException("Failed to serialize message.", e)
+        self.__metrics.observe("encode_seconds", time.perf_counter() - start)
 
-        header = ";".join(h.select(lambda q: f"{q.key}:{q.value}").to_list())
-        data = join_byte_arrays(d.to_list())
+        header_bytes = BitUtilities.Str.value_to_bytes(header)
+        return header_bytes, parts
+
+    def __write_delta_frames(self, sending_socket: '_ESocket', dictionaries: Iterable[Dict],
+                             segments: List[SharedMemoryPayload]) -> int:
+        # Encodes while holding the connection, so the arrays last sent are those written to it. A failure
+        # may lose frames the Receiver based its copies on, so the next arrays are sent as keyframes again.
+        if self.__delta_socket is not sending_socket:
+            self.__delta_bases = {}
+            self.__delta_socket = sending_socket
+        try:
+            frames = (self.__encode_frame(self.__to_deltas(q), segments) for q in dictionaries)
+            ret = _FrameWriter.write_all(sending_socket, frames)
+        except BaseException:
+            self.__delta_socket = None
+            raise
+        return ret
+
+    def __to_deltas(self, dictionary: Dict) -> Dict:
+        EAssert.Argument.is_not_none(dictionary)
+        ret = dictionary
+        for key, value in dictionary.items():
+            if self.__delta.accepts(value):
+                if ret is dictionary:
+                    ret = dict(dictionary)
+                ret[key] = self.__delta.encode(self.__delta_bases, key, value)
+                self.__metrics.count("delta_fields" if isinstance(ret[key], ArrayDelta) else "keyframe_fields")
+        return ret
+
+    def __to_raw_arrays(self, dictionary: Dict) -> Dict:
+        # ndarrays as "nd" fields written from the array memory; those to be compressed are left as they are
+        ret = dictionary
+        for key, value in dictionary.items():
+            if type(value) is np.ndarray and value.dtype.kind in BitUtilities.RawArray.KINDS \
+                    and (self.__compression is None or value.nbytes < self.__compression.threshold):
+                if ret is dictionary:
+                    ret = dict(dictionary)
+                ret[key] = StreamedArray(value.dtype, value.shape, [value])
+        return ret
+
+    def __to_shared_memory(self, dictionary: Dict, segments: List[SharedMemoryPayload]) -> Dict:
+        ret = dict(dictionary)
+        for key, value in dictionary.items():
+            if isinstance(value, np.ndarray):
+                is_shared = value.dtype.kind in BitUtilities.RawArray.KINDS
+                nbytes = value.nbytes
+            else:
+                is_shared = isinstance(value, (bytes, bytearray))
+                nbytes = len(value) if is_shared else 0
+            if is_shared and nbytes >= self.__shared_memory_threshold:
+                ret[key] = SharedMemoryPayload(value)
+                segments.append(ret[key])
+                self.__metrics.count("shared_memory_bytes", nbytes)
+        return ret
+
+    @staticmethod
+    def __unlink_segments(segments: List[SharedMemoryPayload]) -> None:
+        # segments of messages not delivered; segments of delivered messages are unlinked by the Receiver
+        for segment in segments:
+            segment.unlink()
+
+    def __send(self, write: Callable[['_ESocket'], int], can_retry: bool) -> int:
+        # counts the messages and bytes actually written, including attempts that failed halfway
+        sent_bytes = 0
+
+        def counted_write(sending_socket: _ESocket) -> int:
+            nonlocal sent_bytes
+            start = sending_socket.bytes_sent
+            try:
+                return write(sending_socket)
+            finally:
+                sent_bytes += sending_socket.bytes_sent - start
 
-        return header, data
+        try:
+            ret = self.__send_via_port(counted_write, can_retry)
+        finally:
+            self.__metrics.count("bytes_sent", sent_bytes)
+        self.__metrics.count("messages_sent", ret)
+        return ret
+
+    def __open_socket(self) -> '_ESocket':
+        ret = _ESocket(self.__host, self.__port)
+        ret.open()
+        self.__metrics.count("connections_opened")
+        return ret
+
+    def __send_via_port(self, write: Callable[['_ESocket'], int], can_retry: bool) -> int:
+        if self.__pool is not None:
+            return self.__send_via_pool(write, can_retry)
+
+        if not self.__keep_alive:
+            sending_socket = self.__open_socket()
+            try:
+                return write(sending_socket)
+            finally:
+                sending_socket.close()
+
+        with self.__socket_lock:
+            if self.__socket is not None and not self.__socket.is_alive():
+                # the receiver closed the connection meanwhile, e.g. it was restarted
+                self.__socket.close()
+                self.__socket = None
+            if self.__socket is None:
+                self.__socket = self.__open_socket()
+            try:
+                return write(self.__socket)
+            except Exception as e:
+                # a frame may be written partially, so the connection cannot carry any further frames
+                self.__socket.close()
+                self.__socket = None
+                if isinstance(e, PyNetException):
+                    raise
+                raise PyNetException(f"Failed to send message to {Endpoint.to_str(self.__host, self.__port)}.", e)
+
+    def __send_via_pool(self, write: Callable[['_ESocket'], int], can_retry: bool) -> int:
+        # only data that is not consumed by the first attempt (no generators) can be sent again
+        while True:
+            sending_socket = self.__pool.acquire(self.__host, self.__port)
+            is_reused = sending_socket.is_reused
+            try:
+                ret = write(sending_socket)
+            except PyNetException:
+                self.__pool.release(sending_socket)
+                raise
+            except Exception as e:
+                self.__pool.release(sending_socket, discard=True)
+                if is_reused and can_retry:
+                    # peer has probably closed the pooled connection in the meantime, retry on a fresh one
+                    self.__metrics.count("send_retries")
+                    if self.__logger.isEnabledFor(logging.DEBUG):
+                        self.__logger.debug(f"Reconnecting, pooled connection failed with {e}")
+                    continue
+                raise PyNetException(f"Failed to send message to {Endpoint.to_str(self.__host, self.__port)}.", e)
+            self.__pool.release(sending_socket)
+            return ret
+
+
+class _FrameWriter:
+    # Frames are coalesced into writes of about WRITE_BUFFER_SIZE bytes; larger data blocks are
+    # written directly, without copying them into the buffer.
+    WRITE_BUFFER_SIZE = 256 * 1024
+
+    def __init__(self, sending_socket: '_ESocket'):
+        self.__socket = sending_socket
+        self.__buffer = bytearray()
+
+    @staticmethod
+    def write_all(sending_socket: '_ESocket', frames: Iterable[Tuple[bytes, list]]) -> int:
+        writer = _FrameWriter(sending_socket)
+        ret = 0
+        try:
+            for header_bytes, parts in frames:
+                writer.append(header_bytes, parts)
+                ret += 1
+        except PyNetException:
+            # a message failed to serialize; the frames before it are complete and still delivered
+            writer.flush()
+            raise
+        writer.flush()
+        return ret
+
+    @staticmethod
+    def write_chunked(sending_socket: '_ESocket', header_bytes: bytes, parts: list, chunk_size: int) -> int:
+        writer = _FrameWriter(sending_socket)
+        data_len = sum(len(q) for q in parts)
+        writer.write(MessageFraming.encode_chunked_intro(header_bytes, data_len))
+        writer.write(header_bytes)
+        try:
+            for part in parts:
+                if isinstance(part, FilePayload):
+                    part.send_to(sending_socket, chunk_size, writer.write_chunk_intro)
+                    continue
+                blocks = part if isinstance(part, StreamedArray) else [memoryview(part).cast('B')]
+                for block in blocks:
+                    for i in range(0, len(block), chunk_size):
+                        chunk = block[i:i + chunk_size]
+                        writer.write(BitUtilities.Int.value_to_bytes(len(chunk)))
+                        writer.write(chunk)
+        except PyNetException as e:
+            # the frame is already partially sent, so the connection cannot be used any more
+            raise ConnectionAbortedError(f"Chunked frame interrupted: {e.message}") from e
+        writer.flush()
+        return 1
+
+    def append(self, header_bytes: bytes, parts: list) -> None:
+        self.write(MessageFraming.encode_intro(header_bytes, sum(len(q) for q in parts)))
+        self.write(header_bytes)
+        try:
+            for part in parts:
+                if isinstance(part, FilePayload):
+                    self.flush()
+                    part.send_to(self.__socket)
+                elif isinstance(part, StreamedArray):
+                    for block in part:
+                        self.write(block)
+                else:
+                    self.write(part)
+        except PyNetException as e:
+            raise ConnectionAbortedError(f"Frame interrupted: {e.message}") from e
+
+    def write_chunk_intro(self, chunk_length: int) -> None:
+        # the chunk data follows directly on the socket, e.g. by sendfile
+        self.write(BitUtilities.Int.value_to_bytes(chunk_length))
+        self.flush()
+
+    def write(self, data_bytes) -> None:
+        if len(data_bytes) >= _FrameWriter.WRITE_BUFFER_SIZE:
+            self.flush()
+            self.__socket.send(data_bytes)
+        else:
+            self.__buffer += data_bytes
+            if len(self.__buffer) >= _FrameWriter.WRITE_BUFFER_SIZE:
+                self.flush()
+
+    def flush(self) -> None:
+        if len(self.__buffer) > 0:
+            self.__socket.send(self.__buffer)
+            self.__buffer = bytearray()
+
+
+class ConnectionPool:
+    # pooled connections carry many messages, so the remote Receiver must run in keep-alive mode
+
+    def __init__(self, max_connections: int = 8, idle_timeout: float = 60.0,
+                 acquire_timeout: Optional[float] = None):
+        EAssert.Argument.is_true(max_connections > 0)
+        EAssert.Argument.is_true(idle_timeout > 0)
+
+        self.__max_connections = max_connections
+        self.__idle_timeout = idle_timeout
+        self.__acquire_timeout = acquire_timeout
+        self.__condition = threading.Condition()
+        self.__idle: Dict[Tuple[str, Optional[int]], List[_ESocket]] = {}
+        self.__counts: Dict[Tuple[str, Optional[int]], int] = {}
 
-    def __send_via_port(self, header: str, data_bytes: bytearray):
-        sending_socket = _ESocket(self.__host, self.__port)
+    @property
+    def max_connections(self) -> int:
+        return self.__max_connections
 
-        header_bytes = BitUtilities.Str.value_to_bytes(header)
-        header_len = BitUtilities.Int.value_to_bytes(len(header_bytes))
-        data_len = BitUtilities.Int.value_to_bytes(len(data_bytes))
+    @property
+    def idle_timeout(self) -> float:
+        return self.__idle_timeout
+
+    def acquire(self, host: str, port: Optional[int]) -> '_ESocket':
+        key = (host, port)
+        with self.__condition:
+            while True:
+                ret = self.__take_idle(key)
+                if ret is not None:
+                    return ret
+                if self.__counts.get(key, 0) < self.__max_connections:
+                    self.__counts[key] = self.__counts.get(key, 0) + 1
+                    break
+                if not self.__condition.wait(self.__acquire_timeout):
+                    raise PyNetException(
+                        f"Timeout when waiting for a pooled connection to {Endpoint.to_str(host, port)}.")
+
+        ret = _ESocket(host, port)
+        try:
+            ret.open()
+        except Exception:
+            self.__forget(key)
+            raise
+        return ret
+
+    def release(self, sending_socket: '_ESocket', discard: bool = False) -> None:
+        key = (sending_socket.host, sending_socket.port)
+        if discard or not sending_socket.is_opened:
+            sending_socket.close()
+            self.__forget(key)
+            return
 
-        sending_socket.open()
-        sending_socket.send(header_len)
-        sending_socket.send(data_len)
-        sending_socket.send(header_bytes)
-        sending_socket.send(data_bytes)
-        sending_socket.close()
+        sending_socket.touch()
+        with self.__condition:
+            self.__idle.setdefault(key, []).append(sending_socket)
+            self.__condition.notify()
+
+    def close(self) -> None:
+        with self.__condition:
+            for key, sockets in self.__idle.items():
+                for it in sockets:
+                    it.close()
+                self.__counts[key] -= len(sockets)
+            self.__idle.clear()
+            self.__condition.notify_all()
+
+    def __take_idle(self, key: Tuple[str, Optional[int]]) -> Optional['_ESocket']:
+        sockets = self.__idle.get(key)
+        while sockets:
+            ret = sockets.pop()
+            if ret.idle_time <= self.__idle_timeout and ret.is_alive():
+                return ret
+            ret.close()
+            self.__counts[key] -= 1
+        return None
+
+    def __forget(self, key: Tuple[str, Optional[int]]) -> None:
+        with self.__condition:
+            self.__counts[key] -= 1
+            self.__condition.notify()
 
 
 class _ESocket:
-    def __init__(self, host: str, port: int):
-        EAssert.Argument.is_nonempty_string(host)
-        EAssert.Argument.is_true(port > 0)
+    def __init__(self, host: str, port: Optional[int]):
+        Endpoint.check(host, port)
 
         self.__host = host
         self.__port = port
         self.__socket = None
+        self.__last_used: Optional[float] = None
+        self.__bytes_sent = 0
+
+    @property
+    def host(self) -> str:
+        return self.__host
+
+    @property
+    def port(self) -> Optional[int]:
+        return self.__port
+
+    @property
+    def is_reused(self) -> bool:
+        return self.__last_used is not None
+
+    @property
+    def idle_time(self) -> float:
+        return 0 if self.__last_used is None else time.monotonic() - self.__last_used
+
+    @property
+    def bytes_sent(self) -> int:
+        return self.__bytes_sent
+
+    def touch(self) -> None:
+        self.__last_used = time.monotonic()
+
+    def is_alive(self) -> bool:
+        if self.__socket is None:
+            return False
+        try:
+            readable, _, _ = select.select([self.__socket], [], [], 0)
+            if not readable:
+                return True
+            # the receiver never writes back, so readability means EOF or a pending error
+            return len(self.__socket.recv(1, socket.MSG_PEEK)) > 0
+        except OSError:
+            return False
 
     def open(self):
         EAssert.is_none(self.__socket)
 
-        self.__socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.__socket = Endpoint.create_socket(self.__port)
         try:
-            self.__socket.connect((self.__host, self.__port))
+            self.__socket.connect(Endpoint.to_address(self.__host, self.__port))
         except Exception as e:
             self.__socket = None
-            raise PyNetException(f"Unable to open connection to {self.__host}:{self.__port}.", e)
+            raise PyNetException(f"Unable to open connection to {Endpoint.to_str(self.__host, self.__port)}.", e)
 
     def send(self, byte_data: bytes) -> None:
         if len(byte_data) == 0:
@@ -95,6 +528,17 @@ class _ESocket:
         EAssert.is_true(self.is_opened)
 
         self.__socket.sendall(byte_data)
+        self.__bytes_sent += len(byte_data)
+
+    def send_file(self, file, offset: int, count: int) -> None:
+        if count == 0:
+            return
+        EAssert.is_true(self.is_opened)
+
+        sent = self.__socket.sendfile(file, offset, count)
+        self.__bytes_sent += sent
+        if sent != count:
+            raise PyNetException(f"Only {sent} of {count} bytes of the file were sent, file truncated?")
 
     @property
     def is_opened(self) -> bool:
@@ -105,20 +549,3 @@ class _ESocket:
             self.__socket.close()
             self.__socket = None
 
-
-class _KeyValue:
-    def __init__(self, key, value):
-        EAssert.Argument.is_not_none(key)
-        self.__key = key
-        self.__value = value
-
-    @property
-    def key(self):
-        return self.__key
-
-    @property
-    def value(self):
-        return self.__value
-
-    def __str__(self):
-        return f"{self.key}={self.value}"
@@ -0,0 +1,157 @@
+from lib.esystem.easserting import EAssert
+from lib.pynet.bitutilities import BitUtilities
+from lib.pynet.exceptions import PyNetException
+from typing import Optional, Tuple
+import mmap
+import numpy as np
+import os
+import secrets
+import time
+
+try:
+    # Segments are not handled by multiprocessing.shared_memory.SharedMemory: it cannot be closed while
+    # arrays still map the segment, and before Python 3.13 it registers segments with the resource tracker,
+    # which unlinks them when the sending process exits. On Linux, POSIX shared memory segments are files
+    # in /dev/shm and are opened as such; elsewhere (e.g. macOS) the shm_open() binding of CPython, used
+    # by SharedMemory itself, is the fallback.
+    import _posixshmem
+except ImportError:
+    _posixshmem = None
+
+
+class SharedMemorySegments:
+    # Segments are created by the sender, which copies the field data into them once, and unlinked by the
+    # receiver as soon as it maps them, so the memory is freed when the last array mapping it is released.
+    # If the send fails, the sender unlinks its segments itself. A segment whose message is never read
+    # (e.g. the receiving process crashed) stays in /dev/shm until remove_stale() or a reboot removes it.
+    NAME_PREFIX = "pynet_"
+    DIRECTORY = "/dev/shm"
+    # type-id prefixes of fields whose data is in a segment
+    TYPE_ID_PREFIXES = ("sm", "sb")
+
+    @staticmethod
+    def is_supported() -> bool:
+        ret = os.path.isdir(SharedMemorySegments.DIRECTORY) or _posixshmem is not None
+        return ret
+
+    @staticmethod
+    def create(data: memoryview) -> str:
+        EAssert.is_true(SharedMemorySegments.is_supported(), "Shared memory is not supported on this platform.")
+        ret = f"{SharedMemorySegments.NAME_PREFIX}{os.getpid()}_{secrets.token_hex(8)}"
+        fd = SharedMemorySegments.__open(ret, os.O_CREAT | os.O_EXCL | os.O_RDWR)
+        try:
+            os.ftruncate(fd, max(len(data), 1))
+            with mmap.mmap(fd, max(len(data), 1)) as segment:
+                segment[:len(data)] = data
+        except Exception as e:
+            SharedMemorySegments.unlink(ret)
+            raise PyNetException(f"Failed to create shared memory segment {ret}.", e)
+        finally:
+            os.close(fd)
+        return ret
+
+    @staticmethod
+    def attach(name: str, length: int) -> memoryview:
+        # maps the segment and unlinks it at once; the mapping lives as long as views of it
+        EAssert.is_true(SharedMemorySegments.is_supported(), "Shared memory is not supported on this platform.")
+        EAssert.is_true(name.startswith(SharedMemorySegments.NAME_PREFIX), f"Invalid segment name {name}.")
+        try:
+            fd = SharedMemorySegments.__open(name, os.O_RDWR)
+        except OSError as e:
+            raise PyNetException(f"Failed to open shared memory segment {name}.", e)
+        try:
+            EAssert.is_true(os.fstat(fd).st_size >= length, f"Shared memory segment {name} is too short.")
+            segment = mmap.mmap(fd, max(length, 1))
+        finally:
+            os.close(fd)
+            SharedMemorySegments.unlink(name)
+        ret = memoryview(segment)[:length]
+        return ret
+
+    @staticmethod
+    def unlink(name: str) -> bool:
+        try:
+            if os.path.isdir(SharedMemorySegments.DIRECTORY):
+                os.unlink(os.path.join(SharedMemorySegments.DIRECTORY, name))
+            else:
+                _posixshmem.shm_unlink("/" + name)
+        except FileNotFoundError:
+            return False
+        return True
+
+    @staticmethod
+    def __open(name: str, flags: int) -> int:
+        if os.path.isdir(SharedMemorySegments.DIRECTORY):
+            ret = os.open(os.path.join(SharedMemorySegments.DIRECTORY, name), flags, 0o600)
+        else:
+            ret = _posixshmem.shm_open("/" + name, flags, mode=0o600)
+        return ret
+
+    @staticmethod
+    def remove_stale(max_age: float = 3600.0) -> int:
+        # Removes segments of this library older than max_age seconds, left by messages never read.
+        # Returns the number of removed segments; only where segments are visible in /dev/shm (Linux).
+        if not os.path.isdir(SharedMemorySegments.DIRECTORY):
+            return 0
+        ret = 0
+        now = time.time()
+        for name in os.listdir(SharedMemorySegments.DIRECTORY):
+            if not name.startswith(SharedMemorySegments.NAME_PREFIX):
+                continue
+            try:
+                age = now - os.stat(os.path.join(SharedMemorySegments.DIRECTORY, name)).st_mtime
+            except FileNotFoundError:
+                continue
+            if age > max_age and SharedMemorySegments.unlink(name):
+                ret += 1
+        return ret
+
+
+class SharedMemoryPayload:
+    # An ndarray or bytes field whose data was copied into a shared memory segment; only the segment name
+    # is sent. Receivers get an array mapping the segment ("sm" type-id), or a memoryview for bytes ("sb").
+
+    def __init__(self, value):
+        if isinstance(value, np.ndarray):
+            EAssert.Argument.is_true(value.dtype.kind in BitUtilities.RawArray.KINDS, "value")
+            self.__dtype: Optional[np.dtype] = value.dtype
+            self.__shape: Tuple[int, ...] = value.shape
+            data = BitUtilities.RawArray.value_to_bytes(value)
+        else:
+            EAssert.Argument.is_true(isinstance(value, (bytes, bytearray)), "value")
+            self.__dtype = None
+            self.__shape = (len(value),)
+            data = memoryview(value)
+        self.__nbytes = len(data)
+        self.__name = SharedMemorySegments.create(data)
+
+    @property
+    def name(self) -> str:
+        return self.__name
+
+    @property
+    def is_array(self) -> bool:
+        return self.__dtype is not None
+
+    @property
+    def dtype(self) -> Optional[np.dtype]:
+        return self.__dtype
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return self.__shape
+
+    @property
+    def nbytes(self) -> int:
+        return self.__nbytes
+
+    def to_type_id(self) -> str:
+        if self.__dtype is None:
+            ret = "sb%d.%d" % (len(self.__name), self.__nbytes)
+        else:
+            ret = "sm%d.%s.%d.%s" % (len(self.__name), self.__dtype.str, len(self.__shape),
+                                     "x".join(str(d) for d in self.__shape))
+        return ret
+
+    def unlink(self) -> None:
+        SharedMemorySegments.unlink(self.__name)
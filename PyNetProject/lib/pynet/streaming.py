@@ -0,0 +1,228 @@
+from lib.esystem.easserting import EAssert
+from lib.pynet.bitutilities import BitUtilities
+from lib.pynet.exceptions import PyNetException
+from abc import ABC, abstractmethod
+from typing import Callable, Iterable, Iterator, Optional, Tuple
+import contextlib
+import mmap
+import numpy as np
+import os
+
+
+class LazyPayload(ABC):
+    # field data produced only while the message is being written, instead of being encoded up front
+
+    @abstractmethod
+    def __len__(self):
+        pass
+
+    @abstractmethod
+    def to_bytes(self) -> bytes:
+        pass
+
+
+class StreamedArray(LazyPayload):
+    # An array field whose data is produced lazily, e.g. row blocks read from a generator or a memmap.
+    # It is sent under the same "nd" type-id as a plain ndarray, so receivers see an ordinary array.
+
+    def __init__(self, dtype, shape: Tuple[int, ...], chunks: Iterable):
+        EAssert.Argument.is_not_none(chunks)
+        self.__dtype = np.dtype(dtype)
+        EAssert.Argument.is_true(self.__dtype.kind in BitUtilities.RawArray.KINDS, "dtype")
+        self.__shape = tuple(int(q) for q in shape)
+        self.__chunks = chunks
+
+    @staticmethod
+    def from_array(value: np.ndarray, rows_per_chunk: int) -> 'StreamedArray':
+        EAssert.Argument.is_true(rows_per_chunk > 0)
+        chunks = (value[i:i + rows_per_chunk] for i in range(0, value.shape[0], rows_per_chunk))
+        ret = StreamedArray(value.dtype, value.shape, chunks)
+        return ret
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self.__dtype
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return self.__shape
+
+    @property
+    def ndim(self) -> int:
+        return len(self.__shape)
+
+    @property
+    def nbytes(self) -> int:
+        return int(np.prod(self.__shape)) * self.__dtype.itemsize
+
+    def __len__(self):
+        return self.nbytes
+
+    def __iter__(self) -> Iterator[memoryview]:
+        expected = self.nbytes
+        produced = 0
+        for chunk in self.__chunks:
+            if isinstance(chunk, np.ndarray):
+                block = BitUtilities.RawArray.value_to_bytes(np.ascontiguousarray(chunk, dtype=self.__dtype))
+            else:
+                block = memoryview(chunk).cast('B')
+            produced += len(block)
+            if produced > expected:
+                raise PyNetException(f"Streamed array produced more than the declared {expected} bytes.")
+            yield block
+        if produced != expected:
+            raise PyNetException(f"Streamed array produced {produced} bytes, {expected} declared.")
+
+    def to_bytes(self) -> bytes:
+        ret = b''.join(self)
+        return ret
+
+
+class FilePayload(LazyPayload):
+    # A field whose data already lives in a file: a path, a binary file object or a file-backed np.memmap.
+    # It is written by socket.sendfile, so the data does not pass through Python; receivers see an array
+    # of the given dtype and shape (uint8 bytes by default), optionally stored directly to a file.
+
+    def __init__(self, source, offset: int = 0, length: Optional[int] = None,
+                 dtype=np.uint8, shape: Optional[Tuple[int, ...]] = None):
+        EAssert.Argument.is_not_none(source)
+        EAssert.Argument.is_true(offset >= 0, "offset")
+
+        if isinstance(source, np.memmap):
+            EAssert.Argument.is_true(FilePayload.is_file_backed(source),
+                                     "Only a contiguous np.memmap created directly over a file can be sent as a file.")
+            self.__path = source.filename
+            self.__file = None
+            self.__offset = source.offset
+            self.__length = source.nbytes
+            self.__dtype = source.dtype
+            self.__shape = source.shape
+            return
+
+        if isinstance(source, (str, os.PathLike)):
+            self.__path = source
+            self.__file = None
+            file_size = os.path.getsize(source)
+        else:
+            EAssert.Argument.is_true(hasattr(source, "fileno"), "File path, binary file or np.memmap expected.")
+            self.__path = None
+            self.__file = source
+            file_size = os.fstat(source.fileno()).st_size
+        self.__offset = offset
+        self.__length = file_size - offset if length is None else length
+        EAssert.Argument.is_true(0 <= self.__length <= file_size - offset, "length")
+
+        self.__dtype = np.dtype(dtype)
+        EAssert.Argument.is_true(self.__dtype.kind in BitUtilities.RawArray.KINDS, "dtype")
+        self.__shape = (self.__length // self.__dtype.itemsize,) if shape is None else tuple(int(q) for q in shape)
+        EAssert.Argument.is_true(int(np.prod(self.__shape)) * self.__dtype.itemsize == self.__length, "shape")
+
+    @staticmethod
+    def is_file_backed(value: np.memmap) -> bool:
+        # slices of a memmap report the offset of the original file mapping, so they cannot be used
+        ret = isinstance(value.base, mmap.mmap) and value.filename is not None and value.flags.c_contiguous
+        return ret
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self.__dtype
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return self.__shape
+
+    @property
+    def ndim(self) -> int:
+        return len(self.__shape)
+
+    @property
+    def nbytes(self) -> int:
+        return self.__length
+
+    def __len__(self):
+        return self.__length
+
+    def __open(self):
+        # a file given by the caller stays open, a path is opened for the single send
+        ret = contextlib.nullcontext(self.__file) if self.__file is not None else open(self.__path, "rb")
+        return ret
+
+    def send_to(self, sending_socket, chunk_size: Optional[int] = None,
+                before_chunk: Optional[Callable[[int], None]] = None) -> None:
+        # sends the data in pieces of at most chunk_size bytes, calling before_chunk with the length of each
+        piece_size = self.__length if chunk_size is None else chunk_size
+        with self.__open() as file:
+            for start in range(0, self.__length, max(piece_size, 1)):
+                count = min(piece_size, self.__length - start)
+                if before_chunk is not None:
+                    before_chunk(count)
+                sending_socket.send_file(file, self.__offset + start, count)
+
+    def to_bytes(self) -> bytes:
+        with self.__open() as file:
+            file.seek(self.__offset)
+            ret = file.read(self.__length)
+        if len(ret) != self.__length:
+            raise PyNetException(f"File payload has only {len(ret)} of {self.__length} bytes.")
+        return ret
+
+
+class MessageChunk:
+    # A piece of a field of a progressively consumed message. Array pieces always hold whole rows
+    # (items along the first axis). `data` and `rows` view the receive buffer and are valid only
+    # during the handler call; copy them to keep them.
+
+    def __init__(self, key: str, type_id: str, offset: int, field_length: int, data: memoryview,
+                 dtype: Optional[np.dtype], shape: Optional[Tuple[int, ...]]):
+        self.__key = key
+        self.__type_id = type_id
+        self.__offset = offset
+        self.__field_length = field_length
+        self.__data = data
+        self.__dtype = dtype
+        self.__shape = shape
+
+    @property
+    def key(self) -> str:
+        return self.__key
+
+    @property
+    def type_id(self) -> str:
+        return self.__type_id
+
+    @property
+    def offset(self) -> int:
+        return self.__offset
+
+    @property
+    def field_length(self) -> int:
+        return self.__field_length
+
+    @property
+    def data(self) -> memoryview:
+        return self.__data
+
+    @property
+    def is_last(self) -> bool:
+        return self.__offset + len(self.__data) == self.__field_length
+
+    @property
+    def dtype(self) -> Optional[np.dtype]:
+        return self.__dtype
+
+    @property
+    def shape(self) -> Optional[Tuple[int, ...]]:
+        return self.__shape
+
+    @property
+    def row_length(self) -> int:
+        return int(np.prod(self.__shape[1:])) * self.__dtype.itemsize
+
+    @property
+    def first_row(self) -> int:
+        return self.__offset // self.row_length
+
+    @property
+    def rows(self) -> np.ndarray:
+        ret = np.frombuffer(self.__data, dtype=self.__dtype).reshape((-1,) + self.__shape[1:])
+        return ret
@@ -0,0 +1,36 @@
+import socket
+import threading
+import time
+import pytest
+from lib.pynet.receiving import Receiver
+
+
+@pytest.fixture
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def wait_until():
+    def wait(condition, timeout: float = 5, interval: float = 0.01) -> bool:
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(interval)
+        return True
+    return wait
+
+
+@pytest.fixture
+def start_receiver():
+    # starts a Receiver and waits until it listens
+    def start(receiver: Receiver) -> Receiver:
+        listening = threading.Event()
+        receiver.on_listening_started.add_listener(lambda source: listening.set())
+        receiver.start_async()
+        assert listening.wait(5)
+        return receiver
+    return start
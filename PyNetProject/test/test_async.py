@@ -0,0 +1,102 @@
+import asyncio
+import socket
+import struct
+import numpy as np
+import pytest
+from lib.pynet.async_receiving import AsyncReceiver
+from lib.pynet.async_sending import AsyncSender
+from lib.pynet.exceptions import PyNetException
+from lib.pynet.framing import MessageFraming
+
+
+@pytest.mark.parametrize("keep_alive", [False, True])
+def test_async_sender_to_async_receiver(keep_alive, free_port):
+    async def run():
+        port = free_port
+        messages = []
+        received = asyncio.Event()
+        receiver = AsyncReceiver("127.0.0.1", port)
+
+        async def on_message(source, client_id, message):
+            messages.append(message)
+            if len(messages) == 20:
+                received.set()
+
+        receiver.on_message_received.add_listener(on_message)
+        await receiver.start()
+        sender = AsyncSender("127.0.0.1", port, keep_alive=keep_alive)
+        try:
+            for i in range(20):
+                await sender.send_dict({"i": i, "name": "x" * i, "values": np.arange(i, dtype=float)})
+            await asyncio.wait_for(received.wait(), 5)
+        finally:
+            await sender.close()
+            await receiver.stop()
+        return messages
+
+    messages = asyncio.run(run())
+    assert [q["i"] for q in messages] == list(range(20))
+    assert messages[7]["name"] == "x" * 7
+    assert np.array_equal(messages[7]["values"], np.arange(7, dtype=float))
+
+
+def test_async_sender_wraps_connection_errors(free_port):
+    async def run():
+        async def reset(reader, writer):
+            writer.get_extra_info("socket").setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+            writer.transport.abort()
+
+        port = free_port
+        server = await asyncio.start_server(reset, "127.0.0.1", port)
+        try:
+            sender = AsyncSender("127.0.0.1", port)
+            with pytest.raises(PyNetException, match="Failed to send message"):
+                await sender.send_dict({"data": bytes(64 * 1024 * 1024)})
+        finally:
+            server.close()
+            await server.wait_closed()
+        with pytest.raises(PyNetException, match="Unable to open connection"):
+            await AsyncSender("127.0.0.1", port).send_dict({"x": 1})
+
+    asyncio.run(run())
+
+
+def test_keep_alive_async_sender_reconnects_after_receiver_closed(free_port):
+    async def run():
+        messages = []
+        first_closed = asyncio.Event()
+
+        async def receive(reader, writer):
+            # the first connection is closed by the receiver after one message
+            while True:
+                try:
+                    intro = await reader.readexactly(MessageFraming.INTRO_LENGTH)
+                except asyncio.IncompleteReadError:
+                    break
+                header_length, data_length = MessageFraming.decode_intro(intro)
+                message_bytes = memoryview(await reader.readexactly(header_length + data_length))
+                messages.append(MessageFraming.decode_message(message_bytes[:header_length],
+                                                              message_bytes[header_length:]))
+                if not first_closed.is_set():
+                    break
+            writer.close()
+            first_closed.set()
+
+        server = await asyncio.start_server(receive, "127.0.0.1", free_port)
+        sender = AsyncSender("127.0.0.1", free_port, keep_alive=True)
+        try:
+            await sender.send_dict({"i": 1})
+            await asyncio.wait_for(first_closed.wait(), 5)
+            await sender.send_dict({"i": 2})
+            await sender.send_dict({"i": 3})
+            for _ in range(500):
+                if len(messages) == 3:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            await sender.close()
+            server.close()
+            await server.wait_closed()
+        return messages
+
+    assert asyncio.run(run()) == [{"i": 1}, {"i": 2}, {"i": 3}]
@@ -0,0 +1,21 @@
+from benchmark import results
+
+
+def _results(seconds: float, mb_per_s: float) -> dict:
+    return results.create([
+        {"name": "codec/encode/nd-f8/1024", "seconds": seconds},
+        {"name": "loopback/1024/x1", "seconds": 1.0, "mb_per_s": mb_per_s, "p50_ms": 0.1, "p99_ms": 0.2},
+        {"name": "codec/decode/nd-f8/1024", "seconds": 1.0},
+    ])
+
+
+def test_compare_flags_regressions_above_tolerance():
+    baseline = _results(1.0, 100.0)
+    rows = results.compare(_results(1.2, 70.0), baseline, 0.25)
+
+    by_metric = {(q["name"], q["metric"]): q for q in rows}
+    assert len(rows) == 5
+    assert not by_metric[("codec/encode/nd-f8/1024", "seconds")]["is_regression"]
+    assert by_metric[("loopback/1024/x1", "mb_per_s")]["is_regression"]
+    assert [q["metric"] for q in results.find_regressions(rows)] == ["mb_per_s"]
+    assert results.get_environment_mismatch(baseline, baseline) is None
@@ -0,0 +1,83 @@
+import struct
+import numpy as np
+import pytest
+from lib.esystem.easserting import EAssertException
+from lib.pynet.bitutilities import BitUtilities
+
+
+def _legacy_dims_to_bytes(shape) -> bytes:
+    return b''.join(struct.pack('<i', q) for q in shape)
+
+
+def _legacy_to_bytes(value: np.ndarray, element_format: str) -> bytes:
+    ret = bytearray(_legacy_dims_to_bytes(value.shape))
+    for row in value.reshape(-1, value.shape[-1]) if value.size > 0 else []:
+        ret += struct.pack("%s%s" % (len(row), element_format), *list(row))
+    return bytes(ret)
+
+
+def _legacy_from_bytes(value: bytes, ndim: int, element_format: str, dtype) -> np.ndarray:
+    shape = struct.unpack('<%si' % ndim, value[:ndim * 4])
+    item_len = struct.calcsize(element_format)
+    ret = np.zeros(shape, dtype=dtype)
+    flat = ret.reshape(-1)
+    for i in range(flat.size):
+        si = ndim * 4 + i * item_len
+        flat[i] = struct.unpack('<' + element_format, value[si:si + item_len])[0]
+    return ret
+
+
+_ARRAY_CODECS = [
+    (BitUtilities.Int2D, 2, 'i', int),
+    (BitUtilities.Int3D, 3, 'i', int),
+    (BitUtilities.Float2D, 2, 'd', float),
+    (BitUtilities.Float3D, 3, 'd', float),
+]
+
+
+def _sample(ndim: int, dtype, shape=None) -> np.ndarray:
+    rnd = np.random.default_rng(ndim)
+    shape = shape if shape is not None else (3, 5, 7)[:ndim]
+    if dtype == int:
+        return rnd.integers(-2 ** 31, 2 ** 31 - 1, size=shape, dtype=int)
+    return rnd.standard_normal(shape)
+
+
+def test_arrays_match_legacy_wire_format():
+    for codec, ndim, element_format, dtype in _ARRAY_CODECS:
+        for shape in [None, (0,) * ndim, (1,) * ndim]:
+            value = _sample(ndim, dtype, shape)
+            data = codec.value_to_bytes(value)
+            assert bytes(data) == _legacy_to_bytes(value, element_format)
+
+            decoded = codec.bytes_to_value(bytes(data))
+            expected = _legacy_from_bytes(bytes(data), ndim, element_format, dtype)
+            assert decoded.dtype == expected.dtype
+            assert decoded.flags.writeable
+            np.testing.assert_array_equal(decoded, expected)
+            np.testing.assert_array_equal(decoded, value)
+
+
+def test_non_contiguous_array():
+    value = _sample(2, float, (8, 6))[::2, 1::2]
+    data = BitUtilities.Float2D.value_to_bytes(value)
+    assert bytes(data) == _legacy_to_bytes(value, 'd')
+
+
+def test_int_array_out_of_range_fails():
+    value = np.array([[2 ** 40]], dtype=int)
+    with pytest.raises(EAssertException):
+        BitUtilities.Int2D.value_to_bytes(value)
+
+
+def test_lists_match_legacy_wire_format():
+    floats = [0.0, -1.5, 3.25e100, float('inf')]
+    data = BitUtilities.Float1D.value_to_bytes(floats)
+    assert data == struct.pack("%sd" % len(floats), *floats)
+    assert BitUtilities.Float1D.bytes_to_value(data) == floats
+
+    ints = [0, -1, 2 ** 31 - 1, -2 ** 31]
+    data = BitUtilities.Int1D.value_to_bytes(ints)
+    assert data == struct.pack("%si" % len(ints), *ints)
+    assert BitUtilities.Int1D.bytes_to_value(data) == ints
+    assert all(type(q) == int for q in BitUtilities.Int1D.bytes_to_value(data))
@@ -0,0 +1,65 @@
+import numpy as np
+from lib.pynet.delta import ArrayDelta, ArrayKeyframe, DeltaEncoding
+from lib.pynet.encoding import PyNetEncoderManager
+
+
+def _transfer(value, receiver_bases):
+    # encodes and decodes a field as a Receiver would and resolves it against the receiver's arrays
+    type_id, data = PyNetEncoderManager.encode(value)
+    decoded, _ = PyNetEncoderManager.decode(type_id, memoryview(bytearray(data)))
+    message = {"m": decoded}
+    DeltaEncoding.resolve(receiver_bases, message)
+    return type_id, message["m"]
+
+
+def test_deltas_reproduce_the_sent_arrays():
+    delta = DeltaEncoding(block_size=64, max_changed_ratio=0.5, min_size=0)
+    sender_bases, receiver_bases = {}, {}
+    # 1001 float64 values leave a partial block at the end
+    value = np.arange(1001, dtype=np.float64)
+
+    type_id, received = _transfer(delta.encode(sender_bases, "m", value), receiver_bases)
+    assert type_id.startswith("dk")
+    np.testing.assert_array_equal(received, value)
+
+    value[3] = -1
+    value[-1] = -2
+    field = delta.encode(sender_bases, "m", value)
+    assert isinstance(field, ArrayDelta) and list(field.indices) == [0, 125]
+    type_id, received = _transfer(field, receiver_bases)
+    assert type_id.startswith("dd")
+    np.testing.assert_array_equal(received, value)
+
+    # the received copy is independent of the array the next delta applies to
+    received[0] = 100
+    value[500] = -3
+    _, received = _transfer(delta.encode(sender_bases, "m", value), receiver_bases)
+    np.testing.assert_array_equal(received, value)
+
+
+def test_large_changes_and_new_shapes_are_sent_as_keyframes():
+    delta = DeltaEncoding(block_size=64, max_changed_ratio=0.5, min_size=0)
+    bases = {}
+    value = np.zeros((32, 32), dtype=np.int32)
+    assert isinstance(delta.encode(bases, "m", value), ArrayKeyframe)
+    assert isinstance(delta.encode(bases, "m", value + 1), ArrayKeyframe)
+    assert isinstance(delta.encode(bases, "m", np.zeros((16, 64), dtype=np.int32)), ArrayKeyframe)
+    assert isinstance(delta.encode(bases, "m", np.zeros((16, 64), dtype=np.int32)), ArrayDelta)
+
+
+def test_arrays_shorter_than_a_block():
+    delta = DeltaEncoding(block_size=64, max_changed_ratio=0.5, min_size=0)
+    sender_bases, receiver_bases = {}, {}
+    value = np.zeros(4)
+    _transfer(delta.encode(sender_bases, "m", value), receiver_bases)
+
+    field = delta.encode(sender_bases, "m", value)
+    assert isinstance(field, ArrayDelta) and len(field.indices) == 0
+    _, received = _transfer(field, receiver_bases)
+    np.testing.assert_array_equal(received, value)
+
+    value[1] = 1
+    field = delta.encode(sender_bases, "m", value)
+    assert isinstance(field, ArrayKeyframe)
+    _, received = _transfer(field, receiver_bases)
+    np.testing.assert_array_equal(received, value)
@@ -0,0 +1,136 @@
+import zlib
+import numpy as np
+import pytest
+from lib.pynet.encoding import Compression, PyNetEncoderManager
+from lib.pynet.exceptions import PyNetException
+from lib.pynet.streaming import FilePayload
+from lib.pynet.shared_memory import SharedMemoryPayload, SharedMemorySegments
+
+_VALUES = [
+    None, "", "text", True, False, 0, -7, 2 ** 31 - 1, 1.5, np.float64(2.5), b"", b"\x00\x01",
+    [], [1.0, 2.0], [1, 2, 3], [True, False],
+    np.arange(6.0).reshape(2, 3), np.arange(24.0).reshape(2, 3, 4),
+    np.arange(6).reshape(3, 2), np.arange(8).reshape(2, 2, 2),
+]
+
+
+def _encode_by_linear_scan(value):
+    encoder = PyNetEncoderManager.ENCODERS.first_or_none(lambda q: q.accepts_value(value))
+    return encoder.to_type_id(value), encoder.to_data(value)
+
+
+def _assert_same(a, b):
+    if isinstance(a, np.ndarray):
+        assert a.dtype == b.dtype
+        np.testing.assert_array_equal(a, b)
+    else:
+        assert type(a) == type(b) and a == b
+
+
+def test_dispatch_matches_linear_scan():
+    for value in _VALUES:
+        type_id, data = PyNetEncoderManager.encode(value)
+        expected_type_id, expected_data = _encode_by_linear_scan(value)
+        assert type_id == expected_type_id
+        assert bytes(data) == bytes(expected_data)
+
+        decoded, used_bytes = PyNetEncoderManager.decode(type_id, memoryview(bytes(data) + b"tail"))
+        encoder = PyNetEncoderManager.ENCODERS.first_or_none(lambda q: q.accepts_type_id(type_id))
+        assert used_bytes == encoder.to_byte_len(type_id) == len(data)
+        _assert_same(decoded, encoder.to_value(bytes(data)))
+
+
+def test_nd_arrays_keep_dtype_and_shape():
+    values = [
+        np.ones((4, 5), dtype=np.float32), np.arange(10, dtype=np.uint8), np.array([True, False]),
+        np.arange(2 ** 40, 2 ** 40 + 6, dtype=np.int64).reshape((1, 2, 3, 1)), np.array(3.5, dtype=np.float32),
+        np.zeros((0, 3), dtype=np.int16), np.arange(12.0, dtype=np.float32).reshape(3, 4)[:, ::2], np.arange(6, dtype='>f8'),
+    ]
+    for value in values:
+        type_id, data = PyNetEncoderManager.encode(value)
+        assert type_id.startswith("nd")
+        assert len(data) == value.nbytes
+
+        decoded, used_bytes = PyNetEncoderManager.decode(type_id, memoryview(bytearray(data)))
+        assert used_bytes == value.nbytes
+        assert decoded.dtype == value.dtype and decoded.shape == value.shape
+        np.testing.assert_array_equal(decoded, value)
+
+
+def test_file_backed_memmap_is_sent_as_file(tmp_path):
+    path = str(tmp_path / "data.bin")
+    value = np.arange(12, dtype=np.int32).reshape(3, 4)
+    value.tofile(path)
+    mapped = np.memmap(path, dtype=np.int32, mode="r", shape=(3, 4))
+
+    type_id, data = PyNetEncoderManager.encode(mapped)
+    assert type_id == "fd48.<i4.2.3x4"
+    assert isinstance(data, FilePayload) and len(data) == 48
+
+    decoded, used_bytes = PyNetEncoderManager.decode(type_id, memoryview(bytearray(data.to_bytes())))
+    assert used_bytes == 48
+    np.testing.assert_array_equal(decoded, value)
+
+    # slices of a memmap do not map the file at their own offset and are sent as plain arrays
+    type_id, _ = PyNetEncoderManager.encode(mapped[1:])
+    assert type_id.startswith("nd")
+
+
+@pytest.mark.skipif(not SharedMemorySegments.is_supported(), reason="Shared memory not supported")
+def test_shared_memory_fields_map_the_segment_once():
+    value = np.arange(12, dtype=np.float32).reshape(3, 4)
+    payload = SharedMemoryPayload(value)
+    type_id, data = PyNetEncoderManager.encode(payload)
+    assert type_id == f"sm{len(payload.name)}.<f4.2.3x4"
+
+    decoded, used_bytes = PyNetEncoderManager.decode(type_id, memoryview(bytearray(data)))
+    assert used_bytes == len(payload.name)
+    np.testing.assert_array_equal(decoded, value)
+    # the receiver unlinks the segment when mapping it
+    assert not SharedMemorySegments.unlink(payload.name)
+
+    payload = SharedMemoryPayload(b"abc")
+    type_id, data = PyNetEncoderManager.encode(payload)
+    decoded, _ = PyNetEncoderManager.decode(type_id, memoryview(bytearray(data)))
+    assert type_id.startswith("sb") and bytes(decoded) == b"abc"
+
+
+@pytest.mark.parametrize("codec", [Compression.ZLIB, Compression.LZMA, Compression.BZ2])
+def test_compressed_fields_round_trip(codec):
+    compression = Compression(codec, threshold=1024)
+    for value in [np.zeros((100, 50)), "text " * 1000, b"\x01" * 5000, np.arange(2000, dtype=np.int16)]:
+        type_id, data = PyNetEncoderManager.encode(value, compression)
+        assert type_id.startswith(Compression.TYPE_ID_PREFIXES[codec])
+        decoded, used_bytes = PyNetEncoderManager.decode(type_id, memoryview(bytes(data) + b"tail"))
+        assert used_bytes == len(data)
+        _assert_same(decoded, value)
+
+
+def test_fields_below_threshold_or_incompressible_are_not_compressed():
+    compression = Compression(threshold=1024)
+    assert PyNetEncoderManager.encode(b"\x00" * 1023, compression) == PyNetEncoderManager.encode(b"\x00" * 1023)
+    noise = np.random.default_rng(1).bytes(4096)
+    assert PyNetEncoderManager.encode(noise, compression) == PyNetEncoderManager.encode(noise)
+
+
+def test_decompression_is_bounded_by_declared_length():
+    bomb = zlib.compress(bytes(10 * 1024 * 1024))
+    with pytest.raises(PyNetException, match="expands beyond"):
+        PyNetEncoderManager.decode(f"zz{len(bomb)}s10", memoryview(bomb))
+    truncated = zlib.compress(b"x" * 100)[:-4]
+    with pytest.raises(PyNetException, match="truncated"):
+        PyNetEncoderManager.decode(f"zz{len(truncated)}s100", memoryview(truncated))
+
+
+def test_integer_matrices_out_of_int32_range_are_sent_as_nd():
+    for value in [np.array([[2 ** 40, 1]]), np.full((2, 2, 2), -2 ** 31 - 1)]:
+        type_id, data = PyNetEncoderManager.encode(value)
+        assert type_id.startswith("nd")
+        _assert_same(PyNetEncoderManager.decode(type_id, memoryview(bytearray(data)))[0], value)
+    assert PyNetEncoderManager.encode(np.array([[2 ** 31 - 1, -2 ** 31]]))[0].startswith("mi")
+
+
+def test_invalid_array_type_ids_raise_pynet_exception():
+    for type_id in ["nd8.xyz.1.1", "nd8.<f8.one.1", "nd8.|O.1.1", "nd8.<f8.2.1"]:
+        with pytest.raises(PyNetException):
+            PyNetEncoderManager.decode(type_id, memoryview(bytes(8)))
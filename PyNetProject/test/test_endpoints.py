@@ -0,0 +1,64 @@
+import os
+import socket
+import threading
+import pytest
+from lib.esystem.easserting import EAssertException
+from lib.pynet.endpoints import Endpoint
+from lib.pynet.exceptions import PyNetException
+from lib.pynet.receiving import Receiver
+from lib.pynet.sending import Sender
+
+unix_only = pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="Unix domain sockets not supported")
+
+
+@unix_only
+def test_stale_unix_socket_is_removed_and_live_one_kept(tmp_path):
+    path = str(tmp_path / "stale.sock")
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(path)
+    stale.close()
+    Endpoint.remove_stale_unix_socket(path)
+    assert not os.path.exists(path)
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as live:
+        live.bind(path)
+        live.listen()
+        with pytest.raises(PyNetException):
+            Endpoint.remove_stale_unix_socket(path)
+        assert os.path.exists(path)
+
+
+@unix_only
+def test_messages_over_unix_socket(tmp_path, start_receiver):
+    path = str(tmp_path / "receiver.sock")
+    received = []
+    done = threading.Event()
+
+    def on_message(source, client_id, message):
+        received.append(message)
+        done.set()
+
+    receiver = Receiver(unix_path=path, keep_alive=True)
+    receiver.on_message_received.add_listener(on_message)
+    start_receiver(receiver)
+    try:
+        sender = Sender(unix_path=path, keep_alive=True)
+        sender.send_dict({"a": 1, "b": "text"})
+        sender.close()
+        assert done.wait(5)
+    finally:
+        receiver.stop_async()
+    assert received == [{"a": 1, "b": "text"}]
+
+
+def test_tcp_endpoints_need_a_port_and_unix_path_excludes_host():
+    for create in (Receiver, Sender):
+        with pytest.raises(EAssertException):
+            create("127.0.0.1")
+        with pytest.raises(EAssertException):
+            create("127.0.0.1", 7000, unix_path="/tmp/x.sock")
+    receiver = Receiver("127.0.0.1", 7000)
+    assert (receiver.host, receiver.port, receiver.unix_path) == ("127.0.0.1", 7000, None)
+    if hasattr(socket, "AF_UNIX"):
+        receiver = Receiver(unix_path="/tmp/x.sock")
+        assert (receiver.host, receiver.port, receiver.unix_path) == (None, None, "/tmp/x.sock")
@@ -0,0 +1,78 @@
+import sys
+import threading
+import pytest
+from lib.esystem.events import Event
+
+
+def test_listeners_are_validated_when_added():
+    event = Event(source=object, client_id=int)
+    with pytest.raises(ValueError):
+        event.add_listener(lambda source: None)
+    event.add_listener(lambda source, client_id: None)
+    event.add_listener(lambda client_id, source: None)
+    assert len(event.handlers) == 2
+
+
+def test_listeners_changed_during_invoke_apply_from_next_invoke():
+    event = Event(value=int)
+    calls = []
+
+    def second(value):
+        calls.append(("second", value))
+
+    def first(value):
+        calls.append(("first", value))
+        event.add_listener(second)
+        event.remove_listener(first)
+
+    event.add_listener(first)
+    event.invoke(value=1)
+    event.invoke(value=2)
+    assert calls == [("first", 1), ("second", 2)]
+
+
+def test_error_isolation_and_timing_hooks():
+    event = Event(value=int)
+    calls = []
+
+    def failing(value):
+        raise RuntimeError("x")
+
+    event.add_listener(failing).add_listener(lambda value: calls.append(value))
+    with pytest.raises(RuntimeError):
+        event.invoke(value=1)
+    assert calls == []
+
+    errors = []
+    timings = []
+    event.set_error_handler(lambda handler, e: errors.append((handler, e)))
+    event.set_timing_hook(lambda handler, seconds: timings.append(seconds))
+    event.invoke(value=2)
+    assert calls == [2]
+    assert errors[0][0] is failing and isinstance(errors[0][1], RuntimeError)
+    assert len(timings) == 2 and all(q >= 0 for q in timings)
+
+
+def test_concurrent_changes_are_not_lost():
+    event = Event(value=int)
+    listeners = [[(lambda value: None) for _ in range(200)] for _ in range(8)]
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=lambda q: [event.add_listener(h) for h in q], args=(q,))
+                   for q in listeners]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(event.handlers) == 1600
+
+        threads = [threading.Thread(target=lambda q: [event.remove_listener(h) for h in q[::2]], args=(q,))
+                   for q in listeners]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(event.handlers) == 800
+    finally:
+        sys.setswitchinterval(interval)
@@ -0,0 +1,59 @@
+import numpy as np
+from lib.pynet.encoding import PyNetEncoderManager
+from lib.pynet.framing import MessageFraming
+
+_MESSAGES = [
+    {},
+    {"a": None},
+    {"a": 1, "b": 2.0, "c": True},
+    {"a": 1, "n": None, "s": "xy", "b": 2.5, "m": np.ones((2, 2)), "t": False, "l": [1, 2]},
+    {"f": np.float64(3.0), "i": 1},
+]
+
+
+def _encode_field_by_field(dictionary):
+    header_parts = []
+    data_parts = []
+    for key, value in dictionary.items():
+        type_id, data = PyNetEncoderManager.encode(value)
+        header_parts.append(f"{key}:{type_id}")
+        data_parts.append(bytes(data))
+    return ";".join(header_parts), b"".join(data_parts)
+
+
+def test_cached_schemas_match_field_by_field_encoding():
+    for message in _MESSAGES:
+        for _ in range(2):
+            header, data = MessageFraming.encode_message(message)
+            assert (header, bytes(data)) == _encode_field_by_field(message)
+
+
+def test_cached_headers_decode_messages():
+    for message in _MESSAGES:
+        for _ in range(2):
+            header, data = MessageFraming.encode_message(message)
+            decoded = MessageFraming.decode_message(memoryview(header.encode("UTF-8")), memoryview(bytes(data)))
+            assert list(decoded.keys()) == list(message.keys())
+            for key, value in message.items():
+                if isinstance(value, np.ndarray):
+                    np.testing.assert_array_equal(decoded[key], value)
+                else:
+                    assert decoded[key] == value
+
+
+def test_fields_are_decoded_from_slices_of_the_receive_buffer():
+    message = {"s": "xy", "f": np.arange(6, dtype=float).reshape(2, 3), "i": np.arange(4).reshape(2, 2)}
+    header, data = MessageFraming.encode_message(message)
+    header_bytes = header.encode("UTF-8")
+    # one buffer holding header and data, as the Receiver reads it
+    buffer = bytearray(header_bytes + bytes(data))
+    view = memoryview(buffer)
+    decoded = MessageFraming.decode_message(view[:len(header_bytes)], view[len(header_bytes):])
+
+    assert decoded["s"] == "xy"
+    np.testing.assert_array_equal(decoded["f"], message["f"])
+    np.testing.assert_array_equal(decoded["i"], message["i"])
+    # float arrays view the buffer instead of copying it, int arrays are widened to the native dtype
+    assert np.shares_memory(decoded["f"], np.frombuffer(buffer, dtype=np.uint8))
+    assert decoded["f"].flags.writeable
+    assert decoded["i"].dtype == int
@@ -0,0 +1,23 @@
+import logging
+from lib.esystem import logging_factory
+from lib.esystem.logging_factory import create_logger, init_by_config
+
+
+def test_loggers_are_cached_and_follow_rules():
+    try:
+        init_by_config({"rules": [{"pattern": r"\.RD$", "level": "WARNING"}, {"pattern": "^Recv", "level": "DEBUG"}]})
+        reader = create_logger("Recv_x.RD")
+        receiver = create_logger("Recv_x")
+        other = create_logger("Sndr x")
+
+        assert create_logger("Recv_x.RD") is reader
+        assert not reader.isEnabledFor(logging.INFO) and reader.isEnabledFor(logging.WARNING)
+        assert receiver.isEnabledFor(logging.DEBUG)
+        assert not other.isEnabledFor(logging.CRITICAL)
+
+        # existing loggers are switched to a new configuration
+        init_by_config({"rules": [{"pattern": ".+", "level": "INFO"}]})
+        assert reader.isEnabledFor(logging.INFO) and not receiver.isEnabledFor(logging.DEBUG)
+    finally:
+        init_by_config({"rules": [{"pattern": ".+", "level": "INFO"}], "handlers": {}})
+        logging_factory._loggers.clear()
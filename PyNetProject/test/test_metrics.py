@@ -0,0 +1,25 @@
+from lib.pynet.metrics import Metrics
+
+
+def test_snapshot_and_prometheus_text():
+    first = Metrics("first")
+    second = Metrics("second")
+    for metrics in (first, second):
+        metrics.count("messages_received", 2)
+        metrics.gauge("connections_active", 1)
+        metrics.observe("decode_seconds", 0.002)
+    first.observe("decode_seconds", 100.0)
+    first.error("ConnectionResetError")
+
+    snapshot = first.snapshot()
+    assert snapshot["messages_received"] == 2 and snapshot["connections_active"] == 1
+    assert snapshot["decode_seconds"]["count"] == 2
+    assert snapshot["decode_seconds"]["buckets"][0.0025] == 1
+    assert snapshot["decode_seconds"]["buckets"][float("inf")] == 2
+    assert snapshot["errors"] == {"ConnectionResetError": 1}
+
+    text = Metrics.to_prometheus([first, second])
+    assert text.count("# TYPE pynet_messages_received_total counter") == 1
+    assert 'pynet_messages_received_total{instance="second"} 2' in text
+    assert 'pynet_decode_seconds_bucket{instance="first",le="+Inf"} 2' in text
+    assert 'pynet_errors_total{instance="first",kind="ConnectionResetError"} 1' in text
@@ -0,0 +1,62 @@
+import os
+import signal
+import time
+from lib.pynet.exceptions import PyNetException
+from lib.pynet.multiprocess_receiving import MultiProcessReceiver
+from lib.pynet.sending import Sender
+
+
+def record_message(source, client_id, message):
+    # runs in the worker processes
+    with open(message["path"], "a") as file:
+        file.write(f"{os.getpid()} {message['i']}\n")
+
+
+def _read_records(path: str) -> list:
+    if not os.path.exists(path):
+        return []
+    with open(path) as file:
+        ret = [tuple(int(q) for q in line.split()) for line in file]
+    return ret
+
+
+def _send(sender: Sender, message: dict) -> None:
+    # the workers may still be starting
+    deadline = time.monotonic() + 20
+    while True:
+        try:
+            sender.send_dict(message)
+            return
+        except PyNetException:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def test_workers_handle_messages_and_are_restarted(tmp_path, free_port, wait_until):
+    path = str(tmp_path / "records.txt")
+    port = free_port
+    receiver = MultiProcessReceiver("127.0.0.1", port, record_message, workers=2, restart_delay=0.1)
+    receiver.start()
+    try:
+        assert wait_until(lambda: receiver.stats()["workers"]["alive"] == 2, timeout=20)
+        sender = Sender("127.0.0.1", port)
+        for i in range(20):
+            _send(sender, {"path": path, "i": i})
+        assert wait_until(lambda: len(_read_records(path)) == 20, timeout=20)
+        assert sorted(q[1] for q in _read_records(path)) == list(range(20))
+        assert wait_until(lambda: receiver.stats().get("messages_received") == 20, timeout=20)
+        stats = receiver.stats()
+        assert len(stats["workers"]["per_worker"]) == 2
+        assert sum(q.get("messages_received", 0) for q in stats["workers"]["per_worker"].values()) == 20
+
+        os.kill(_read_records(path)[0][0], signal.SIGKILL)
+        assert wait_until(lambda: receiver.stats()["workers"]["restarts"] == 1
+                          and receiver.stats()["workers"]["alive"] == 2, timeout=20)
+        for i in range(20, 40):
+            _send(sender, {"path": path, "i": i})
+        assert wait_until(lambda: len(_read_records(path)) == 40, timeout=20)
+        assert sorted(q[1] for q in _read_records(path)) == list(range(40))
+    finally:
+        receiver.stop()
+    assert receiver.stats()["workers"]["alive"] == 0
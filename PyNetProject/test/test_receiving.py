@@ -0,0 +1,268 @@
+import logging
+import mmap
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+from lib.esystem.easserting import EAssertException
+from lib.esystem.logging_factory import create_logger
+from lib.pynet.bitutilities import BitUtilities
+from lib.pynet.framing import MessageFraming
+from lib.pynet.receiving import OverflowPolicy, Receiver
+from lib.pynet.sending import Sender
+from lib.pynet.streaming import FilePayload
+
+
+def test_pending_connections_need_the_number_of_workers():
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        with pytest.raises(EAssertException):
+            Receiver("127.0.0.1", 1, executor=executor, max_pending_connections=1)
+        with pytest.raises(EAssertException):
+            Receiver("127.0.0.1", 1, max_pending_connections=0)
+        Receiver("127.0.0.1", 1, executor=executor, max_workers=2, max_pending_connections=0)
+
+
+def test_connections_beyond_capacity_wait_in_the_backlog(free_port, wait_until, start_receiver):
+    port = free_port
+    messages = []
+    receiver = Receiver("127.0.0.1", port, keep_alive=True, max_workers=1, max_pending_connections=0)
+    receiver.on_message_received.add_listener(lambda source, client_id, message: messages.append(message))
+    start_receiver(receiver)
+    first = Sender("127.0.0.1", port, keep_alive=True)
+    second = Sender("127.0.0.1", port, keep_alive=True)
+    try:
+        first.send_dict({"x": 1})
+        assert wait_until(lambda: len(messages) == 1)
+        second.send_dict({"x": 2})
+        time.sleep(0.2)
+        assert receiver.stats()["connections_accepted"] == 1 and len(messages) == 1
+
+        # the first connection frees the only worker, so the second one is accepted
+        first.close()
+        assert wait_until(lambda: len(messages) == 2)
+        assert receiver.stats()["connections_accepted"] == 2
+    finally:
+        first.close()
+        second.close()
+        receiver.stop_async()
+
+
+def test_failed_connection_reader_is_logged(free_port, wait_until, start_receiver):
+    port = free_port
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    logger = create_logger(f"Recv_127.0.0.1:{port}.CE")
+    logger.addHandler(handler)
+    receiver = start_receiver(Receiver("127.0.0.1", port, max_workers=1))
+    try:
+        header_bytes = BitUtilities.Str.value_to_bytes("x:unknown;")
+        with socket.create_connection(("127.0.0.1", port)) as connection:
+            connection.sendall(MessageFraming.encode_intro(header_bytes, 0) + header_bytes)
+        assert wait_until(lambda: len(records) > 0)
+        assert "Connection reader failed" in records[0].getMessage()
+    finally:
+        logger.removeHandler(handler)
+        receiver.stop_async()
+
+
+def test_arrays_of_large_chunked_messages_are_delivered_progressively(free_port, start_receiver):
+    port = free_port
+    events = []
+    done = threading.Event()
+    receiver = Receiver("127.0.0.1", port, keep_alive=True, progressive_threshold=10000)
+    receiver.on_message_chunk.add_listener(
+        lambda source, client_id, chunk: events.append((chunk.key, chunk.first_row, chunk.rows.copy(), chunk.is_last)))
+
+    def on_message(source, client_id, message):
+        events.append(message)
+        done.set()
+
+    receiver.on_message_received.add_listener(on_message)
+    start_receiver(receiver)
+    matrix = np.arange(10000.0).reshape(1000, 10)
+    cube = np.arange(6000).reshape(100, 6, 10)
+    sender = Sender("127.0.0.1", port, keep_alive=True)
+    try:
+        sender.send_chunked({"name": "a", "matrix": matrix, "cube": cube}, chunk_size=3000)
+        assert done.wait(5)
+    finally:
+        sender.close()
+        receiver.stop_async()
+
+    # the message without the streamed fields follows their chunks, which hold whole rows
+    assert events[-1] == {"name": "a"}
+    chunks = events[:-1]
+    assert len(chunks) > 2
+    for key, value in [("matrix", matrix), ("cube", cube)]:
+        pieces = [q for q in chunks if q[0] == key]
+        assert [q[1] for q in pieces] == list(np.cumsum([0] + [len(q[2]) for q in pieces[:-1]]))
+        assert pieces[-1][3] and not any(q[3] for q in pieces[:-1])
+        np.testing.assert_array_equal(np.concatenate([q[2] for q in pieces]), value)
+
+
+def _is_file_mapped(value) -> bool:
+    while value is not None:
+        if isinstance(value, (np.memmap, mmap.mmap)):
+            return True
+        value = value.obj if isinstance(value, memoryview) else getattr(value, "base", None)
+    return False
+
+
+def test_messages_above_spill_threshold_are_mapped_from_disk(tmp_path, free_port, wait_until, start_receiver):
+    port = free_port
+    messages = []
+    receiver = Receiver("127.0.0.1", port, keep_alive=True, spill_threshold=100000, spill_directory=str(tmp_path))
+    receiver.on_message_received.add_listener(lambda source, client_id, message: messages.append(message))
+    start_receiver(receiver)
+    large = np.arange(20000.0).reshape(200, 100)
+    small = np.arange(100.0).reshape(10, 10)
+    sender = Sender("127.0.0.1", port, keep_alive=True)
+    try:
+        sender.send_dict({"values": large, "name": "large"})
+        sender.send_dict({"values": small, "name": "small"})
+        sender.send_chunked({"values": large, "name": "chunked"}, chunk_size=30000)
+        assert wait_until(lambda: len(messages) == 3)
+    finally:
+        sender.close()
+        receiver.stop_async()
+
+    assert [q["name"] for q in messages] == ["large", "small", "chunked"]
+    assert [_is_file_mapped(q["values"]) for q in messages] == [True, False, True]
+    for message, value in zip(messages, [large, small, large]):
+        np.testing.assert_array_equal(message["values"], value)
+    # copy-on-write mappings are writable, the spill files are removed at once
+    messages[0]["values"][0, 0] = -1
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_file_fields_are_received_into_files(tmp_path, free_port, wait_until, start_receiver):
+    source = tmp_path / "source.bin"
+    values = np.arange(30000.0)
+    values.tofile(source)
+    directory = tmp_path / "received"
+    directory.mkdir()
+    messages = []
+    receiver = Receiver("127.0.0.1", free_port, keep_alive=True, file_directory=str(directory))
+    receiver.on_message_received.add_listener(lambda source, client_id, message: messages.append(message))
+    start_receiver(receiver)
+    sender = Sender("127.0.0.1", free_port, keep_alive=True)
+    try:
+        sender.send_dict({"name": "plain", "file": FilePayload(str(source), dtype=np.float64), "count": 3})
+        sender.send_chunked({"name": "chunked", "file": FilePayload(str(source), dtype=np.float64),
+                             "values": np.arange(10.0)}, chunk_size=10000)
+        sender.send_dict({"name": "no file", "values": np.arange(10.0)})
+        assert wait_until(lambda: len(messages) == 3)
+    finally:
+        sender.close()
+        receiver.stop_async()
+
+    assert [q["name"] for q in messages] == ["plain", "chunked", "no file"]
+    assert messages[0]["count"] == 3
+    for message in messages[:2]:
+        assert isinstance(message["file"], np.memmap)
+        assert os.path.dirname(message["file"].filename) == str(directory)
+        np.testing.assert_array_equal(message["file"], values)
+    np.testing.assert_array_equal(messages[1]["values"], np.arange(10.0))
+    np.testing.assert_array_equal(messages[2]["values"], np.arange(10.0))
+    assert len(list(directory.iterdir())) == 2
+
+
+def _gated_receiver(port: int, overflow_policy: str, events: list, gate: threading.Event,
+                 handling: threading.Event) -> Receiver:
+    # one handler thread, blocked in the first message until the gate opens, and two queue slots
+    receiver = Receiver("127.0.0.1", port, keep_alive=True, dispatch_queue_size=2, overflow_policy=overflow_policy)
+
+    def on_message(source, client_id, message):
+        handling.set()
+        assert gate.wait(5)
+        events.append(message["i"])
+
+    receiver.on_message_received.add_listener(on_message)
+    receiver.on_client_disconnected.add_listener(lambda source, client_id: events.append("disconnected"))
+    return receiver
+
+
+@pytest.mark.parametrize("overflow_policy, handled, dropped", [
+    (OverflowPolicy.BLOCK, [0, 1, 2, 3, 4, 5], 0),
+    (OverflowPolicy.DROP_NEWEST, [0, 1, 2], 3),
+    (OverflowPolicy.DROP_OLDEST, [0, 4, 5], 3),
+])
+def test_overflow_policies_of_dispatch_queue(overflow_policy, handled, dropped, free_port, wait_until,
+                                             start_receiver):
+    port = free_port
+    events = []
+    gate = threading.Event()
+    handling = threading.Event()
+    receiver = start_receiver(_gated_receiver(port, overflow_policy, events, gate, handling))
+    sender = Sender("127.0.0.1", port, keep_alive=True)
+    try:
+        sender.send_dict({"i": 0})
+        assert handling.wait(5)
+        sender.send_many({"i": q} for q in range(1, 6))
+        assert wait_until(lambda: receiver.dispatch_stats["dropped"] == dropped
+                          and receiver.dispatch_stats["depth"] == 2)
+        sender.close()
+        time.sleep(0.1)
+        gate.set()
+        # the client disconnection is announced after its queued messages are handled
+        assert wait_until(lambda: "disconnected" in events)
+        assert events == handled + ["disconnected"]
+        assert receiver.stats().get("messages_dropped", 0) == dropped
+    finally:
+        gate.set()
+        sender.close()
+        receiver.stop_async()
+
+
+def test_blocked_messages_are_dropped_when_receiver_stops(free_port, wait_until, start_receiver):
+    port = free_port
+    events = []
+    gate = threading.Event()
+    handling = threading.Event()
+    receiver = start_receiver(_gated_receiver(port, OverflowPolicy.BLOCK, events, gate, handling))
+    sender = Sender("127.0.0.1", port, keep_alive=True)
+    try:
+        sender.send_dict({"i": 0})
+        assert handling.wait(5)
+        sender.send_many({"i": q} for q in range(1, 6))
+        assert wait_until(lambda: receiver.dispatch_stats["depth"] == 2)
+        receiver.stop_async()
+        assert wait_until(lambda: receiver.dispatch_stats["dropped"] == 3)
+        sender.close()
+        gate.set()
+        assert wait_until(lambda: "disconnected" in events)
+        assert events == [0, 1, 2, "disconnected"]
+    finally:
+        gate.set()
+        sender.close()
+
+
+def test_connection_is_closed_when_a_handler_fails(free_port, wait_until, start_receiver):
+    port = free_port
+    events = []
+
+    def handle(source, client_id, message):
+        events.append(message["i"])
+        if message["i"] == 0:
+            raise ValueError("handler failed")
+
+    receiver = Receiver("127.0.0.1", port, keep_alive=True, max_workers=1)
+    receiver.on_message_received.add_listener(handle)
+    receiver.on_client_disconnected.add_listener(lambda source, client_id: events.append("disconnected"))
+    start_receiver(receiver)
+    sender = Sender("127.0.0.1", port, keep_alive=True)
+    try:
+        sender.send_dict({"i": 0})
+        assert wait_until(lambda: "disconnected" in events)
+        # the sender notices the closed connection and opens a new one
+        sender.send_dict({"i": 1})
+        assert wait_until(lambda: 1 in events)
+        assert events == [0, "disconnected", 1]
+        assert receiver.stats()["connections_accepted"] == 2
+    finally:
+        sender.close()
+        receiver.stop_async()
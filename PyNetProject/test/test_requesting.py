@@ -0,0 +1,71 @@
+import threading
+import time
+import pytest
+from lib.esystem.easserting import EAssertException
+from lib.pynet.exceptions import PyNetException
+from lib.pynet.receiving import OverflowPolicy, Receiver
+from lib.pynet.requesting import Requester
+
+
+def _handle(source, client_id, message):
+    if "fail" in message:
+        raise ValueError("failed on purpose")
+    time.sleep(message.get("sleep", 0))
+    return {"y": message["x"] * 2}
+
+
+@pytest.mark.parametrize("dispatch_queue_size", [None, 16])
+def test_pipelined_calls_get_their_own_replies(dispatch_queue_size, free_port, start_receiver):
+    port = free_port
+    receiver = Receiver("127.0.0.1", port, keep_alive=True, dispatch_queue_size=dispatch_queue_size,
+                        dispatch_workers=4)
+    receiver.set_request_handler(_handle)
+    start_receiver(receiver)
+    requester = Requester("127.0.0.1", port, timeout=5)
+    try:
+        futures = [requester.call({"x": q}) for q in range(200)]
+        assert [q.result()["y"] for q in futures] == [2 * q for q in range(200)]
+
+        with pytest.raises(PyNetException, match="failed on purpose"):
+            requester.call({"fail": True}).result()
+        with pytest.raises(TimeoutError):
+            requester.call({"x": 1, "sleep": 0.5}, timeout=0.1).result()
+        # the connection stays usable after a failed and a timed out call
+        assert requester.call({"x": 3}).result() == {"y": 6}
+    finally:
+        requester.close()
+        receiver.stop_async()
+
+
+def test_request_handler_needs_keep_alive():
+    with pytest.raises(EAssertException):
+        Receiver("127.0.0.1", 1).set_request_handler(_handle)
+
+
+@pytest.mark.parametrize("overflow_policy, dropped", [(OverflowPolicy.DROP_NEWEST, 2), (OverflowPolicy.DROP_OLDEST, 1)])
+def test_dropped_requests_fail_at_once(overflow_policy, dropped, free_port, start_receiver):
+    port = free_port
+    handling = threading.Event()
+    gate = threading.Event()
+
+    def handle(source, client_id, message):
+        handling.set()
+        assert gate.wait(5)
+        return {"y": message["x"]}
+
+    receiver = Receiver("127.0.0.1", port, keep_alive=True, dispatch_queue_size=1, overflow_policy=overflow_policy)
+    receiver.set_request_handler(handle)
+    start_receiver(receiver)
+    requester = Requester("127.0.0.1", port, timeout=5)
+    try:
+        futures = [requester.call({"x": 0})]
+        assert handling.wait(5)
+        futures += [requester.call({"x": q}) for q in (1, 2)]
+        with pytest.raises(PyNetException, match="dropped"):
+            futures[dropped].result(timeout=2)
+        gate.set()
+        assert [q.result()["y"] for i, q in enumerate(futures) if i != dropped] == [i for i in range(3) if i != dropped]
+    finally:
+        gate.set()
+        requester.close()
+        receiver.stop_async()
@@ -0,0 +1,184 @@
+import socket
+import struct
+import threading
+import numpy as np
+import pytest
+from lib.pynet.encoding import Compression
+from lib.pynet.exceptions import PyNetException
+from lib.pynet.framing import MessageFraming
+from lib.pynet.receiving import Receiver
+from lib.pynet.sending import ConnectionPool, Sender
+from lib.pynet.streaming import FilePayload
+
+
+def _collecting_receiver(port: int, messages: list, received: threading.Event, count: int) -> Receiver:
+    receiver = Receiver("127.0.0.1", port, keep_alive=True)
+
+    def on_message(source, client_id, message):
+        messages.append(message)
+        if len(messages) >= count:
+            received.set()
+
+    receiver.on_message_received.add_listener(on_message)
+    return receiver
+
+
+def test_keep_alive_sender_reconnects_after_receiver_restart(free_port, start_receiver):
+    port = free_port
+    server = socket.create_server(("127.0.0.1", port))
+    sender = Sender("127.0.0.1", port, keep_alive=True)
+    try:
+        sender.send_dict({"x": 1})
+        conn, _ = server.accept()
+        assert len(conn.recv(1024)) > 0
+        # the receiver process goes away and resets the connection
+        conn.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+        conn.close()
+        server.close()
+
+        messages = []
+        received = threading.Event()
+        receiver = start_receiver(_collecting_receiver(port, messages, received, 2))
+        try:
+            sender.send_dict({"x": 2})
+            sender.send_dict({"x": 3})
+            assert received.wait(5)
+            assert [q["x"] for q in messages] == [2, 3]
+            assert sender.stats()["connections_opened"] == 2
+        finally:
+            receiver.stop_async()
+    finally:
+        sender.close()
+        server.close()
+
+
+def test_pool_reuses_connections_across_senders_and_threads(free_port, start_receiver):
+    port = free_port
+    messages = []
+    received = threading.Event()
+    receiver = start_receiver(_collecting_receiver(port, messages, received, 400))
+    pool = ConnectionPool(max_connections=2)
+    try:
+        def send(worker: int):
+            sender = Sender("127.0.0.1", port, pool=pool)
+            for i in range(50):
+                sender.send_dict({"worker": worker, "i": i})
+
+        threads = [threading.Thread(target=send, args=(q,)) for q in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert received.wait(5)
+        assert sorted((q["worker"], q["i"]) for q in messages) == [(w, i) for w in range(8) for i in range(50)]
+        assert receiver.stats()["connections_accepted"] <= 2
+    finally:
+        pool.close()
+        receiver.stop_async()
+
+
+def test_pool_replaces_connections_closed_by_the_receiver(free_port, start_receiver):
+    port = free_port
+    server = socket.create_server(("127.0.0.1", port))
+    pool = ConnectionPool(max_connections=1)
+    sender = Sender("127.0.0.1", port, pool=pool)
+    try:
+        sender.send_dict({"x": 1})
+        conn, _ = server.accept()
+        assert len(conn.recv(1024)) > 0
+        conn.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+        conn.close()
+        server.close()
+
+        messages = []
+        received = threading.Event()
+        receiver = start_receiver(_collecting_receiver(port, messages, received, 2))
+        try:
+            # the stale pooled connection is dropped at checkout, the limit of one connection still holds
+            sender.send_dict({"x": 2})
+            sender.send_dict({"x": 3})
+            assert received.wait(5)
+            assert [q["x"] for q in messages] == [2, 3]
+            assert receiver.stats()["connections_accepted"] == 1
+        finally:
+            receiver.stop_async()
+    finally:
+        pool.close()
+        server.close()
+
+
+def test_send_many_over_keep_alive_connection(free_port, start_receiver):
+    port = free_port
+    messages = []
+    received = threading.Event()
+    receiver = start_receiver(_collecting_receiver(port, messages, received, 103))
+    sender = Sender("127.0.0.1", port, keep_alive=True)
+    try:
+        assert sender.send_many({"i": q} for q in range(100)) == 100
+        # the frames before a message failing to serialize are delivered, the connection is replaced
+        with pytest.raises(PyNetException):
+            sender.send_many([{"i": 100}, {"i": 101}, {"i": object()}, {"i": 102}])
+        sender.send_dict({"i": 102})
+        assert received.wait(5)
+        assert sorted(q["i"] for q in messages) == list(range(103))
+        assert sender.stats()["connections_opened"] == 2
+        assert receiver.stats()["connections_accepted"] == 2
+    finally:
+        sender.close()
+        receiver.stop_async()
+
+
+@pytest.mark.parametrize("compression", [None, Compression(threshold=1024)])
+def test_chunked_message_round_trip(tmp_path, compression, free_port, start_receiver):
+    path = str(tmp_path / "data.bin")
+    np.arange(1000, dtype=np.float32).tofile(path)
+    values = {
+        "md": np.arange(300.0).reshape(20, 15), "mmd": np.arange(120.0).reshape(2, 3, 20),
+        "mi": np.arange(300).reshape(30, 10), "mmi": np.arange(60).reshape(3, 4, 5),
+        "nd": np.arange(500, dtype=np.uint16), "column": np.arange(300.0).reshape(20, 15)[:, 3:5],
+        "text": "text", "bytes": b"\x01" * 3000, "count": 7,
+    }
+    port = free_port
+    messages = []
+    received = threading.Event()
+    receiver = start_receiver(_collecting_receiver(port, messages, received, 1))
+    sender = Sender("127.0.0.1", port, keep_alive=True, compression=compression)
+    try:
+        sender.send_chunked(dict(values, file=FilePayload(path, dtype=np.float32)), chunk_size=1000)
+        assert received.wait(5)
+    finally:
+        sender.close()
+        receiver.stop_async()
+
+    message = messages[0]
+    np.testing.assert_array_equal(message.pop("file"), np.arange(1000, dtype=np.float32))
+    assert message.keys() == values.keys()
+    for key, value in values.items():
+        if isinstance(value, np.ndarray):
+            assert message[key].dtype == value.dtype
+            np.testing.assert_array_equal(message[key], value)
+        else:
+            assert message[key] == value
+
+
+@pytest.mark.parametrize("key", MessageFraming.RESERVED_KEYS)
+def test_reserved_keys_are_rejected(key, free_port, start_receiver):
+    port = free_port
+    messages = []
+    received = threading.Event()
+    receiver = start_receiver(_collecting_receiver(port, messages, received, 2))
+    sender = Sender("127.0.0.1", port, keep_alive=True)
+    try:
+        with pytest.raises(PyNetException, match="serialize"):
+            sender.send_dict({key: 1, "x": 1})
+        with pytest.raises(PyNetException, match="serialize"):
+            sender.send_many([{"x": 2}, {key: 1, "x": 3}])
+        with pytest.raises(PyNetException, match="serialize"):
+            sender.send_chunked({key: 1, "x": 4})
+        sender.send_dict({"x": 5})
+        assert received.wait(5)
+        # the batch is cut at the rejected message
+        assert messages == [{"x": 2}, {"x": 5}]
+    finally:
+        sender.close()
+        receiver.stop_async()
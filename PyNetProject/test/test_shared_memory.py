@@ -0,0 +1,102 @@
+import os
+import socket
+import zlib
+import numpy as np
+import pytest
+from lib.pynet.bitutilities import BitUtilities
+from lib.pynet.endpoints import Endpoint
+from lib.pynet.exceptions import PyNetException
+from lib.pynet.framing import MessageFraming
+from lib.pynet.receiving import Receiver
+from lib.pynet.sending import Sender
+from lib.pynet.shared_memory import SharedMemoryPayload, SharedMemorySegments
+
+shared_memory_only = pytest.mark.skipif(not SharedMemorySegments.is_supported(),
+                                        reason="Shared memory not supported")
+
+
+def _own_segments() -> list:
+    prefix = f"{SharedMemorySegments.NAME_PREFIX}{os.getpid()}_"
+    ret = [q for q in os.listdir(SharedMemorySegments.DIRECTORY) if q.startswith(prefix)]
+    return ret
+
+
+def _collecting(receiver: Receiver, messages: list) -> Receiver:
+    receiver.on_message_received.add_listener(lambda source, client_id, message: messages.append(message))
+    return receiver
+
+
+@shared_memory_only
+def test_fields_are_passed_in_shared_memory_to_local_receiver(free_port, wait_until, start_receiver):
+    port = free_port
+    messages = []
+    receiver = start_receiver(_collecting(Receiver("127.0.0.1", port, keep_alive=True, shared_memory=True), messages))
+    sender = Sender("127.0.0.1", port, keep_alive=True, shared_memory_threshold=1024)
+    matrix = np.arange(1000.0).reshape(100, 10)
+    data = bytes(range(256)) * 16
+    try:
+        sender.send_dict({"matrix": matrix, "data": data, "small": np.arange(3.0), "name": "a"})
+        assert wait_until(lambda: len(messages) == 1)
+    finally:
+        sender.close()
+        receiver.stop_async()
+
+    message = messages[0]
+    np.testing.assert_array_equal(message["matrix"], matrix)
+    assert bytes(message["data"]) == data
+    np.testing.assert_array_equal(message["small"], np.arange(3.0))
+    assert message["name"] == "a"
+    assert sender.stats()["shared_memory_bytes"] == matrix.nbytes + len(data)
+    # the receiver unlinks the segments as soon as it maps them
+    assert _own_segments() == []
+
+
+@shared_memory_only
+def test_receiver_without_opt_in_rejects_shared_memory_fields(free_port, wait_until, start_receiver):
+    port = free_port
+    messages = []
+    receiver = start_receiver(_collecting(Receiver("127.0.0.1", port, keep_alive=True, max_workers=1), messages))
+    sender = Sender("127.0.0.1", port, keep_alive=True, shared_memory_threshold=0)
+    try:
+        sender.send_dict({"matrix": np.arange(10.0)})
+        assert wait_until(lambda: len(receiver.stats()["errors"]) > 0)
+        assert messages == []
+    finally:
+        sender.close()
+        receiver.stop_async()
+        for name in _own_segments():
+            SharedMemorySegments.unlink(name)
+
+
+@shared_memory_only
+def test_compressed_shared_memory_fields_are_rejected(free_port, wait_until, start_receiver):
+    # a segment name wrapped in a compressed field must not get past the gate of the outer type-id
+    payload = SharedMemoryPayload(np.arange(4.0))
+    data = zlib.compress(BitUtilities.Str.value_to_bytes(payload.name))
+    header = BitUtilities.Str.value_to_bytes(f"m:zz{len(data)}{payload.to_type_id()}")
+    port = free_port
+    messages = []
+    receiver = start_receiver(_collecting(Receiver("127.0.0.1", port, keep_alive=True, max_workers=1), messages))
+    try:
+        with pytest.raises(PyNetException):
+            MessageFraming.decode_message(memoryview(header), memoryview(data), False)
+        with socket.create_connection(("127.0.0.1", port)) as connection:
+            connection.sendall(MessageFraming.encode_intro(header, len(data)) + header + data)
+            assert wait_until(lambda: len(receiver.stats()["errors"]) > 0)
+        assert messages == []
+        assert payload.name in _own_segments()
+    finally:
+        receiver.stop_async()
+        payload.unlink()
+
+
+def test_local_peers_are_unix_sockets_and_loopback_connections():
+    if hasattr(socket, "AF_UNIX"):
+        first, second = socket.socketpair(socket.AF_UNIX)
+        with first, second:
+            assert Endpoint.is_local_peer(first)
+    with socket.create_server(("127.0.0.1", 0)) as server:
+        with socket.create_connection(server.getsockname()) as client:
+            connection, _ = server.accept()
+            with connection:
+                assert Endpoint.is_local_peer(connection) and Endpoint.is_local_peer(client)
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+from lib.pynet.streaming import FilePayload, LazyPayload
+
+
+class _RecordingSocket:
+    def __init__(self):
+        self.calls = []
+
+    def send_file(self, file, offset: int, count: int) -> None:
+        file.seek(offset)
+        self.calls.append((file, file.read(count)))
+
+
+def test_lazy_payload_is_abstract():
+    with pytest.raises(TypeError):
+        LazyPayload()
+
+
+def test_file_payload_opens_its_file_once_per_send(tmp_path):
+    path = str(tmp_path / "data.bin")
+    data = np.arange(100, dtype=np.uint8).tobytes()
+    with open(path, "wb") as file:
+        file.write(data)
+    payload = FilePayload(path, offset=10)
+
+    sending_socket = _RecordingSocket()
+    intros = []
+    payload.send_to(sending_socket, 32, intros.append)
+    assert intros == [32, 32, 26]
+    assert b"".join(q[1] for q in sending_socket.calls) == data[10:]
+    assert len({id(q[0]) for q in sending_socket.calls}) == 1 and sending_socket.calls[0][0].closed
+
+    sending_socket = _RecordingSocket()
+    payload.send_to(sending_socket)
+    assert [q[1] for q in sending_socket.calls] == [data[10:]]
+    assert payload.to_bytes() == data[10:]